@@ -1,4 +1,5 @@
 import abc
+import io
 import typing
 
 from _token import Token
@@ -21,8 +22,34 @@ class BaseNode(AbstractNode):
     def token_literal(self) -> str:
         return self.token.literal
 
+    # the text of a node is its parts in order, strings are written as is and nodes are expanded by `write`
+    def parts(self) -> typing.Iterable['str | BaseNode']:
+        return (self.token.literal,)
+
     def to_string(self) -> str:
-        return self.token.literal
+        buffer = io.StringIO()
+        write(self, buffer)
+        return buffer.getvalue()
+
+
+def write(node: BaseNode, stream: typing.TextIO, chunk_size: int = 1 << 12):
+    # a single pass over the tree with an explicit stack of part iterators, deep nesting does not recurse. missing
+    # children (None in the partial trees of a recovering parser) are written as nothing
+    pieces = []
+    stack = [iter((node,))]
+    while stack:
+        for part in stack[-1]:
+            if isinstance(part, str):
+                pieces.append(part)
+                if len(pieces) >= chunk_size:
+                    stream.write(''.join(pieces))
+                    pieces.clear()
+            elif part is not None:
+                stack.append(iter(part.parts()))
+                break
+        else:
+            stack.pop()
+    stream.write(''.join(pieces))
 
 
 class Statement(BaseNode):
@@ -46,11 +73,8 @@ class Program(BaseNode):
         else:
             return ''
 
-    def to_string(self) -> str:
-        result = ''
-        for s in self.statements:
-            result += s.to_string()
-        return result
+    def parts(self) -> typing.Iterable[str | BaseNode]:
+        return self.statements
 
 
 class Identifier(Expression):
@@ -58,11 +82,16 @@ class Identifier(Expression):
         self.token = token
         self.value = value
 
+    @property
+    def symbol(self) -> int:
+        # the id of value in the symbol table of the lexer, NO_SYMBOL for identifiers built from other tokens
+        return self.token.symbol
+
     def token_literal(self) -> str:
         return self.token.literal
 
-    def to_string(self) -> str:
-        return self.value
+    def parts(self) -> typing.Iterable[str | BaseNode]:
+        return (self.value,)
 
 
 class LetStatement(Statement):
@@ -75,12 +104,10 @@ class LetStatement(Statement):
     def token_literal(self) -> str:
         return self.token.literal
 
-    def to_string(self) -> str:
-        result = self.token_literal() + ' ' + self.name.to_string() + ' = '
+    def parts(self) -> typing.Iterable[str | BaseNode]:
         if self.value:
-            result += self.value.to_string()
-        result += ';'
-        return result
+            return (self.token_literal() + ' ', self.name, ' = ', self.value, ';')
+        return (self.token_literal() + ' ', self.name, ' = ;')
 
 
 class ReturnStatement(Statement):
@@ -91,14 +118,10 @@ class ReturnStatement(Statement):
     def token_literal(self) -> str:
         return self.token.literal
 
-    def to_string(self) -> str:
-        result = self.token_literal() + ' '
-
-        if not self.return_value:
-            result += self.return_value.to_string()
-
-        result += ';'
-        return result
+    def parts(self) -> typing.Iterable[str | BaseNode]:
+        if self.return_value:
+            return (self.token_literal() + ' ', self.return_value, ';')
+        return (self.token_literal() + ' ;',)
 
 
 class ExpressionStatement(Statement):
@@ -109,10 +132,10 @@ class ExpressionStatement(Statement):
     def token_literal(self) -> str:
         return self.token.literal
 
-    def to_string(self) -> str:
+    def parts(self) -> typing.Iterable[str | BaseNode]:
         if self.expression:
-            return self.expression.to_string()
-        return ''
+            return (self.expression,)
+        return ()
 
 
 class IntegerLiteral(Expression):
@@ -127,8 +150,8 @@ class PrefixExpression(Expression):
         self.operator = operator
         self.right = right
 
-    def to_string(self) -> str:
-        return '(' + self.operator + self.right.to_string() + ')'
+    def parts(self) -> typing.Iterable[str | BaseNode]:
+        return ('(' + self.operator, self.right, ')')
 
 
 class InfixExpression(Expression):
@@ -138,8 +161,8 @@ class InfixExpression(Expression):
         self.operator = operator
         self.right = right
 
-    def to_string(self) -> str:
-        return '(' + self.left.to_string() + ' ' + self.operator + ' ' + self.right.to_string() + ')'
+    def parts(self) -> typing.Iterable[str | BaseNode]:
+        return ('(', self.left, ' ' + self.operator + ' ', self.right, ')')
 
 
 class Boolean(Expression):
@@ -153,8 +176,8 @@ class BlockStatement(Statement):
         super(BlockStatement, self).__init__(token)
         self.statements = statements
 
-    def to_string(self):
-        return ''.join([statement.to_string() for statement in self.statements])
+    def parts(self) -> typing.Iterable[str | BaseNode]:
+        return self.statements
 
 
 class IfExpression(Expression):
@@ -164,8 +187,37 @@ class IfExpression(Expression):
         self.consquence = consequence
         self.alternative = alternative
 
-    def to_string(self) -> str:
-        alternative_str = ''
+    def parts(self) -> typing.Iterable[str | BaseNode]:
         if self.alternative:
-            alternative_str = 'else ' + self.alternative.to_string()
-        return 'if' + self.condition.to_string() + ' ' + self.consquence.to_string() + alternative_str
+            return ('if', self.condition, ' ', self.consquence, 'else ', self.alternative)
+        return ('if', self.condition, ' ', self.consquence)
+
+
+class FunctionLiteral(Expression):
+    def __init__(self, token: Token, parameters: list[Identifier], body: BlockStatement):
+        self.token = token
+        self.parameters = parameters
+        self.body = body
+
+    def parts(self) -> typing.Iterable[str | BaseNode]:
+        yield self.token_literal() + '('
+        for index, parameter in enumerate(self.parameters):
+            yield ', ' if index else ''
+            yield parameter
+        yield ') '
+        yield self.body
+
+
+class CallExpression(Expression):
+    def __init__(self, token: Token, function: Expression, arguments: list[Expression]):
+        self.token = token
+        self.function = function
+        self.arguments = arguments
+
+    def parts(self) -> typing.Iterable[str | BaseNode]:
+        yield self.function
+        yield '('
+        for index, argument in enumerate(self.arguments):
+            yield ', ' if index else ''
+            yield argument
+        yield ')'
@@ -0,0 +1,233 @@
+import array
+import enum
+
+import _abstract_syntax_tree as _ast
+import _lexer
+import _token
+
+
+class NodeKind(enum.IntEnum):
+    PROGRAM = 0
+    LET_STATEMENT = 1
+    RETURN_STATEMENT = 2
+    EXPRESSION_STATEMENT = 3
+    BLOCK_STATEMENT = 4
+    IDENTIFIER = 5
+    INTEGER_LITERAL = 6
+    BOOLEAN = 7
+    PREFIX_EXPRESSION = 8
+    INFIX_EXPRESSION = 9
+    IF_EXPRESSION = 10
+    FUNCTION_LITERAL = 11
+    CALL_EXPRESSION = 12
+
+
+NONE = -1
+
+
+class Arena:
+    # every node is one row across the parallel arrays, children are row indices (NONE when missing).
+    # programs and blocks keep their statements as a run in `lists`, first is the start and second the length,
+    # function parameters and call arguments use the same layout with the body/function in third
+    def __init__(self, buffer: _lexer.TokenBuffer):
+        self.buffer = buffer
+        self.kinds = array.array('B')
+        self.tokens = array.array('i')
+        self.first = array.array('i')
+        self.second = array.array('i')
+        self.third = array.array('i')
+        self.lists = array.array('i')
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def add(self, kind: NodeKind, token: int, first: int = NONE, second: int = NONE, third: int = NONE) -> int:
+        self.kinds.append(kind)
+        self.tokens.append(token)
+        self.first.append(first)
+        self.second.append(second)
+        self.third.append(third)
+        return len(self.kinds) - 1
+
+    def add_list(self, kind: NodeKind, token: int, items: list[int], third: int = NONE) -> int:
+        start = len(self.lists)
+        self.lists.extend(items)
+        return self.add(kind, token, start, len(items), third)
+
+    def node(self, index: int) -> '_ast.BaseNode | None':
+        if index == NONE:
+            return None
+        return views[self.kinds[index]](self, index)
+
+    def children(self, index: int) -> list['_ast.BaseNode']:
+        start = self.first[index]
+        return [self.node(child) for child in self.lists[start : start + self.second[index]]]
+
+
+class ArenaBuilder:
+    # mirrors the node constructors of _abstract_syntax_tree so the parser can use it in place of that module,
+    # nodes come back as arena row indices and tokens have to be BufferedTokens
+    def __init__(self, arena: Arena):
+        self.arena = arena
+
+    def Program(self, statements: list[int] = []) -> 'ProgramView':
+        return self.arena.node(self.arena.add_list(NodeKind.PROGRAM, NONE, statements))
+
+    def LetStatement(self, token: _lexer.BufferedToken, name: int, value: int | None) -> int:
+        return self.arena.add(NodeKind.LET_STATEMENT, token.index, name, _index(value))
+
+    def ReturnStatement(self, token: _lexer.BufferedToken, return_value: int | None) -> int:
+        return self.arena.add(NodeKind.RETURN_STATEMENT, token.index, _index(return_value))
+
+    def ExpressionStatement(self, token: _lexer.BufferedToken, expression: int | None) -> int:
+        return self.arena.add(NodeKind.EXPRESSION_STATEMENT, token.index, _index(expression))
+
+    def BlockStatement(self, token: _lexer.BufferedToken, statements: list[int]) -> int:
+        return self.arena.add_list(NodeKind.BLOCK_STATEMENT, token.index, statements)
+
+    def Identifier(self, token: _lexer.BufferedToken, value: str) -> int:
+        return self.arena.add(NodeKind.IDENTIFIER, token.index)
+
+    def IntegerLiteral(self, token: _lexer.BufferedToken, value: int) -> int:
+        return self.arena.add(NodeKind.INTEGER_LITERAL, token.index)
+
+    def Boolean(self, token: _lexer.BufferedToken, value: bool) -> int:
+        return self.arena.add(NodeKind.BOOLEAN, token.index)
+
+    def PrefixExpression(self, token: _lexer.BufferedToken, operator: str, right: int | None) -> int:
+        return self.arena.add(NodeKind.PREFIX_EXPRESSION, token.index, _index(right))
+
+    def InfixExpression(self, token: _lexer.BufferedToken, left: int | None, operator: str, right: int | None) -> int:
+        return self.arena.add(NodeKind.INFIX_EXPRESSION, token.index, _index(left), _index(right))
+
+    def IfExpression(
+        self, token: _lexer.BufferedToken, condition: int | None, consequence: int | None, alternative: int | None
+    ) -> int:
+        return self.arena.add(
+            NodeKind.IF_EXPRESSION, token.index, _index(condition), _index(consequence), _index(alternative)
+        )
+
+    def FunctionLiteral(self, token: _lexer.BufferedToken, parameters: list[int], body: int | None) -> int:
+        return self.arena.add_list(NodeKind.FUNCTION_LITERAL, token.index, parameters, _index(body))
+
+    def CallExpression(self, token: _lexer.BufferedToken, function: int | None, arguments: list[int | None]) -> int:
+        arguments = [_index(argument) for argument in arguments]
+        return self.arena.add_list(NodeKind.CALL_EXPRESSION, token.index, arguments, _index(function))
+
+
+def _index(node: int | None) -> int:
+    return NONE if node is None else node
+
+
+class NodeView:
+    # the views subclass the matching _abstract_syntax_tree node, fields are read from the arena on access
+    # so token_literal/to_string and isinstance checks keep working
+    __slots__ = ('arena', 'index')
+
+    def __init__(self, arena: Arena, index: int):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def token(self) -> _lexer.BufferedToken:
+        return _lexer.BufferedToken(self.arena.buffer, self.arena.tokens[self.index])
+
+    def _first(self):
+        return self.arena.node(self.arena.first[self.index])
+
+    def _second(self):
+        return self.arena.node(self.arena.second[self.index])
+
+    def _third(self):
+        return self.arena.node(self.arena.third[self.index])
+
+    def _literal(self) -> str:
+        return self.arena.buffer.literal(self.arena.tokens[self.index])
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, NodeView):
+            return NotImplemented
+        return self.arena is other.arena and self.index == other.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.arena), self.index))
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(index={self.index})'
+
+
+class ProgramView(NodeView, _ast.Program):
+    statements = property(lambda self: self.arena.children(self.index))
+
+
+class LetStatementView(NodeView, _ast.LetStatement):
+    name = property(NodeView._first)
+    value = property(NodeView._second)
+
+
+class ReturnStatementView(NodeView, _ast.ReturnStatement):
+    return_value = property(NodeView._first)
+
+
+class ExpressionStatementView(NodeView, _ast.ExpressionStatement):
+    expression = property(NodeView._first)
+
+
+class BlockStatementView(NodeView, _ast.BlockStatement):
+    statements = property(lambda self: self.arena.children(self.index))
+
+
+class IdentifierView(NodeView, _ast.Identifier):
+    value = property(NodeView._literal)
+
+
+class IntegerLiteralView(NodeView, _ast.IntegerLiteral):
+    value = property(lambda self: int(self._literal()))
+
+
+class BooleanView(NodeView, _ast.Boolean):
+    value = property(lambda self: self.arena.buffer.token_type(self.arena.tokens[self.index]) == _token.TokenType.TRUE)
+
+
+class PrefixExpressionView(NodeView, _ast.PrefixExpression):
+    operator = property(NodeView._literal)
+    right = property(NodeView._first)
+
+
+class InfixExpressionView(NodeView, _ast.InfixExpression):
+    left = property(NodeView._first)
+    operator = property(NodeView._literal)
+    right = property(NodeView._second)
+
+
+class IfExpressionView(NodeView, _ast.IfExpression):
+    condition = property(NodeView._first)
+    consquence = property(NodeView._second)
+    alternative = property(NodeView._third)
+
+
+class FunctionLiteralView(NodeView, _ast.FunctionLiteral):
+    parameters = property(lambda self: self.arena.children(self.index))
+    body = property(NodeView._third)
+
+
+class CallExpressionView(NodeView, _ast.CallExpression):
+    function = property(NodeView._third)
+    arguments = property(lambda self: self.arena.children(self.index))
+
+
+views: dict[NodeKind, type[NodeView]] = {
+    NodeKind.PROGRAM: ProgramView,
+    NodeKind.LET_STATEMENT: LetStatementView,
+    NodeKind.RETURN_STATEMENT: ReturnStatementView,
+    NodeKind.EXPRESSION_STATEMENT: ExpressionStatementView,
+    NodeKind.BLOCK_STATEMENT: BlockStatementView,
+    NodeKind.IDENTIFIER: IdentifierView,
+    NodeKind.INTEGER_LITERAL: IntegerLiteralView,
+    NodeKind.BOOLEAN: BooleanView,
+    NodeKind.PREFIX_EXPRESSION: PrefixExpressionView,
+    NodeKind.INFIX_EXPRESSION: InfixExpressionView,
+    NodeKind.IF_EXPRESSION: IfExpressionView,
+    NodeKind.FUNCTION_LITERAL: FunctionLiteralView,
+    NodeKind.CALL_EXPRESSION: CallExpressionView,
+}
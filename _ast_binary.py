@@ -0,0 +1,305 @@
+# Compact binary form of _abstract_syntax_tree trees, used to skip lexing and parsing of unchanged sources.
+#
+#   magic, version byte
+#   token table: varint count, then per distinct token its type code, a varint byte length and the utf-8 literal
+#   nodes in post order, a node is its kind byte (the _ast_arena.NodeKind codes, NULL for a missing child), the
+#   varint index of its token in the table, and a varint item count for kinds with a list field
+#
+# Every other field of a node (identifier names, operators, integer values) is derived from its token the same way the
+# parser does. Post order lets loads rebuild the tree with a single value stack and no recursion.
+#
+# load_file keeps a cache file next to the source like a .pyc, invalidated by the source mtime and size or its hash.
+
+import functools
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import typing
+
+import _abstract_syntax_tree as _ast
+import _parser
+import _token
+from _ast_arena import NodeKind
+
+MAGIC = b'MKYA'
+VERSION = 1
+NULL = 0xFF
+CACHE_SUFFIX = 'c'
+# source mtime in ns, source size, blake2b digest of the source
+cache_header = struct.Struct('<qq16s')
+checks = ('mtime', 'hash')
+
+
+class FormatError(ValueError):
+    pass
+
+
+# the node and list fields of each kind in the order they are written, lists are marked with a leading *
+fields: dict[NodeKind, tuple[str, ...]] = {
+    NodeKind.PROGRAM: ('*statements',),
+    NodeKind.LET_STATEMENT: ('name', 'value'),
+    NodeKind.RETURN_STATEMENT: ('return_value',),
+    NodeKind.EXPRESSION_STATEMENT: ('expression',),
+    NodeKind.BLOCK_STATEMENT: ('*statements',),
+    NodeKind.IDENTIFIER: (),
+    NodeKind.INTEGER_LITERAL: (),
+    NodeKind.BOOLEAN: (),
+    NodeKind.PREFIX_EXPRESSION: ('right',),
+    NodeKind.INFIX_EXPRESSION: ('left', 'right'),
+    NodeKind.IF_EXPRESSION: ('condition', 'consquence', 'alternative'),
+    NodeKind.FUNCTION_LITERAL: ('*parameters', 'body'),
+    NodeKind.CALL_EXPRESSION: ('function', '*arguments'),
+}
+
+node_kinds: dict[type, NodeKind] = {
+    _ast.Program: NodeKind.PROGRAM,
+    _ast.LetStatement: NodeKind.LET_STATEMENT,
+    _ast.ReturnStatement: NodeKind.RETURN_STATEMENT,
+    _ast.ExpressionStatement: NodeKind.EXPRESSION_STATEMENT,
+    _ast.BlockStatement: NodeKind.BLOCK_STATEMENT,
+    _ast.Identifier: NodeKind.IDENTIFIER,
+    _ast.IntegerLiteral: NodeKind.INTEGER_LITERAL,
+    _ast.Boolean: NodeKind.BOOLEAN,
+    _ast.PrefixExpression: NodeKind.PREFIX_EXPRESSION,
+    _ast.InfixExpression: NodeKind.INFIX_EXPRESSION,
+    _ast.IfExpression: NodeKind.IF_EXPRESSION,
+    _ast.FunctionLiteral: NodeKind.FUNCTION_LITERAL,
+    _ast.CallExpression: NodeKind.CALL_EXPRESSION,
+}
+
+# builders get the token and the children in written order, list items are already spliced in
+builders: dict[NodeKind, typing.Callable[[_token.Token | None, list], _ast.BaseNode]] = {
+    NodeKind.PROGRAM: lambda token, children: _ast.Program(children),
+    NodeKind.LET_STATEMENT: lambda token, children: _ast.LetStatement(token, *children),
+    NodeKind.RETURN_STATEMENT: lambda token, children: _ast.ReturnStatement(token, *children),
+    NodeKind.EXPRESSION_STATEMENT: lambda token, children: _ast.ExpressionStatement(token, *children),
+    NodeKind.BLOCK_STATEMENT: lambda token, children: _ast.BlockStatement(token, children),
+    NodeKind.IDENTIFIER: lambda token, children: _ast.Identifier(token, token.literal),
+    NodeKind.INTEGER_LITERAL: lambda token, children: _ast.IntegerLiteral(token, int(token.literal)),
+    NodeKind.BOOLEAN: lambda token, children: _ast.Boolean(token, token.token_type == _token.TokenType.TRUE),
+    NodeKind.PREFIX_EXPRESSION: lambda token, children: _ast.PrefixExpression(token, token.literal, *children),
+    NodeKind.INFIX_EXPRESSION: lambda token, children: _ast.InfixExpression(
+        token, children[0], token.literal, children[1]
+    ),
+    NodeKind.IF_EXPRESSION: lambda token, children: _ast.IfExpression(token, *children),
+    NodeKind.FUNCTION_LITERAL: lambda token, children: _ast.FunctionLiteral(token, children[:-1], children[-1]),
+    NodeKind.CALL_EXPRESSION: lambda token, children: _ast.CallExpression(token, children[0], children[1:]),
+}
+
+# fixed child count and whether a list count follows, indexed by kind code
+arities: tuple[tuple[int, bool], ...] = tuple(
+    (sum(not field.startswith('*') for field in fields[kind]), any(field.startswith('*') for field in fields[kind]))
+    for kind in NodeKind
+)
+
+
+@functools.cache
+def kind_of(node_type: type) -> NodeKind:
+    # _ast_arena views subclass the node classes
+    for base in node_type.__mro__:
+        if base in node_kinds:
+            return node_kinds[base]
+    raise FormatError(f'cannot serialize {node_type.__name__}')
+
+
+def write_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data: typing.Sequence[int], position: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def dumps(program: _ast.Program) -> bytes:
+    tokens: dict[tuple[_token.TokenType, str], int] = {}
+    nodes = bytearray()
+    stack: list[tuple[_ast.BaseNode | None, bool]] = [(program, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if node is None:
+            nodes.append(NULL)
+            continue
+        kind = kind_of(type(node))
+        if not expanded:
+            stack.append((node, True))
+            children = []
+            for field in fields[kind]:
+                if field.startswith('*'):
+                    children.extend(getattr(node, field[1:]))
+                else:
+                    children.append(getattr(node, field))
+            stack.extend((child, False) for child in reversed(children))
+            continue
+        nodes.append(kind)
+        if kind != NodeKind.PROGRAM:
+            token = node.token
+            write_varint(nodes, tokens.setdefault((token.token_type, token.literal), len(tokens)))
+        for field in fields[kind]:
+            if field.startswith('*'):
+                write_varint(nodes, len(getattr(node, field[1:])))
+
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    write_varint(out, len(tokens))
+    for token_type, literal in tokens:
+        out.append(_token.token_type_codes[token_type])
+        encoded = literal.encode('utf-8')
+        write_varint(out, len(encoded))
+        out += encoded
+    out += nodes
+    return bytes(out)
+
+
+def loads(data: bytes | memoryview | mmap.mmap, symbols: _token.SymbolTable | None = None) -> _ast.Program:
+    # identifiers are interned in symbols like the lexer does, pass a table to share ids with other programs
+    with memoryview(data) as view:
+        if view[: len(MAGIC)] != MAGIC or len(view) <= len(MAGIC) or view[len(MAGIC)] != VERSION:
+            raise FormatError('not a binary AST of this version')
+        try:
+            return _read_nodes(view, len(MAGIC) + 1, _token.SymbolTable() if symbols is None else symbols)
+        except (IndexError, KeyError, TypeError, ValueError) as error:
+            raise FormatError(f'corrupt binary AST: {error}') from error
+
+
+def _read_nodes(view: memoryview, position: int, symbols: _token.SymbolTable) -> _ast.Program:
+    # tokens are frozen, all nodes with equal tokens share one object. the table holds no source positions, the
+    # tokens have no start
+    count, position = read_varint(view, position)
+    tokens = []
+    for _ in range(count):
+        token_type = _token.token_types[view[position]]
+        length, position = read_varint(view, position + 1)
+        literal = str(view[position : position + length], 'utf-8')
+        if token_type is _token.TokenType.IDENT:
+            symbol = symbols.intern(literal)
+            tokens.append(_token.Token(symbols.names[symbol], token_type, symbol))
+        else:
+            tokens.append(_token.Token(literal, token_type))
+        position += length
+
+    kind_builders = tuple(builders[kind] for kind in NodeKind)
+    stack = []
+    end = len(view)
+    while position < end:
+        kind = view[position]
+        position += 1
+        if kind == NULL:
+            stack.append(None)
+            continue
+        token = None
+        if kind != NodeKind.PROGRAM:
+            index = view[position]
+            if index < 0x80:
+                position += 1
+            else:
+                index, position = read_varint(view, position)
+            token = tokens[index]
+        size, has_list = arities[kind]
+        if has_list:
+            items, position = read_varint(view, position)
+            size += items
+        if size:
+            children = stack[len(stack) - size :]
+            del stack[len(stack) - size :]
+        else:
+            children = []
+        stack.append(kind_builders[kind](token, children))
+    if len(stack) != 1 or not isinstance(stack[0], _ast.Program):
+        raise FormatError('binary AST does not hold exactly one program')
+    return stack[0]
+
+
+def cache_path(path: str | os.PathLike) -> str:
+    return os.fspath(path) + CACHE_SUFFIX
+
+
+def load_file(
+    path: str | os.PathLike,
+    check: str = 'mtime',
+    use_mmap: bool = True,
+    write: bool = True,
+    symbols: _token.SymbolTable | None = None,
+) -> _ast.Program:
+    # loads the cached tree when it is still valid, otherwise parses the source and refreshes the cache.
+    # with check='hash' the source is read and hashed on every load, which also catches edits that keep the mtime
+    if check not in checks:
+        raise ValueError(f'Unknown check {check!r}, expected one of {checks}')
+    stat = os.stat(path)
+    source = None
+    digest = b''
+    if check == 'hash':
+        with open(path, 'rb') as file:
+            source = file.read()
+        digest = hashlib.blake2b(source, digest_size=16).digest()
+    program = _load_cache(cache_path(path), stat, digest, use_mmap, symbols)
+    if program is not None:
+        return program
+
+    if source is None:
+        with open(path, 'rb') as file:
+            source = file.read()
+    program = _parser.Parser(source.decode('utf-8'), symbols=symbols).parse_program()
+    if write:
+        header = cache_header.pack(stat.st_mtime_ns, stat.st_size, hashlib.blake2b(source, digest_size=16).digest())
+        _write_atomic(cache_path(path), header + dumps(program))
+    return program
+
+
+def _load_cache(
+    path: str, stat: os.stat_result, digest: bytes, use_mmap: bool, symbols: _token.SymbolTable | None
+) -> _ast.Program | None:
+    try:
+        with open(path, 'rb') as file:
+            if use_mmap:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = file.read()
+    except (OSError, ValueError):
+        # missing, unreadable, or empty (which mmap refuses)
+        return None
+    try:
+        if len(data) < cache_header.size:
+            return None
+        mtime_ns, size, source_digest = cache_header.unpack_from(data)
+        if digest:
+            if digest != source_digest:
+                return None
+        elif (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size):
+            return None
+        # every view has to be released before the mmap can be closed
+        with memoryview(data) as view, view[cache_header.size :] as body:
+            try:
+                return loads(body, symbols)
+            except FormatError:
+                return None
+    finally:
+        if use_mmap:
+            data.close()
+
+
+def _write_atomic(path: str, data: bytes):
+    # readers never see a half written cache, a failed write only costs the next load a parse
+    directory = os.path.dirname(path) or '.'
+    try:
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.ast-')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    except OSError:
+        pass
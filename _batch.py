@@ -0,0 +1,139 @@
+# Parses many files, or one large file in chunks, on a concurrent.futures process pool. Workers send back the
+# _ast_binary form of their programs, which is smaller to pickle and faster to load than the node objects.
+#
+# `{`, `}` and `;` are always tokens of their own, so top level statement boundaries are found with one regex pass:
+# a `;` outside of any braces that follows a complete operand (a name, number, `)` or `}`) is the peeked end of a
+# statement, the parser never continues an expression past it. After an operator the `;` is where a missing operand
+# was expected and the expression may go on behind it, and a statement without expression (`return;`) also takes a
+# second `;` right behind it, neither is used. Sources with characters that the lexer turns into ILLEGAL or EOF
+# tokens stop parse_program early and are never split.
+
+import concurrent.futures
+import os
+import re
+import typing
+
+import _abstract_syntax_tree as _ast
+import _ast_binary
+import _lexer
+import _parser
+
+_boundary_pattern = re.compile(r'[{};]')
+# anything outside of this set lexes as ILLEGAL (or as EOF for unusual whitespace)
+_unsplittable_pattern = re.compile(r'[^\w \t\n\r=!+\-*/<>(){},;]|_')
+_non_ascii_pattern = re.compile(r'[^\x00-\x7f]')
+_semicolon_pattern = re.compile(r'[ \t\n\r]*;')
+
+SPLIT_SIZE = 1 << 20
+
+
+def parse_source(source: str) -> bytes:
+    return _ast_binary.dumps(_parser.Parser(source).parse_program())
+
+
+def parse_path(path: str | os.PathLike) -> bytes:
+    with open(path, encoding='utf-8') as file:
+        return parse_source(file.read())
+
+
+def split_points(source: str, chunks: int) -> list[int]:
+    # offsets right behind top level semicolons that cut source into at most `chunks` pieces of similar size
+    if chunks < 2 or not _splittable(source):
+        return []
+    points = []
+    target = len(source) // chunks
+    depth = 0
+    for match in _boundary_pattern.finditer(source):
+        char = match.group()
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth < 0:
+                # a stray closing brace, the parser does not see blocks the way the depth count does any more
+                break
+        elif depth == 0 and match.end() >= target * (len(points) + 1):
+            before = match.start() - 1
+            while before >= 0 and source[before] in ' \t\n\r':
+                before -= 1
+            if before < 0 or not (source[before].isalnum() or source[before] in ')}'):
+                continue
+            if _semicolon_pattern.match(source, match.end()):
+                continue
+            points.append(match.end())
+            if len(points) == chunks - 1:
+                break
+    return points
+
+
+def _splittable(source: str) -> bool:
+    if _unsplittable_pattern.search(source):
+        return False
+    # \w is wider than the letters and digits the lexer accepts outside of ascii
+    return source.isascii() or all(char.isalpha() or char.isdigit() for char in set(_non_ascii_pattern.findall(source)))
+
+
+def split_source(source: str, chunks: int) -> list[str]:
+    bounds = [0, *split_points(source, chunks), len(source)]
+    return [source[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def merge(programs: typing.Iterable[_ast.Program]) -> _ast.Program:
+    return _ast.Program([statement for program in programs for statement in program.statements])
+
+
+def parse_large(
+    source: str, executor: concurrent.futures.Executor | None = None, workers: int | None = None, chunks: int = 0
+) -> _ast.Program:
+    # parses the chunks in parallel and merges them into one program, the same program parse_program builds
+    workers = workers or os.cpu_count() or 1
+    if executor is None:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            return parse_large(source, executor, workers, chunks)
+    pieces = split_source(source, chunks or workers * 4)
+    return merge(_ast_binary.loads(data) for data in executor.map(parse_source, pieces))
+
+
+def parse_files(
+    paths: typing.Iterable[str | os.PathLike], workers: int | None = None, split_size: int = SPLIT_SIZE
+) -> dict[str, _ast.Program]:
+    # files larger than split_size are parsed in chunks as well, errors carry a note with the file they came from
+    # and the line and column in that file
+    paths = [os.fspath(path) for path in paths]
+    workers = workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        # the futures with the line and column their piece starts at
+        pending: dict[str, list[tuple[concurrent.futures.Future, int, int]]] = {}
+        for path in paths:
+            if os.path.getsize(path) > split_size:
+                with open(path, encoding='utf-8') as file:
+                    source = file.read()
+                starts = [0, *split_points(source, max(2, len(source) // split_size * 2))]
+                line_index = _lexer.LineIndex(source)
+                pending[path] = [
+                    (executor.submit(parse_source, source[start:end]), *line_index.position(start))
+                    for start, end in zip(starts, [*starts[1:], len(source)])
+                ]
+            else:
+                pending[path] = [(executor.submit(parse_path, path), 1, 1)]
+
+        programs = {}
+        for path, futures in pending.items():
+            try:
+                programs[path] = merge(_load(future, line, column) for future, line, column in futures)
+            except SyntaxError as error:
+                error.add_note(f'while parsing {path}')
+                raise
+        return programs
+
+
+def _load(future: concurrent.futures.Future, line: int, column: int) -> _ast.Program:
+    try:
+        return _ast_binary.loads(future.result())
+    except SyntaxError as error:
+        # the position in the piece becomes the position in the file
+        if error.lineno:
+            if error.lineno == 1:
+                error.offset += column - 1
+            error.lineno += line - 1
+        raise
@@ -0,0 +1,108 @@
+# Parse cache keyed by a hash of the source text and the configuration of the parser. Entries are evicted least recently used first once either the entry
+# or the byte limit is reached, the size of an entry is the utf-8 length of its source. Cached programs are shared
+# between callers and must not be mutated (_optimizer and the evaluators build new objects).
+#
+# A cache can be shared by threads. Misses are parsed outside of the lock, each thread with a parser of its own, and
+# when two threads miss the same source at once the program of the first one is kept and returned to both.
+
+import collections
+import dataclasses
+import hashlib
+import threading
+
+import _abstract_syntax_tree as _ast
+import _parser
+
+
+@dataclasses.dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size_bytes: int
+
+
+# the options that change the tree a parser builds (its node types, lazy blocks, partial trees or symbol ids).
+# programs are only shared between parsers of one class that agree on them
+tree_options = ('arena', 'recover', 'symbols', 'lazy')
+
+
+def source_key(source: bytes) -> bytes:
+    return hashlib.blake2b(source, digest_size=16).digest()
+
+
+def parser_key(parser: _parser.Parser) -> tuple:
+    return (type(parser), *(parser.options[name] for name in tree_options))
+
+
+class ParseCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 1 << 24, parser: _parser.Parser | None = None):
+        if max_entries < 1 or max_bytes < 1:
+            raise ValueError(f'cache limits have to be positive, got {max_entries} entries and {max_bytes} bytes')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # misses are parsed by resetting this parser in the thread that built the cache and by parsers with its options
+        # in other threads. parsers passed to parse may differ, their programs are kept apart
+        self.parser = _parser.Parser('') if parser is None else parser
+        self._owner = threading.get_ident()
+        self._local = threading.local()
+        self._entries: collections.OrderedDict[tuple, tuple[_ast.Program, int]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def parse(self, source: str, parser: _parser.Parser | None = None) -> _ast.Program:
+        encoded = source.encode('utf-8')
+        parser = self._thread_parser() if parser is None else parser
+        key = (source_key(encoded), parser_key(parser))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        program = parser.reset(source).parse_program()
+        if len(encoded) > self.max_bytes:
+            return program
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry[0]
+            self._entries[key] = (program, len(encoded))
+            self.size_bytes += len(encoded)
+            self._evict()
+        return program
+
+    def _thread_parser(self) -> _parser.Parser:
+        if threading.get_ident() == self._owner:
+            return self.parser
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._local.parser = type(self.parser)('', **self.parser.options)
+        return parser
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size_bytes -= size
+            self.evictions += 1
+
+    def __contains__(self, source: str) -> bool:
+        # as parsed by the parser of the cache
+        return (source_key(source.encode('utf-8')), parser_key(self.parser)) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self.hits, self.misses, self.evictions, len(self._entries), self.size_bytes)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
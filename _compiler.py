@@ -0,0 +1,334 @@
+# Lowers the AST into the bytecode of _code, following "Writing a Compiler in Go". A Compiler (and its
+# SymbolTable and constants) can be kept around to compile more programs against the same globals, like the REPL does.
+
+import dataclasses
+import enum
+import functools
+
+import _abstract_syntax_tree as _ast
+import _code
+from _code import Opcode
+
+
+class CompilationError(Exception):
+    pass
+
+
+class SymbolScope(enum.Enum):
+    GLOBAL = 'GLOBAL'
+    LOCAL = 'LOCAL'
+    FREE = 'FREE'
+    FUNCTION = 'FUNCTION'
+
+
+@dataclasses.dataclass(frozen=True)
+class Symbol:
+    name: str
+    scope: SymbolScope
+    index: int
+
+
+class SymbolTable:
+    def __init__(self, outer: 'SymbolTable | None' = None):
+        self.outer = outer
+        self.store: dict[str, Symbol] = {}
+        self.num_definitions = 0
+        self.free_symbols: list[Symbol] = []
+
+    def define(self, name: str) -> Symbol:
+        scope = SymbolScope.GLOBAL if self.outer is None else SymbolScope.LOCAL
+        symbol = Symbol(name, scope, self.num_definitions)
+        self.store[name] = symbol
+        self.num_definitions += 1
+        return symbol
+
+    def define_function_name(self, name: str) -> Symbol:
+        symbol = Symbol(name, SymbolScope.FUNCTION, 0)
+        self.store[name] = symbol
+        return symbol
+
+    def _define_free(self, original: Symbol) -> Symbol:
+        self.free_symbols.append(original)
+        symbol = Symbol(original.name, SymbolScope.FREE, len(self.free_symbols) - 1)
+        self.store[original.name] = symbol
+        return symbol
+
+    def resolve(self, name: str) -> Symbol | None:
+        symbol = self.store.get(name)
+        if symbol is not None or self.outer is None:
+            return symbol
+        symbol = self.outer.resolve(name)
+        if symbol is None or symbol.scope is SymbolScope.GLOBAL:
+            return symbol
+        return self._define_free(symbol)
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledFunction:
+    instructions: bytes
+    num_locals: int = 0
+    num_parameters: int = 0
+    name: str = ''
+
+    def __str__(self) -> str:
+        return f'CompiledFunction[{self.name or id(self)}]'
+
+
+@dataclasses.dataclass(frozen=True)
+class Bytecode:
+    instructions: bytes
+    constants: list
+
+
+@dataclasses.dataclass
+class EmittedInstruction:
+    opcode: Opcode
+    position: int
+
+
+@dataclasses.dataclass
+class CompilationScope:
+    instructions: bytearray = dataclasses.field(default_factory=bytearray)
+    last_instruction: EmittedInstruction | None = None
+    previous_instruction: EmittedInstruction | None = None
+
+
+infix_opcodes: dict[str, Opcode] = {
+    '+': Opcode.ADD,
+    '-': Opcode.SUB,
+    '*': Opcode.MUL,
+    '/': Opcode.DIV,
+    '>': Opcode.GREATER_THAN,
+    '==': Opcode.EQUAL,
+    '!=': Opcode.NOT_EQUAL,
+}
+
+# constants are indexed by the two byte operand of OpConstant and OpClosure
+max_constant_index = (1 << 16) - 1
+
+load_opcodes: dict[SymbolScope, Opcode] = {
+    SymbolScope.GLOBAL: Opcode.GET_GLOBAL,
+    SymbolScope.LOCAL: Opcode.GET_LOCAL,
+    SymbolScope.FREE: Opcode.GET_FREE,
+}
+
+
+class Compiler:
+    def __init__(self, symbol_table: SymbolTable | None = None, constants: list | None = None):
+        self.symbol_table = SymbolTable() if symbol_table is None else symbol_table
+        self.constants = [] if constants is None else constants
+        # integers and strings are added once, other constants (functions) every time
+        self._constant_indexes = {
+            (type(value), value): index for index, value in enumerate(self.constants) if type(value) in (int, str)
+        }
+        self.scopes = [CompilationScope()]
+
+    @property
+    def _scope(self) -> CompilationScope:
+        return self.scopes[-1]
+
+    def bytecode(self) -> Bytecode:
+        return Bytecode(bytes(self._scope.instructions), self.constants)
+
+    def _emit(self, opcode: Opcode, *operands: int) -> int:
+        scope = self._scope
+        position = len(scope.instructions)
+        scope.instructions += _make(opcode, *operands)
+        scope.previous_instruction = scope.last_instruction
+        scope.last_instruction = EmittedInstruction(opcode, position)
+        return position
+
+    def _add_constant(self, value) -> int:
+        key = (type(value), value) if type(value) in (int, str) else None
+        index = self._constant_indexes.get(key)
+        if index is None:
+            index = len(self.constants)
+            if index > max_constant_index:
+                raise CompilationError(f'too many constants, at most {max_constant_index + 1} fit in OpConstant')
+            self.constants.append(value)
+            if key is not None:
+                self._constant_indexes[key] = index
+        return index
+
+    def _last_instruction_is(self, opcode: Opcode, start: int = 0) -> bool:
+        # start is the position from which on instructions are looked at
+        last = self._scope.last_instruction
+        return last is not None and last.opcode is opcode and last.position >= start
+
+    def _remove_last_pop(self):
+        scope = self._scope
+        del scope.instructions[scope.last_instruction.position :]
+        scope.last_instruction = scope.previous_instruction
+
+    def _change_operand(self, position: int, operand: int):
+        instructions = self._scope.instructions
+        instructions[position : position + 3] = _make(Opcode(instructions[position]), operand)
+
+    def _enter_scope(self):
+        self.scopes.append(CompilationScope())
+        self.symbol_table = SymbolTable(self.symbol_table)
+
+    def _leave_scope(self) -> bytes:
+        instructions = bytes(self.scopes.pop().instructions)
+        self.symbol_table = self.symbol_table.outer
+        return instructions
+
+    def _load_symbol(self, symbol: Symbol):
+        if symbol.scope is SymbolScope.FUNCTION:
+            self._emit(Opcode.CURRENT_CLOSURE)
+        else:
+            self._emit(load_opcodes[symbol.scope], symbol.index)
+
+    @functools.singledispatchmethod
+    def compile(self, node: _ast.BaseNode):
+        raise CompilationError(f'cannot compile {type(node).__name__}')
+
+    @compile.register
+    def _(self, node: _ast.Program):
+        for statement in node.statements:
+            self.compile(statement)
+
+    @compile.register
+    def _(self, node: _ast.BlockStatement):
+        # blocks are values (if branches, or a whole if folded away by _optimizer), they leave their last expression
+        # on the stack, or null. only instructions of the block count, a block folded to nothing emits none
+        start = len(self._scope.instructions)
+        for statement in node.statements:
+            self.compile(statement)
+        if self._last_instruction_is(Opcode.POP, start):
+            self._remove_last_pop()
+        elif not self._last_instruction_is(Opcode.RETURN_VALUE, start):
+            self._emit(Opcode.NULL)
+
+    @compile.register
+    def _(self, node: _ast.ExpressionStatement):
+        if node.expression is not None:
+            self.compile(node.expression)
+            self._emit(Opcode.POP)
+
+    @compile.register
+    def _(self, node: _ast.LetStatement):
+        # defined after the value is compiled, a name in the value is the earlier binding. functions refer to
+        # themselves through define_function_name
+        if isinstance(node.value, _ast.FunctionLiteral):
+            self._compile_function(node.value, name=node.name.value)
+        else:
+            self.compile(node.value)
+        symbol = self.symbol_table.define(node.name.value)
+        self._emit(Opcode.SET_GLOBAL if symbol.scope is SymbolScope.GLOBAL else Opcode.SET_LOCAL, symbol.index)
+
+    @compile.register
+    def _(self, node: _ast.ReturnStatement):
+        if node.return_value is None:
+            self._emit(Opcode.NULL)
+        else:
+            self.compile(node.return_value)
+        self._emit(Opcode.RETURN_VALUE)
+
+    @compile.register
+    def _(self, node: _ast.IntegerLiteral):
+        self._emit(Opcode.CONSTANT, self._add_constant(node.value))
+
+    @compile.register
+    def _(self, node: _ast.Boolean):
+        self._emit(Opcode.TRUE if node.value else Opcode.FALSE)
+
+    @compile.register
+    def _(self, node: _ast.Identifier):
+        symbol = self.symbol_table.resolve(node.value)
+        if symbol is None:
+            raise CompilationError(f'undefined variable {node.value}')
+        self._load_symbol(symbol)
+
+    @compile.register
+    def _(self, node: _ast.PrefixExpression):
+        self.compile(node.right)
+        if node.operator == '!':
+            self._emit(Opcode.BANG)
+        elif node.operator == '-':
+            self._emit(Opcode.MINUS)
+        else:
+            raise CompilationError(f'unknown operator {node.operator}')
+
+    @compile.register
+    def _(self, node: _ast.InfixExpression):
+        # there is no less than instruction, the operands are swapped instead
+        if node.operator == '<':
+            self.compile(node.right)
+            self.compile(node.left)
+            self._emit(Opcode.GREATER_THAN)
+            return
+        opcode = infix_opcodes.get(node.operator)
+        if opcode is None:
+            raise CompilationError(f'unknown operator {node.operator}')
+        self.compile(node.left)
+        self.compile(node.right)
+        self._emit(opcode)
+
+    @compile.register
+    def _(self, node: _ast.IfExpression):
+        self.compile(node.condition)
+        jump_not_truthy = self._emit(Opcode.JUMP_NOT_TRUTHY, 0xFFFF)
+        self.compile(node.consquence)
+        jump = self._emit(Opcode.JUMP, 0xFFFF)
+        self._change_operand(jump_not_truthy, len(self._scope.instructions))
+        if node.alternative is None:
+            self._emit(Opcode.NULL)
+        else:
+            self.compile(node.alternative)
+        self._change_operand(jump, len(self._scope.instructions))
+
+    @compile.register
+    def _(self, node: _ast.FunctionLiteral):
+        self._compile_function(node)
+
+    def _compile_function(self, node: _ast.FunctionLiteral, name: str = ''):
+        self._enter_scope()
+        if name:
+            self.symbol_table.define_function_name(name)
+        for parameter in node.parameters:
+            self.symbol_table.define(parameter.value)
+        for statement in node.body.statements:
+            self.compile(statement)
+        if self._last_instruction_is(Opcode.POP):
+            # the value of the last expression is the implicit return value
+            position = self._scope.last_instruction.position
+            self._scope.instructions[position] = Opcode.RETURN_VALUE
+            self._scope.last_instruction = EmittedInstruction(Opcode.RETURN_VALUE, position)
+        if not self._last_instruction_is(Opcode.RETURN_VALUE):
+            self._emit(Opcode.RETURN)
+
+        free_symbols = self.symbol_table.free_symbols
+        num_locals = self.symbol_table.num_definitions
+        instructions = self._leave_scope()
+        for symbol in free_symbols:
+            self._load_symbol(symbol)
+        function = CompiledFunction(instructions, num_locals, len(node.parameters), name)
+        self._emit(Opcode.CLOSURE, self._add_constant(function), len(free_symbols))
+
+    @compile.register
+    def _(self, node: _ast.CallExpression):
+        self.compile(node.function)
+        for argument in node.arguments:
+            self.compile(argument)
+        self._emit(Opcode.CALL, len(node.arguments))
+
+
+def _make(opcode: Opcode, *operands: int) -> bytes:
+    # operands out of range are limits of the bytecode format the program runs into (jumps past 64 KiB, more than
+    # 255 locals or arguments), not bugs of the compiler
+    try:
+        return _code.make(opcode, *operands)
+    except ValueError as error:
+        raise CompilationError(f'program too large: {error}') from None
+
+
+def compile_program(program: _ast.Program, compiler: Compiler | None = None) -> Bytecode:
+    # pass a compiler to compile against its globals and constants. compile recurses per level of the tree, a tree
+    # nested deeper than the recursion limit allows (a long chain like 1 + 1 + ... + 1) is an error of the program
+    compiler = Compiler() if compiler is None else compiler
+    try:
+        compiler.compile(program)
+    except RecursionError:
+        raise CompilationError('program nested too deeply') from None
+    return compiler.bytecode()
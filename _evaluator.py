@@ -0,0 +1,281 @@
+# Compiles the AST once into nested python closures. Every closure takes the Environment it runs in, node types
+# and operators are dispatched while compiling so running a compiled program never looks at the AST again.
+# Monkey values are plain python values: int, bool, None for null and Function.
+
+import functools
+import operator
+import typing
+
+import _abstract_syntax_tree as _ast
+
+Code = typing.Callable[['Environment'], typing.Any]
+
+
+class EvaluationError(Exception):
+    pass
+
+
+class Environment:
+    __slots__ = ('store', 'outer')
+
+    def __init__(self, store: dict[str, typing.Any] | None = None, outer: 'Environment | None' = None):
+        self.store = {} if store is None else store
+        self.outer = outer
+
+    def get(self, name: str) -> typing.Any:
+        env = self
+        while env is not None:
+            if name in env.store:
+                return env.store[name]
+            env = env.outer
+        raise EvaluationError(f'identifier not found: {name}')
+
+    def set(self, name: str, value: typing.Any):
+        self.store[name] = value
+
+
+class Function:
+    __slots__ = ('literal', 'parameters', 'body', 'env')
+
+    def __init__(self, literal: _ast.FunctionLiteral, parameters: tuple[str, ...], body: Code, env: Environment):
+        self.literal = literal
+        self.parameters = parameters
+        self.body = body
+        self.env = env
+
+
+class ReturnValue:
+    __slots__ = ('value',)
+
+    def __init__(self, value: typing.Any):
+        self.value = value
+
+
+def type_name(value: typing.Any) -> str:
+    if value is None:
+        return 'NULL'
+    elif isinstance(value, bool):
+        return 'BOOLEAN'
+    elif isinstance(value, int):
+        return 'INTEGER'
+    elif isinstance(value, Function):
+        return 'FUNCTION'
+    return type(value).__name__.upper()
+
+
+def inspect(value: typing.Any) -> str:
+    if value is None:
+        return 'null'
+    elif isinstance(value, bool):
+        return 'true' if value else 'false'
+    elif isinstance(value, Function):
+        return value.literal.to_string()
+    return str(value)
+
+
+def divide(left: int, right: int) -> int:
+    # integer division truncates towards zero like the Go implementation of the book
+    if right == 0:
+        raise EvaluationError('division by zero')
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+integer_operators: dict[str, typing.Callable[[int, int], typing.Any]] = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': divide,
+    '<': operator.lt,
+    '>': operator.gt,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+def compile_program(program: _ast.Program) -> Code:
+    try:
+        statements = tuple(compile_node(statement) for statement in program.statements)
+    except RecursionError:
+        # compile_node recurses per level of the tree
+        raise EvaluationError('program nested too deeply') from None
+
+    def run_program(env: Environment) -> typing.Any:
+        result = None
+        try:
+            for statement in statements:
+                result = statement(env)
+                if type(result) is ReturnValue:
+                    return result.value
+        except RecursionError:
+            # calls nest python frames, too deep a recursion is the stack overflow of the vm
+            raise EvaluationError('stack overflow') from None
+        return result
+
+    return run_program
+
+
+def evaluate(program: _ast.Program, env: Environment | None = None) -> typing.Any:
+    return compile_program(program)(Environment() if env is None else env)
+
+
+@functools.singledispatch
+def compile_node(node: _ast.BaseNode) -> Code:
+    raise EvaluationError(f'cannot evaluate {type(node).__name__}')
+
+
+@compile_node.register
+def _(node: _ast.BlockStatement) -> Code:
+    statements = tuple(compile_node(statement) for statement in node.statements)
+
+    # a ReturnValue is handed up as is so it also stops the enclosing blocks
+    def run_block(env: Environment) -> typing.Any:
+        result = None
+        for statement in statements:
+            result = statement(env)
+            if type(result) is ReturnValue:
+                return result
+        return result
+
+    return run_block
+
+
+@compile_node.register
+def _(node: _ast.ExpressionStatement) -> Code:
+    if node.expression is None:
+        return lambda env: None
+    return compile_node(node.expression)
+
+
+@compile_node.register
+def _(node: _ast.LetStatement) -> Code:
+    name = node.name.value
+    value = compile_node(node.value)
+
+    def run_let(env: Environment) -> None:
+        env.store[name] = value(env)
+
+    return run_let
+
+
+@compile_node.register
+def _(node: _ast.ReturnStatement) -> Code:
+    if node.return_value is None:
+        return lambda env: ReturnValue(None)
+    value = compile_node(node.return_value)
+    return lambda env: ReturnValue(value(env))
+
+
+@compile_node.register
+def _(node: _ast.IntegerLiteral) -> Code:
+    value = node.value
+    return lambda env: value
+
+
+@compile_node.register
+def _(node: _ast.Boolean) -> Code:
+    value = node.value
+    return lambda env: value
+
+
+@compile_node.register
+def _(node: _ast.Identifier) -> Code:
+    name = node.value
+
+    def run_identifier(env: Environment) -> typing.Any:
+        while env is not None:
+            store = env.store
+            if name in store:
+                return store[name]
+            env = env.outer
+        raise EvaluationError(f'identifier not found: {name}')
+
+    return run_identifier
+
+
+@compile_node.register
+def _(node: _ast.PrefixExpression) -> Code:
+    right = compile_node(node.right)
+    if node.operator == '!':
+
+        def run_bang(env: Environment) -> bool:
+            value = right(env)
+            return value is False or value is None
+
+        return run_bang
+    elif node.operator == '-':
+
+        def run_minus(env: Environment) -> int:
+            value = right(env)
+            if type(value) is not int:
+                raise EvaluationError(f'unknown operator: -{type_name(value)}')
+            return -value
+
+        return run_minus
+    raise EvaluationError(f'unknown operator: {node.operator}')
+
+
+@compile_node.register
+def _(node: _ast.InfixExpression) -> Code:
+    left = compile_node(node.left)
+    right = compile_node(node.right)
+    operator_name = node.operator
+    integer_operator = integer_operators.get(operator_name)
+    if integer_operator is None:
+        raise EvaluationError(f'unknown operator: {operator_name}')
+    identity = {'==': operator.is_, '!=': operator.is_not}.get(operator_name)
+
+    def run_infix(env: Environment) -> typing.Any:
+        left_value = left(env)
+        right_value = right(env)
+        if type(left_value) is int and type(right_value) is int:
+            return integer_operator(left_value, right_value)
+        elif identity is not None:
+            return identity(left_value, right_value)
+        elif type_name(left_value) != type_name(right_value):
+            raise EvaluationError(f'type mismatch: {type_name(left_value)} {operator_name} {type_name(right_value)}')
+        raise EvaluationError(f'unknown operator: {type_name(left_value)} {operator_name} {type_name(right_value)}')
+
+    return run_infix
+
+
+@compile_node.register
+def _(node: _ast.IfExpression) -> Code:
+    condition = compile_node(node.condition)
+    consequence = compile_node(node.consquence)
+    alternative = compile_node(node.alternative) if node.alternative else None
+
+    def run_if(env: Environment) -> typing.Any:
+        value = condition(env)
+        if value is not None and value is not False:
+            return consequence(env)
+        elif alternative is not None:
+            return alternative(env)
+        return None
+
+    return run_if
+
+
+@compile_node.register
+def _(node: _ast.FunctionLiteral) -> Code:
+    parameters = tuple(parameter.value for parameter in node.parameters)
+    body = compile_node(node.body)
+    return lambda env: Function(node, parameters, body, env)
+
+
+@compile_node.register
+def _(node: _ast.CallExpression) -> Code:
+    function = compile_node(node.function)
+    arguments = tuple(compile_node(argument) for argument in node.arguments)
+
+    def run_call(env: Environment) -> typing.Any:
+        callee = function(env)
+        if type(callee) is not Function:
+            raise EvaluationError(f'not a function: {type_name(callee)}')
+        if len(arguments) != len(callee.parameters):
+            raise EvaluationError(f'wrong number of arguments: want={len(callee.parameters)}, got={len(arguments)}')
+        store = dict(zip(callee.parameters, [argument(env) for argument in arguments]))
+        result = callee.body(Environment(store, callee.env))
+        return result.value if type(result) is ReturnValue else result
+
+    return run_call
@@ -0,0 +1,123 @@
+# Seeded generator of Monkey programs for benchmarks. Programs only use what the parser supports (let, return,
+# functions, calls, if/else, integer and boolean arithmetic) and only refer to names defined before them, they are
+# meant to be parsed rather than run. Equal seeds give equal programs.
+
+import random
+import string
+
+import _token
+
+shapes = ('mixed', 'nesting', 'let_chain', 'wide', 'blocks')
+
+infix_operators = ('+', '-', '*', '/', '<', '>', '==', '!=')
+
+
+class Generator:
+    def __init__(self, seed: int = 0):
+        self.random = random.Random(seed)
+        self.names: list[str] = []
+        self.functions: dict[str, int] = {}
+        self.counter = 0
+
+    def name(self, prefix: str = 'v') -> str:
+        # identifiers are letters only, the counter is spelled in base 26
+        self.counter += 1
+        number, letters = self.counter, []
+        while number:
+            number, digit = divmod(number, 26)
+            letters.append(string.ascii_lowercase[digit])
+        name = prefix + ''.join(reversed(letters))
+        return self.name(prefix) if name in _token.keyword_map else name
+
+    def operand(self, names: list[str]) -> str:
+        roll = self.random.random()
+        if names and roll < 0.5:
+            return self.random.choice(names)
+        elif roll < 0.9:
+            return str(self.random.randint(0, 1000))
+        return self.random.choice(('true', 'false'))
+
+    def expression(self, depth: int, names: list[str]) -> str:
+        if depth <= 0:
+            return self.operand(names)
+        roll = self.random.random()
+        if roll < 0.45:
+            operator = self.random.choice(infix_operators)
+            return f'{self.expression(depth - 1, names)} {operator} {self.expression(depth - 1, names)}'
+        elif roll < 0.6:
+            return f'({self.expression(depth - 1, names)})'
+        elif roll < 0.7:
+            return f'{self.random.choice("-!")}{self.expression(depth - 1, names)}'
+        elif roll < 0.8 and self.functions:
+            function, arity = self.random.choice(list(self.functions.items()))
+            arguments = ', '.join(self.expression(depth - 1, names) for _ in range(arity))
+            return f'{function}({arguments})'
+        elif roll < 0.9:
+            condition = self.expression(depth - 1, names)
+            consequence = self.expression(depth - 1, names)
+            alternative = self.expression(depth - 1, names)
+            return f'if ({condition}) {{ {consequence} }} else {{ {alternative} }}'
+        return self.operand(names)
+
+    def function(self, statements: int, depth: int) -> str:
+        name = self.name('f')
+        parameters = [self.name('p') for _ in range(self.random.randint(0, 3))]
+        body = self.block(statements, depth, list(parameters))
+        self.functions[name] = len(parameters)
+        self.names.append(name)
+        return f'let {name} = fn({", ".join(parameters)}) {{\n{body}\n}};'
+
+    def block(self, statements: int, depth: int, names: list[str]) -> str:
+        lines = []
+        for _ in range(statements - 1):
+            name = self.name()
+            lines.append(f'    let {name} = {self.expression(depth, names)};')
+            names.append(name)
+        lines.append(f'    return {self.expression(depth, names)};')
+        return '\n'.join(lines)
+
+    def statement(self, shape: str, depth: int, width: int) -> str:
+        if shape == 'nesting':
+            return self.nested(depth) + ';'
+        elif shape == 'let_chain':
+            name = self.name()
+            previous = self.names[-1] if self.names else '0'
+            self.names.append(name)
+            return f'let {name} = {previous} + {self.operand(self.names[-8:])};'
+        elif shape == 'wide':
+            operands = (self.operand(self.names[-8:]) for _ in range(width))
+            return ' + '.join(operands) + ';'
+        elif shape == 'blocks':
+            return self.function(width, 2)
+        roll = self.random.random()
+        if roll < 0.2:
+            return self.function(self.random.randint(1, 8), depth)
+        name = self.name()
+        statement = f'let {name} = {self.expression(depth, self.names[-8:])};'
+        self.names.append(name)
+        return statement
+
+    def nested(self, depth: int) -> str:
+        # alternates parentheses, if expressions and function literals down to depth levels
+        if depth <= 0:
+            return self.operand(self.names[-8:])
+        inner = self.nested(depth - 1)
+        roll = self.random.random()
+        if roll < 0.5:
+            return f'({inner} {self.random.choice(infix_operators)} {self.operand([])})'
+        elif roll < 0.75:
+            return f'if ({self.operand([])}) {{ {inner} }} else {{ {self.operand([])} }}'
+        return f'fn(x) {{ {inner} }}'
+
+
+def generate(size: int, shape: str = 'mixed', seed: int = 0, depth: int = 4, width: int = 50) -> str:
+    # at least size characters of statements of the given shape
+    if shape not in shapes:
+        raise ValueError(f'Unknown shape {shape!r}, expected one of {shapes}')
+    generator = Generator(seed)
+    statements = []
+    length = 0
+    while length < size:
+        statements.append(generator.statement(shape, depth, width))
+        length += len(statements[-1]) + 1
+    return '\n'.join(statements) + '\n'
@@ -0,0 +1,186 @@
+# Incremental reparsing for editors. A Document remembers the character span of every top level statement and every
+# block of its program. An edit keeps the statements in front of it, relexes and reparses from there, and stops as
+# soon as a statement boundary lines up with an old statement behind the edit, whose statements are kept as well.
+# Inside the reparsed region a `{` whose block text is unchanged is skipped with the old BlockStatement.
+#
+# A statement is decided by its own tokens and the one token after it (the parser peeks at it), so a statement in
+# front of the edit is only kept when that following token ends before the edit too. A block is decided by the text
+# between its braces alone. Reused nodes are shared with the previous program.
+
+import bisect
+import dataclasses
+import functools
+
+import _abstract_syntax_tree as _ast
+import _lexer
+import _parser
+import _token
+
+
+class SpanLexer:
+    # lexes on demand from position and keeps the span of every token it handed out, the n-th token returned
+    # is the token at parser offset n. identifiers are interned in symbols like Lexer does
+    def __init__(self, source_code: str, position: int = 0, symbols: _token.SymbolTable | None = None):
+        self.source_code = source_code
+        self.position = position
+        self.symbols = _token.SymbolTable() if symbols is None else symbols
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+
+    def next_token(self) -> _token.Token:
+        token_type, start, end = _lexer.scan(self.source_code, self.position)
+        if token_type is not _token.TokenType.ILLEGAL and token_type is not _token.TokenType.EOF:
+            self.position = end
+        self.starts.append(start)
+        self.ends.append(end)
+        if token_type is _token.TokenType.IDENT:
+            symbol = self.symbols.intern(self.source_code[start:end])
+            return _token.Token(literal=self.symbols.names[symbol], token_type=token_type, symbol=symbol, start=start)
+        return _token.Token(literal=self.source_code[start:end], token_type=token_type, start=start)
+
+    @functools.cached_property
+    def line_index(self) -> _lexer.LineIndex:
+        return _lexer.LineIndex(self.source_code)
+
+
+class IncrementalParser(_parser.Parser):
+    def __init__(self, lexer: SpanLexer, reusable_blocks: dict[int, tuple[_ast.BlockStatement, int]]):
+        # blocks are keyed by the position of their `{` and hold the position after their `}`
+        self.reusable_blocks = reusable_blocks
+        # blocks parsed or reused since this was last cleared, a reused block brings its nested blocks along
+        self.blocks: dict[int, tuple[_ast.BlockStatement, int]] = {}
+        self.reused_blocks = 0
+        super().__init__(lexer)
+
+    def _parse_block_statement(self) -> _ast.BlockStatement:
+        lexer = self.lexer
+        start = lexer.starts[self._offset]
+        reusable = self.reusable_blocks.get(start)
+        if reusable is not None:
+            # the peek token becomes the closing brace and lexing resumes behind it
+            block, end = reusable
+            lexer.starts[-1] = end - 1
+            lexer.ends[-1] = end
+            lexer.position = end
+            self._current_token = _token.Token(literal='}', token_type=_token.TokenType.RBRACE, start=end - 1)
+            self._peek_token = lexer.next_token()
+            self._offset += 1
+            self.reused_blocks += 1
+            for nested_start, (nested, nested_end) in self.reusable_blocks.items():
+                if start < nested_start and nested_end <= end:
+                    self.blocks[nested_start] = (nested, nested_end)
+        else:
+            block = super()._parse_block_statement()
+            if self._current_token.token_type is not _token.TokenType.RBRACE:
+                return block
+            end = lexer.ends[self._offset]
+        self.blocks[start] = (block, end)
+        return block
+
+
+@dataclasses.dataclass
+class ReparseStats:
+    reused_statements: int = 0
+    parsed_statements: int = 0
+    reused_blocks: int = 0
+    tokens_lexed: int = 0
+    full: bool = False
+
+
+class Document:
+    def __init__(self, source: str, symbols: _token.SymbolTable | None = None):
+        self.source = source
+        # one table for all reparses, reused and reparsed identifiers have the same ids
+        self.symbols = _token.SymbolTable() if symbols is None else symbols
+        self.program: _ast.Program | None = None
+        # per top level statement: its first character, the end of its last token, the end of the token after it and
+        # its blocks keyed by their start relative to the statement, so moving a statement does not touch them
+        self.statements: list[_ast.Statement] = []
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        self.follows: list[int] = []
+        self.blocks: list[dict[int, tuple[_ast.BlockStatement, int]]] = []
+        # the text range without statements after a syntax error, it is reparsed with the next edit
+        self.dirty: tuple[int, int] | None = None
+        self.stats = ReparseStats()
+        try:
+            self._reparse(0, len(source), 0)
+        except SyntaxError:
+            # a buffer opened broken starts without program and all of it dirty, like after a broken edit
+            pass
+
+    def edit(self, offset: int, removed: int, inserted: str) -> _ast.Program:
+        # replaces source[offset:offset + removed] with inserted. a syntax error leaves the program at None until
+        # an edit makes the source valid again, the statements around the broken range are still reused then
+        if offset < 0 or removed < 0 or offset + removed > len(self.source):
+            raise ValueError(f'edit {offset}:{offset + removed} is outside of the {len(self.source)} character source')
+        self.source = self.source[:offset] + inserted + self.source[offset + removed :]
+        start, end = offset, offset + removed
+        if self.dirty is not None:
+            start, end = min(start, self.dirty[0]), max(end, self.dirty[1])
+        return self._reparse(start, end, len(inserted) - removed)
+
+    def _reparse(self, edit_start: int, edit_end: int, delta: int) -> _ast.Program:
+        # edit_start and edit_end are in the coordinates of the statements, delta moves the ones behind the edit.
+        # statements [0, kept) are in front of the edit and [behind, ...) behind it
+        kept = bisect.bisect_left(self.follows, edit_start)
+        behind = bisect.bisect_right(self.starts, edit_end)
+        blocks = {}
+        for index in range(kept, behind):
+            base = self.starts[index]
+            for start, (block, end) in self.blocks[index].items():
+                if base + end <= edit_start:
+                    blocks[base + start] = (block, base + end)
+                elif base + start >= edit_end:
+                    blocks[base + start + delta] = (block, base + end + delta)
+
+        statements, starts, ends = self.statements[:kept], self.starts[:kept], self.ends[:kept]
+        follows, statement_blocks = self.follows[:kept], self.blocks[:kept]
+        suffix_starts = [start + delta for start in self.starts[behind:]]
+        stats = ReparseStats(reused_statements=kept, full=not kept and not suffix_starts)
+        self.program = None
+        lexer = SpanLexer(self.source, self.ends[kept - 1] if kept else 0, self.symbols)
+        parser = IncrementalParser(lexer, blocks)
+        try:
+            while parser._current_token.token_type not in (_token.TokenType.EOF, _token.TokenType.ILLEGAL):
+                start = lexer.starts[parser._offset]
+                resync = bisect.bisect_left(suffix_starts, start)
+                if resync < len(suffix_starts) and suffix_starts[resync] == start:
+                    # the rest of the old program is still valid from here on
+                    behind += resync
+                    suffix_starts = suffix_starts[resync:]
+                    break
+                parser.blocks = {}
+                statement = parser._parse_statement()
+                if statement is not None:
+                    statements.append(statement)
+                    starts.append(start)
+                    ends.append(lexer.ends[parser._offset])
+                    follows.append(lexer.ends[parser._offset + 1])
+                    statement_blocks.append(
+                        {position - start: (block, end - start) for position, (block, end) in parser.blocks.items()}
+                    )
+                    stats.parsed_statements += 1
+                parser.next_token()
+            else:
+                behind = len(self.starts)
+                suffix_starts = []
+            self.dirty = None
+        except SyntaxError:
+            # what is in front of and behind the edit stays valid
+            del statements[kept:], starts[kept:], ends[kept:], follows[kept:], statement_blocks[kept:]
+            self.dirty = (edit_start, edit_end + delta)
+            raise
+        finally:
+            self.statements = statements + self.statements[behind:]
+            self.starts = starts + suffix_starts
+            self.ends = ends + [end + delta for end in self.ends[behind:]]
+            self.follows = follows + [follow + delta for follow in self.follows[behind:]]
+            self.blocks = statement_blocks + self.blocks[behind:]
+            stats.reused_statements += len(suffix_starts)
+            stats.reused_blocks = parser.reused_blocks
+            stats.tokens_lexed = len(lexer.starts)
+            self.stats = stats
+
+        self.program = _ast.Program(list(self.statements))
+        return self.program
@@ -1,22 +1,335 @@
+import array
+import bisect
+import codecs
+import functools
+import mmap
+import re
+import types
 import typing
 
 import _token
 from datastructure import Char
 
-# import types #MappingProxyType
+# the regex engine scans the whole token (including the whitespace before it) with a single match
+_token_pattern = re.compile(
+    r'[ \t\n\r]*(?:'
+    r'(?P<ident>[^\W\d_]+)'
+    r'|(?P<int>\d+)'
+    r'|(?P<operator>==|!=|[-+*/<>(){},;=!])'
+    r'|(?P<eof>\Z)'
+    r'|(?P<other>.)'
+    r')',
+    re.DOTALL,
+)
+
+_newline_pattern = re.compile('\n')
+
+operator_map: dict[str, _token.TokenType] = types.MappingProxyType(
+    {
+        '==': _token.TokenType.EQ,
+        '!=': _token.TokenType.NOT_EQ,
+        '=': _token.TokenType.ASSIGN,
+        '!': _token.TokenType.BANG,
+        '+': _token.TokenType.PLUS,
+        '*': _token.TokenType.ASTERISK,
+        '/': _token.TokenType.SLASH,
+        '-': _token.TokenType.MINUS,
+        '>': _token.TokenType.GT,
+        '<': _token.TokenType.LT,
+        '(': _token.TokenType.LPAREN,
+        ')': _token.TokenType.RPAREN,
+        '{': _token.TokenType.LBRACE,
+        '}': _token.TokenType.RBRACE,
+        ',': _token.TokenType.COMMA,
+        ';': _token.TokenType.SEMICOLON,
+    }
+)
+
+# the token types of ascii operator and delimiter characters by code point, None for the other characters. `=` and
+# `!` can start a two character operator as well
+ascii_operator_types: tuple[_token.TokenType | None, ...] = tuple(operator_map.get(chr(code)) for code in range(128))
+
+engines = ('char', 'regex')
+
+_ident_code = _token.token_type_codes[_token.TokenType.IDENT]
+
+
+def scan(source_code: str, position: int) -> tuple[_token.TokenType, int, int]:
+    match = _token_pattern.match(source_code, position)
+    kind = match.lastgroup
+    start, end = match.span(kind)
+    if kind == 'operator':
+        # str keys hash in C, an ascii_operator_types lookup is not faster here
+        return operator_map[match.group(kind)], start, end
+    elif kind == 'ident':
+        identifier = match.group(kind)
+        # [^\W\d_] is wider than str.isalpha outside of ascii
+        if not identifier.isalpha():
+            return _scan_unicode(source_code, start)
+        return _token.keyword_map.get(identifier, _token.TokenType.IDENT), start, end
+    elif kind == 'int':
+        # \d only covers decimal digits, str.isdigit may continue the number
+        if end < len(source_code) and not source_code[end].isascii():
+            return _scan_unicode(source_code, start)
+        return _token.TokenType.INT, start, end
+    elif kind == 'eof':
+        return _token.TokenType.EOF, start, end
+    return _scan_unicode(source_code, start)
+
+
+def _scan_unicode(source_code: str, position: int) -> tuple[_token.TokenType, int, int]:
+    # mirrors the str predicates used by the char engine for the non ascii cases
+    char = source_code[position]
+    if char.isalpha():
+        end = position
+        while end < len(source_code) and source_code[end].isalpha():
+            end += 1
+        return _token.keyword_map.get(source_code[position:end], _token.TokenType.IDENT), position, end
+    elif char.isdigit():
+        end = position
+        while end < len(source_code) and source_code[end].isdigit():
+            end += 1
+        return _token.TokenType.INT, position, end
+    elif not char.strip():
+        return _token.TokenType.EOF, position, position
+    return _token.TokenType.ILLEGAL, position, position + 1
+
+
+class LineIndex:
+    # offsets at which the lines of a source start, found with one regex pass over the text instead of counting
+    # lines while lexing. lines and columns count from 1
+    def __init__(self, source_code: str = ''):
+        self.starts = array.array('q', [0])
+        self.extend(source_code, 0)
+
+    def extend(self, text: str, base: int):
+        # text continues the source at offset base
+        self.starts.extend(base + match.end() for match in _newline_pattern.finditer(text))
+
+    def position(self, offset: int) -> tuple[int, int]:
+        line = bisect.bisect_right(self.starts, offset)
+        return line, offset - self.starts[line - 1] + 1
+
+
+def stream_tokens(
+    source: typing.IO | mmap.mmap,
+    chunk_size: int = 1 << 16,
+    symbols: _token.SymbolTable | None = None,
+    line_index: LineIndex | None = None,
+) -> typing.Iterator[_token.Token]:
+    # text and binary files and mmaps are read chunk_size at a time, only the unconsumed tail is kept around. token
+    # starts count characters from the beginning of the stream, the lines of every chunk go to line_index
+    symbols = _token.SymbolTable() if symbols is None else symbols
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    text = ''
+    # offset of text in the stream
+    base = 0
+    position = 0
+    exhausted = False
+    while True:
+        token_type, start, end = scan(text, position)
+        if end >= len(text) and not exhausted:
+            # the token (or the whitespace before it) may continue in the next chunk
+            chunk = source.read(chunk_size)
+            exhausted = not chunk
+            if not isinstance(chunk, str):
+                chunk = decoder.decode(chunk, final=exhausted)
+            if line_index is not None:
+                line_index.extend(chunk, base + len(text))
+            base += position
+            text = text[position:] + chunk
+            position = 0
+            continue
+        if token_type is _token.TokenType.EOF:
+            return
+        if token_type is _token.TokenType.IDENT:
+            symbol = symbols.intern(text[start:end])
+            yield _token.Token(literal=symbols.names[symbol], token_type=token_type, symbol=symbol, start=base + start)
+        else:
+            yield _token.Token(literal=text[start:end], token_type=token_type, start=base + start)
+        if token_type is _token.TokenType.ILLEGAL:
+            return
+        position = end
+
+
+class StreamLexer:
+    def __init__(
+        self, source: typing.IO | mmap.mmap, chunk_size: int = 1 << 16, symbols: _token.SymbolTable | None = None
+    ):
+        self.symbols = _token.SymbolTable() if symbols is None else symbols
+        # the lines of what was read so far, the source is not kept
+        self.line_index = LineIndex()
+        self._tokens = stream_tokens(source, chunk_size, self.symbols, self.line_index)
+        self._token = _token.Token(literal='', token_type=_token.TokenType.EOF)
+
+    def __iter__(self) -> typing.Iterator[_token.Token]:
+        return self._tokens
+
+    def next_token(self) -> _token.Token:
+        if self._token.token_type is not _token.TokenType.ILLEGAL:
+            self._token = next(self._tokens, None) or _token.Token(literal='', token_type=_token.TokenType.EOF)
+        return self._token
+
+
+class BufferedToken:
+    # stands in for _token.Token, the literal is only sliced out of the source when asked for
+    __slots__ = ('buffer', 'index')
+
+    def __init__(self, buffer: 'TokenBuffer', index: int):
+        self.buffer = buffer
+        self.index = index
+
+    @property
+    def token_type(self) -> _token.TokenType:
+        return _token.token_types[self.buffer.token_types[self.index]]
+
+    @property
+    def literal(self) -> str:
+        return self.buffer.literal(self.index)
+
+    @property
+    def symbol(self) -> int:
+        return self.buffer.symbol(self.index)
+
+    @property
+    def start(self) -> int:
+        return self.buffer.starts[self.index]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (_token.Token, BufferedToken)):
+            return NotImplemented
+        return self.token_type == other.token_type and self.literal == other.literal
+
+    def __hash__(self) -> int:
+        return hash((self.literal, self.token_type))
+
+    def __repr__(self) -> str:
+        return f'BufferedToken(literal={self.literal!r}, token_type={self.token_type})'
+
+
+class TokenBuffer:
+    # columnar token stream, token type codes plus start/end offsets into source_code
+    def __init__(self, source_code: str, symbols: _token.SymbolTable | None = None):
+        self.source_code = source_code
+        self.symbols = _token.SymbolTable() if symbols is None else symbols
+        self.token_types = array.array('B')
+        self.starts = array.array('q')
+        self.ends = array.array('q')
+
+    def __len__(self) -> int:
+        return len(self.token_types)
+
+    def __iter__(self) -> typing.Iterator[BufferedToken]:
+        for index in range(len(self)):
+            yield BufferedToken(self, index)
+
+    def append(self, token_type: _token.TokenType, start: int, end: int):
+        self.token_types.append(_token.token_type_codes[token_type])
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def token_type(self, index: int) -> _token.TokenType:
+        return _token.token_types[self.token_types[index]]
+
+    def literal(self, index: int) -> str:
+        return self.source_code[self.starts[index] : self.ends[index]]
+
+    def symbol(self, index: int) -> int:
+        # identifiers are only interned once their symbol is asked for
+        if self.token_types[index] != _ident_code:
+            return _token.NO_SYMBOL
+        return self.symbols.intern(self.literal(index))
+
+    def token(self, index: int) -> _token.Token:
+        return _token.Token(
+            literal=self.literal(index),
+            token_type=self.token_type(index),
+            symbol=self.symbol(index),
+            start=self.starts[index],
+        )
+
+    def reader(self) -> 'TokenReader':
+        return TokenReader(self)
+
+    @functools.cached_property
+    def line_index(self) -> LineIndex:
+        return LineIndex(self.source_code)
+
+
+class TokenReader:
+    # lexer interface over a TokenBuffer, the last token (EOF or ILLEGAL) is repeated like the lexer does
+    def __init__(self, buffer: TokenBuffer):
+        self.buffer = buffer
+        self.source_code = buffer.source_code
+        self._index = -1
+
+    @property
+    def line_index(self) -> LineIndex:
+        return self.buffer.line_index
+
+    def next_token(self) -> BufferedToken:
+        if self._index < len(self.buffer) - 1:
+            self._index += 1
+        return BufferedToken(self.buffer, self._index)
+
+
+class ReplayLexer:
+    # lexer interface over tokens[start:stop] of tokens that were read before, the last token is repeated like the
+    # lexer does. the lines of the tokens are those of lexer, the one they were read from
+    def __init__(
+        self,
+        tokens: list[_token.Token | BufferedToken],
+        lexer: typing.Any = None,
+        start: int = 0,
+        stop: int | None = None,
+    ):
+        self.tokens = tokens
+        self.lexer = lexer
+        self._last = (len(tokens) if stop is None else stop) - 1
+        self._index = start - 1
+
+    @property
+    def line_index(self) -> LineIndex | None:
+        return getattr(self.lexer, 'line_index', None)
+
+    @property
+    def index(self) -> int:
+        # of the token returned last
+        return self._index
+
+    def seek(self, index: int):
+        # the next token is tokens[index]
+        self._index = min(index, self._last + 1) - 1
+
+    def next_token(self) -> _token.Token | BufferedToken:
+        if self._index < self._last:
+            self._index += 1
+        return self.tokens[self._index]
 
 
 class Lexer:
-    def __iter__(self):
-        raise NotImplementedError('iterator not implmeneted')
+    def __iter__(self) -> typing.Iterator[_token.Token]:
+        # stops before EOF, an ILLEGAL token is the last one since the lexer does not move past it
+        while (token := self.next_token()).token_type is not _token.TokenType.EOF:
+            yield token
+            if token.token_type is _token.TokenType.ILLEGAL:
+                return
 
-    def __init__(self, source_code: str):
+    def __init__(self, source_code: str, engine: str = 'char', symbols: _token.SymbolTable | None = None):
+        if engine not in engines:
+            raise ValueError(f'Unknown lexer engine {engine!r}, expected one of {engines}')
         self.source_code = source_code
+        # identifier tokens share the interned spelling and carry its id, pass a table to share ids between lexers
+        self.symbols = _token.SymbolTable() if symbols is None else symbols
+        self.engine = engine
         self._read_position = 0
         self._position = 0
         self._char = Char('')
 
-        self._read_char()
+        if engine == 'regex':
+            self.next_token = self._next_token_regex
+        else:
+            self._read_char()
 
     def _read_char(self):
         if self._read_position >= len(self.source_code):
@@ -29,51 +342,39 @@ class Lexer:
     def handle_not_operator(self):
         token = None
         ch = self._char
+        start = self._position
         if self._peek_char() == '=':
             self._read_char()
-            token = _token.Token(literal=ch + self._char, token_type=_token.TokenType.NOT_EQ)
+            token = _token.Token(literal=ch + self._char, token_type=_token.TokenType.NOT_EQ, start=start)
         else:
-            token = _token.Token(literal=ch, token_type=_token.TokenType.BANG)
+            token = _token.Token(literal=ch, token_type=_token.TokenType.BANG, start=start)
         return token
 
     def handle_assign_operator(self):
         token = None
         ch = self._char
+        start = self._position
         if self._peek_char() == '=':
             self._read_char()
-            token = _token.Token(literal=ch + self._char, token_type=_token.TokenType.EQ)
+            token = _token.Token(literal=ch + self._char, token_type=_token.TokenType.EQ, start=start)
         else:
-            token = _token.Token(literal=ch, token_type=_token.TokenType.ASSIGN)
+            token = _token.Token(literal=ch, token_type=_token.TokenType.ASSIGN, start=start)
         return token
 
     def token_lookup(self, key: Char) -> _token.Token:
-        simple_token_type_map: dict[Char, _token.TokenType] = {
-            Char('+'): _token.TokenType.PLUS,
-            Char('*'): _token.TokenType.ASTERISK,
-            Char('/'): _token.TokenType.SLASH,
-            Char('-'): _token.TokenType.MINUS,
-            Char('>'): _token.TokenType.GT,
-            Char('<'): _token.TokenType.LT,
-            Char('('): _token.TokenType.LPAREN,
-            Char(')'): _token.TokenType.RPAREN,
-            Char('{'): _token.TokenType.LBRACE,
-            Char('}'): _token.TokenType.RBRACE,
-            Char(','): _token.TokenType.COMMA,
-            Char(';'): _token.TokenType.SEMICOLON,
-            Char(''): _token.TokenType.EOF,
-        }
-        function_token_map: dict[Char, typing.Callable] = {
-            Char('!'): self.handle_not_operator,
-            Char('='): self.handle_assign_operator,
-        }
-        token = None
-        if token_type := simple_token_type_map.get(key):
-            token = _token.Token(literal=str(key), token_type=token_type)
-        else:
-            token_handler_func = function_token_map.get(key)
-            if token_handler_func:
-                token = token_handler_func()
-        return token
+        # operators and delimiters come out of the ascii table, without building a token map per character
+        if not key:
+            # the position keeps moving at the end of the source, EOF stays at its end
+            return _token.Token(literal='', token_type=_token.TokenType.EOF, start=len(self.source_code))
+        code = ord(key)
+        token_type = ascii_operator_types[code] if code < 128 else None
+        if token_type is None:
+            return None
+        elif token_type is _token.TokenType.BANG:
+            return self.handle_not_operator()
+        elif token_type is _token.TokenType.ASSIGN:
+            return self.handle_assign_operator()
+        return _token.Token(literal=str(key), token_type=token_type, start=self._position)
 
     def skip_whitespace(self):
         while self._char in (Char(' '), Char('\t'), Char('\n'), Char('\r')):
@@ -89,20 +390,21 @@ class Lexer:
         self.skip_whitespace()
         token = self.token_lookup(self._char)
         if not token:
+            start = self._position
             if self._char.isalpha():
-                identifier = self._read_identifier()
-                keyword = _token.keyword_map.get(identifier)
-                return (
-                    _token.Token(literal=identifier, token_type=keyword)
-                    if keyword
-                    else _token.Token(literal=identifier, token_type=_token.TokenType.IDENT)
-                )
+                # keywords are in the symbol table as well, one lookup decides the token type
+                symbols = self.symbols
+                symbol = symbols.intern(self._read_identifier())
+                token_type = symbols.token_types[symbol]
+                if token_type is _token.TokenType.IDENT:
+                    return _token.Token(literal=symbols.names[symbol], token_type=token_type, symbol=symbol, start=start)
+                return _token.Token(literal=symbols.names[symbol], token_type=token_type, start=start)
             elif self._char.isdigit():
-                return _token.Token(literal=self._read_number(), token_type=_token.TokenType.INT)
+                return _token.Token(literal=self._read_number(), token_type=_token.TokenType.INT, start=start)
             elif self._char.strip() == Char(''):
-                return _token.TokenType(literal='', token_type=_token.TokenType.EOF)
+                return _token.Token(literal='', token_type=_token.TokenType.EOF, start=start)
             else:
-                return _token.Token(literal=self._char, token_type=_token.TokenType.ILLEGAL)
+                return _token.Token(literal=self._char, token_type=_token.TokenType.ILLEGAL, start=start)
         self._read_char()
         return token
 
@@ -118,4 +420,32 @@ class Lexer:
             self._read_char()
         return self.source_code[position : self._position]
 
-    def _handle_not_operator(self): ...
+    @functools.cached_property
+    def line_index(self) -> LineIndex:
+        return LineIndex(self.source_code)
+
+    def tokenize(self) -> TokenBuffer:
+        buffer = TokenBuffer(self.source_code, self.symbols)
+        codes, starts, ends = buffer.token_types, buffer.starts, buffer.ends
+        token_type_codes = _token.token_type_codes
+        position = 0
+        while True:
+            token_type, start, end = scan(self.source_code, position)
+            codes.append(token_type_codes[token_type])
+            starts.append(start)
+            ends.append(end)
+            if token_type is _token.TokenType.EOF or token_type is _token.TokenType.ILLEGAL:
+                return buffer
+            position = end
+
+    def _next_token_regex(self) -> _token.Token:
+        token_type, start, end = scan(self.source_code, self._position)
+        if token_type is _token.TokenType.IDENT:
+            symbols = self.symbols
+            symbol = symbols.intern(self.source_code[start:end])
+            self._position = end
+            return _token.Token(literal=symbols.names[symbol], token_type=token_type, symbol=symbol, start=start)
+        # ILLEGAL and EOF do not advance, same as the char engine
+        if token_type is not _token.TokenType.ILLEGAL and token_type is not _token.TokenType.EOF:
+            self._position = end
+        return _token.Token(literal=self.source_code[start:end], token_type=token_type, start=start)
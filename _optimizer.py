@@ -0,0 +1,202 @@
+# Constant folding over the AST. Literal subtrees are evaluated with the same rules as _evaluator and replaced by a
+# single IntegerLiteral or Boolean, if expressions with a known condition are replaced by the branch that runs.
+# Anything that would fail at runtime (division by zero, type errors) is left alone so the error still happens.
+# Nodes are rebuilt rather than changed, which also works for the read only views of _ast_arena.
+
+import functools
+import typing
+
+import _abstract_syntax_tree as _ast
+import _evaluator
+from _token import Token
+from _token import TokenType
+
+comparison_operators = frozenset(('<', '>', '==', '!='))
+
+
+def optimize(program: _ast.Program) -> tuple[_ast.Program, int]:
+    # returns the folded program and how many nodes were removed
+    optimized = _ast.Program([fold(statement) for statement in program.statements])
+    return optimized, count_nodes(program) - count_nodes(optimized)
+
+
+def count_nodes(node: _ast.BaseNode) -> int:
+    count = 0
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        count += 1
+        stack.extend(part for part in current.parts() if not isinstance(part, str))
+    return count
+
+
+def literal(value: int | bool) -> _ast.Expression:
+    if value is True or value is False:
+        return _ast.Boolean(Token(str(value).lower(), TokenType.TRUE if value else TokenType.FALSE), value)
+    return _ast.IntegerLiteral(Token(str(value), TokenType.INT), value)
+
+
+def constant(node: _ast.BaseNode | None) -> bool:
+    return isinstance(node, (_ast.IntegerLiteral, _ast.Boolean))
+
+
+def is_boolean(node: _ast.BaseNode) -> bool:
+    if isinstance(node, _ast.Boolean):
+        return True
+    elif isinstance(node, _ast.PrefixExpression):
+        return node.operator == '!'
+    return isinstance(node, _ast.InfixExpression) and node.operator in comparison_operators
+
+
+def fold(node: _ast.BaseNode) -> _ast.BaseNode:
+    # post order over an explicit stack, children are folded before the node that is rebuilt from them. long chains
+    # like 1 + 1 + ... + 1 nest as deep as they are long and would run into the recursion limit otherwise
+    folded: list[typing.Any] = []
+    stack: list[tuple[typing.Any, int]] = [(node, -1)]
+    while stack:
+        current, count = stack.pop()
+        if current is None:
+            folded.append(None)
+        elif count < 0:
+            parts = children(current)
+            stack.append((current, len(parts)))
+            stack.extend((part, -1) for part in reversed(parts))
+        else:
+            first = len(folded) - count
+            parts = folded[first:]
+            del folded[first:]
+            folded.append(rebuild(current, parts))
+    return folded[0]
+
+
+@functools.singledispatch
+def children(node: _ast.BaseNode) -> tuple[_ast.BaseNode | None, ...]:
+    # the nodes that are folded, in the order rebuild gets them back
+    return ()
+
+
+@functools.singledispatch
+def rebuild(node: _ast.BaseNode, parts: list[typing.Any]) -> _ast.BaseNode:
+    return node
+
+
+@children.register
+def _(node: _ast.LetStatement) -> tuple[_ast.BaseNode | None, ...]:
+    return (node.value,)
+
+
+@rebuild.register
+def _(node: _ast.LetStatement, parts: list[typing.Any]) -> _ast.BaseNode:
+    return _ast.LetStatement(node.token, node.name, parts[0])
+
+
+@children.register
+def _(node: _ast.ReturnStatement) -> tuple[_ast.BaseNode | None, ...]:
+    return (node.return_value,)
+
+
+@rebuild.register
+def _(node: _ast.ReturnStatement, parts: list[typing.Any]) -> _ast.BaseNode:
+    return _ast.ReturnStatement(node.token, parts[0])
+
+
+@children.register
+def _(node: _ast.ExpressionStatement) -> tuple[_ast.BaseNode | None, ...]:
+    return (node.expression,)
+
+
+@rebuild.register
+def _(node: _ast.ExpressionStatement, parts: list[typing.Any]) -> _ast.BaseNode:
+    return _ast.ExpressionStatement(node.token, parts[0])
+
+
+@children.register
+def _(node: _ast.BlockStatement) -> tuple[_ast.BaseNode | None, ...]:
+    return tuple(node.statements)
+
+
+@rebuild.register
+def _(node: _ast.BlockStatement, parts: list[typing.Any]) -> _ast.BaseNode:
+    return _ast.BlockStatement(node.token, parts)
+
+
+@children.register
+def _(node: _ast.PrefixExpression) -> tuple[_ast.BaseNode | None, ...]:
+    return (node.right,)
+
+
+@rebuild.register
+def _(node: _ast.PrefixExpression, parts: list[typing.Any]) -> _ast.BaseNode:
+    (right,) = parts
+    if node.operator == '!':
+        if constant(right):
+            return literal(right.value is False)
+        elif isinstance(right, _ast.PrefixExpression) and right.operator == '!' and is_boolean(right.right):
+            # !!x is x when x is already a boolean
+            return right.right
+    elif node.operator == '-' and isinstance(right, _ast.IntegerLiteral):
+        return literal(-right.value)
+    return _ast.PrefixExpression(node.token, node.operator, right)
+
+
+@children.register
+def _(node: _ast.InfixExpression) -> tuple[_ast.BaseNode | None, ...]:
+    return (node.left, node.right)
+
+
+@rebuild.register
+def _(node: _ast.InfixExpression, parts: list[typing.Any]) -> _ast.BaseNode:
+    left, right = parts
+    operator = node.operator
+    if isinstance(left, _ast.IntegerLiteral) and isinstance(right, _ast.IntegerLiteral):
+        integer_operator = _evaluator.integer_operators.get(operator)
+        if integer_operator is not None and not (operator == '/' and right.value == 0):
+            return literal(integer_operator(left.value, right.value))
+    elif constant(left) and constant(right) and operator in ('==', '!='):
+        # mixed or boolean operands compare by identity in the evaluator
+        equal = type(left.value) is type(right.value) and left.value == right.value
+        return literal(equal if operator == '==' else not equal)
+    return _ast.InfixExpression(node.token, left, operator, right)
+
+
+@children.register
+def _(node: _ast.IfExpression) -> tuple[_ast.BaseNode | None, ...]:
+    return (node.condition, node.consquence, node.alternative)
+
+
+@rebuild.register
+def _(node: _ast.IfExpression, parts: list[typing.Any]) -> _ast.BaseNode:
+    condition, consequence, alternative = parts
+    if constant(condition):
+        branch = consequence if condition.value is not False else alternative
+        if branch is not None:
+            return _unwrap(branch)
+    return _ast.IfExpression(node.token, condition, consequence, alternative)
+
+
+@children.register
+def _(node: _ast.FunctionLiteral) -> tuple[_ast.BaseNode | None, ...]:
+    return (node.body,)
+
+
+@rebuild.register
+def _(node: _ast.FunctionLiteral, parts: list[typing.Any]) -> _ast.BaseNode:
+    return _ast.FunctionLiteral(node.token, node.parameters, parts[0])
+
+
+@children.register
+def _(node: _ast.CallExpression) -> tuple[_ast.BaseNode | None, ...]:
+    return (node.function, *node.arguments)
+
+
+@rebuild.register
+def _(node: _ast.CallExpression, parts: list[typing.Any]) -> _ast.BaseNode:
+    return _ast.CallExpression(node.token, parts[0], parts[1:])
+
+
+def _unwrap(block: _ast.BlockStatement) -> _ast.BaseNode:
+    # a branch of a single expression becomes that expression, anything else stays a block used as a value
+    statements = block.statements
+    if len(statements) == 1 and isinstance(statements[0], _ast.ExpressionStatement) and statements[0].expression:
+        return statements[0].expression
+    return block
@@ -3,18 +3,31 @@
 # hierarchical structure – giving a structural representation of the input, checking for
 # correct syntax in the process. […] The parser is often preceded by a separate lexical
 # analyser, which creates tokens from the sequence of input characters
-
+#
+# Threads: a Parser, its lexer and its Tracer hold the state of one parse and belong to one thread at a time, parse
+# with a parser per thread (Parser(source, **parser.options) makes one with the same options). What parsers share is
+# immutable (dispatch tables, precedences) or locked: SymbolTable interning, the bodies of LazyBlockStatement and
+# _cache.ParseCache. Programs can be read from many threads, including lazy ones. Sinks get events from the thread
+# that parses and have to be thread-safe themselves when several parsers share one.
+
+import dataclasses
 import enum
 import logging
+import threading
+import time
 import types
 import typing
 
 import typing_extensions
 
 import _abstract_syntax_tree as _ast
+import _ast_arena
 import _lexer
 import _token
 
+if typing.TYPE_CHECKING:
+    import _cache
+
 log = logging.getLogger(__name__)
 trace_log = logging.getLogger('tracelogs')
 
@@ -22,25 +35,82 @@ trace_log = logging.getLogger('tracelogs')
 trace_log.setLevel(logging.CRITICAL + 1)
 
 
+@dataclasses.dataclass
+class RuleStats:
+    rule: str
+    calls: int = 0
+    # inclusive time, only the outermost call of a recursive rule is counted
+    cumulative: float = 0.0
+    active: int = dataclasses.field(default=0, repr=False, compare=False)
+
+
 class Tracer:
-    def __init__(self):
+    def __init__(self, profile: bool = False):
         self.indent_level = 0
+        self.profile = profile
+        self.stats: dict[str, RuleStats] = {}
 
     def trace(self, func):
+        rule = func.__name__
+        stats = self.stats.setdefault(rule, RuleStats(rule))
+        profile = self.profile
+
         def wrapper(parser, *args, **kwargs):
-            trace_log.debug('    ' * self.indent_level + f'BEGIN {func.__name__}')
+            trace_log.debug('%sBEGIN %s', '    ' * self.indent_level, rule)
             self.indent_level += 1
-            result = func(parser, *args, **kwargs)
-            self.indent_level -= 1
-            trace_log.debug('    ' * self.indent_level + f'END {func.__name__}')
-            return result
+            if profile:
+                stats.calls += 1
+                stats.active += 1
+                start = time.perf_counter()
+            try:
+                return func(parser, *args, **kwargs)
+            finally:
+                if profile:
+                    stats.active -= 1
+                    if not stats.active:
+                        stats.cumulative += time.perf_counter() - start
+                self.indent_level -= 1
+                trace_log.debug('%sEND %s', '    ' * self.indent_level, rule)
 
         return wrapper
 
+    def report(self) -> list[RuleStats]:
+        stats = [stats for stats in self.stats.values() if stats.calls]
+        return sorted(stats, key=lambda stats: stats.cumulative, reverse=True)
+
     def reset(self):
         self.indent_level = 0
 
 
+@dataclasses.dataclass(frozen=True, slots=True)
+class ParseEvent:
+    rule: str
+    token_type: _token.TokenType
+    # position of the token in the token stream
+    offset: int
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class ParseError:
+    message: str
+    # the unexpected token and its position in the token stream
+    token_type: _token.TokenType
+    offset: int
+    # and in the source, 0 when the lexer has no source positions
+    line: int
+    column: int
+
+
+def log_sink(event: ParseEvent):
+    log.debug('(%s) - %s at token %d', event.rule, event.token_type, event.offset)
+
+
+def grammar_rule(func):
+    # only marks the method, Parser wraps marked methods with a Tracer when it is built with trace or profile
+    func.grammar_rule = True
+    return func
+
+
 class Precedence(enum.IntEnum):
     LOWEST = 1
     # ==
@@ -62,60 +132,263 @@ precendence_map = types.MappingProxyType(
         _token.TokenType.MINUS: Precedence.SUM,
         _token.TokenType.SLASH: Precedence.PRODUCT,
         _token.TokenType.ASTERISK: Precedence.PRODUCT,
+        _token.TokenType.LPAREN: Precedence.CALL,
     }
 )
 
+# the hot paths index flat tables by token_type.code instead of hashing token types
+precedences: tuple[Precedence, ...] = tuple(
+    precendence_map.get(token_type, Precedence.LOWEST) for token_type in _token.token_types
+)
 
-class Parser:
-    tracer = Tracer()
 
-    def __init__(self, lexer: _lexer.Lexer):
+def dispatch_table(functions: typing.Mapping[_token.TokenType, typing.Callable]) -> tuple[typing.Callable | None, ...]:
+    return tuple(functions.get(token_type) for token_type in _token.token_types)
+
+
+class Frame(enum.IntEnum):
+    # the steps of the iterative mode. STATEMENT, BLOCK, EXPRESSION and LOOP are what the loop does next, the other
+    # members (and BLOCK) are frames on the stack that wait for the value of a nested rule
+    DONE = 0
+    STATEMENT = 1
+    BLOCK = 2
+    EXPRESSION = 3
+    LOOP = 4
+    INFIX = 5
+    PREFIX = 6
+    GROUP = 7
+    IF_CONDITION = 8
+    IF_CONSEQUENCE = 9
+    IF_ALTERNATIVE = 10
+    FUNCTION = 11
+    ARGUMENT = 12
+    LET = 13
+    RETURN = 14
+    EXPRESSION_STATEMENT = 15
+
+
+@dataclasses.dataclass
+class LazyTokens:
+    # the tokens of the lazy blocks of one parse, in one list. closing maps the index of every `{` to the index of its
+    # `}` (or of the EOF or ILLEGAL token the block runs into), nested blocks are ranges of the same list
+    lexer: typing.Any
+    options: dict
+    errors: list[ParseError]
+    tokens: list[_token.Token] = dataclasses.field(default_factory=list)
+    closing: dict[int, int] = dataclasses.field(default_factory=dict)
+
+
+class LazyBlockStatement(_ast.BlockStatement):
+    # a block of a lazy parser. the body is parsed from the recorded tokens the first time statements is read, which
+    # the traversals of the tree do as well. syntax errors are raised then, or with recover added to the errors of the
+    # parser that recorded the block, in the order the blocks are parsed
+    def __init__(self, token: _token.Token, recording: LazyTokens, start: int, offset: int):
+        self.token = token
+        # threads reading statements at the same time wait for one parse of the body
+        self._lock = threading.Lock()
+        self._recording = recording
+        # index of the `{` in recording.tokens and its position in the token stream of the program
+        self._start = start
+        self._offset = offset
+        self._statements: list[_ast.Statement] | None = None
+
+    @property
+    def parsed(self) -> bool:
+        return self._statements is not None
+
+    @property
+    def statements(self) -> list[_ast.Statement]:
+        if self._statements is None:
+            with self._lock:
+                if self._statements is None:
+                    self._parse()
+        return self._statements
+
+    def _parse(self):
+        recording = self._recording
+        stop = recording.closing[self._start] + 1
+        lexer = _lexer.ReplayLexer(recording.tokens, recording.lexer, self._start, stop)
+        parser = Parser(lexer, **recording.options)
+        # events and errors get the offsets of the whole program, nested blocks are ranges of the same recording
+        parser._offset += self._offset
+        parser.errors = recording.errors
+        parser._recording = recording
+        parser._replaying = True
+        if recording.options['iterative']:
+            block = parser._parse_iteratively(Frame.BLOCK)
+        else:
+            block = Parser._parse_block_statement(parser)
+        self._statements, self._recording = block.statements, None
+
+
+class Parser:
+    # the dispatch tables hold plain functions and are built once per class, see the bottom of the module. the
+    # parser looks them up in the tuples by token type code, which follow the mappings
+    prefix_parse_functions: typing.Mapping[_token.TokenType, typing.Callable]
+    infix_parse_functions: typing.Mapping[_token.TokenType, typing.Callable]
+    _prefix_table: tuple[typing.Callable | None, ...]
+    _infix_table: tuple[typing.Callable | None, ...]
+
+    def __init__(
+        self,
+        lexer: _lexer.Lexer | _lexer.StreamLexer | _lexer.TokenBuffer | str,
+        trace: bool = False,
+        profile: bool = False,
+        sink: typing.Callable[[ParseEvent], None] | None = None,
+        arena: bool = False,
+        iterative: bool = False,
+        recover: bool = False,
+        symbols: _token.SymbolTable | None = None,
+        lazy: bool = False,
+    ):
+        # the constructor arguments besides the lexer, for parsers of other threads
+        self.options = {
+            'trace': trace,
+            'profile': profile,
+            'sink': sink,
+            'arena': arena,
+            'iterative': iterative,
+            'recover': recover,
+            'symbols': symbols,
+            'lazy': lazy,
+        }
+        # str sources are lexed with this symbol table, so identifiers of all programs share their ids
+        self.symbols = symbols
+        # with recover syntax errors are collected in errors instead of raised, see _synchronize
+        self.recover = recover
+        self.errors: list[ParseError] = []
+        # with arena the nodes are rows of an _ast_arena.Arena and parse_program returns a view of the root
+        self._use_arena = arena
+        # parse events are only built when somebody listens, the level check happens once per parser
+        if sink is None and log.isEnabledFor(logging.DEBUG):
+            sink = log_sink
+        self._sink = sink
+
+        # without tracing the plain methods are used, the wrappers are only bound on this instance
+        self.tracer = None
+        if trace or profile:
+            self.tracer = Tracer(profile=profile)
+            traced = {rule: self.tracer.trace(getattr(type(self), rule)) for rule in grammar_rules}
+            for rule, wrapper in traced.items():
+                setattr(self, rule, types.MethodType(wrapper, self))
+            self.prefix_parse_functions = types.MappingProxyType(
+                {token_type: traced.get(func.__name__, func) for token_type, func in self.prefix_parse_functions.items()}
+            )
+            self.infix_parse_functions = types.MappingProxyType(
+                {token_type: traced.get(func.__name__, func) for token_type, func in self.infix_parse_functions.items()}
+            )
+            self._prefix_table = dispatch_table(self.prefix_parse_functions)
+            self._infix_table = dispatch_table(self.infix_parse_functions)
+
+        # the iterative mode keeps nested rules on an explicit stack, nesting depth is not limited by the recursion
+        # limit. its rules are not method calls, so there is nothing to trace
+        if iterative:
+            if self.tracer:
+                raise ValueError('iterative parsing cannot be traced or profiled')
+            self._parse_statement = self._parse_statement_iteratively
+            self._parse_block_statement = self._parse_block_statement_iteratively
+            self._parse_expression = self._parse_expression_iteratively
+
+        # with lazy the tokens of if and function blocks are only recorded, see LazyBlockStatement. the blocks parse
+        # their bodies with the options of this parser
+        self._lazy = lazy
+        if lazy:
+            if arena:
+                raise ValueError('arena parsing cannot be lazy')
+            self._lazy_options = {'sink': sink, 'iterative': iterative, 'recover': recover, 'lazy': True}
+            self._parse_block_statement = self._skip_block_statement
+
+        self.reset(lexer)
+
+    def reset(self, lexer: _lexer.Lexer | _lexer.StreamLexer | _lexer.TokenBuffer | str) -> typing_extensions.Self:
+        # lets one parser instance be reused for many programs
+        if isinstance(lexer, str):
+            lexer = _lexer.Lexer(lexer, engine='regex', symbols=self.symbols)
+        if self._use_arena:
+            if isinstance(lexer, _lexer.Lexer):
+                lexer = lexer.tokenize()
+            elif not isinstance(lexer, _lexer.TokenBuffer):
+                raise ValueError(f'arena parsing needs a Lexer or a TokenBuffer, got {type(lexer).__name__}')
+            self.arena = _ast_arena.Arena(lexer)
+            self._nodes = _ast_arena.ArenaBuilder(self.arena)
+        else:
+            self.arena = None
+            self._nodes = _ast
+        if isinstance(lexer, _lexer.TokenBuffer):
+            lexer = lexer.reader()
         self.lexer = lexer
         self._current_token = None
         self._peek_token = None
+        self._offset = -2
+        self.errors = []
+        # the tokens of the lazy blocks of this parse, a parser that parses a lazy body replays them
+        self._recording: LazyTokens | None = None
+        self._replaying = False
+        if self.tracer:
+            self.tracer.reset()
 
         self.next_token()
         self.next_token()
-        self.tracer.reset()
-
-        self._register_infix_parse_functions()
-        self._register_prefix_parse_functions()
+        return self
 
-    def _register_prefix_parse_functions(self):
-        self.prefix_parse_functions = types.MappingProxyType(
+    def parse_many(
+        self,
+        sources: typing.Iterable[_lexer.Lexer | _lexer.StreamLexer | _lexer.TokenBuffer | str],
+        cache: '_cache.ParseCache | None' = None,
+    ) -> list[_ast.Program]:
+        # only str sources can be looked up in the cache, misses are parsed with this parser
+        if cache is None:
+            return [self.reset(source).parse_program() for source in sources]
+        return [
+            cache.parse(source, self) if isinstance(source, str) else self.reset(source).parse_program()
+            for source in sources
+        ]
+
+    def __init_subclass__(cls, **kwargs):
+        # the tables hold the functions of the class, rules a subclass overrides are dispatched to in every mode
+        super().__init_subclass__(**kwargs)
+        cls._register_prefix_parse_functions()
+        cls._register_infix_parse_functions()
+
+    @classmethod
+    def _register_prefix_parse_functions(cls):
+        cls.prefix_parse_functions = types.MappingProxyType(
             {
-                _token.TokenType.IDENT: self._parse_identifier,
-                _token.TokenType.INT: self._parse_integer_literal,
-                _token.TokenType.BANG: self._parse_prefix_expression,
-                _token.TokenType.MINUS: self._parse_prefix_expression,
-                _token.TokenType.TRUE: self._parse_boolean,
-                _token.TokenType.FALSE: self._parse_boolean,
-                _token.TokenType.LPAREN: self._parse_group_expression,
-                _token.TokenType.IF: self._parse_if_expression,
-                _token.TokenType.FUNCTION: self._parse_function_literal,
-                _token.TokenType.STRING: self._parse_string_literal,
-                _token.TokenType.LBRACKET: self._parse_array_literal,
-                _token.TokenType.LBRACE: self._parse_hash_literal,
+                _token.TokenType.IDENT: cls._parse_identifier,
+                _token.TokenType.INT: cls._parse_integer_literal,
+                _token.TokenType.BANG: cls._parse_prefix_expression,
+                _token.TokenType.MINUS: cls._parse_prefix_expression,
+                _token.TokenType.TRUE: cls._parse_boolean,
+                _token.TokenType.FALSE: cls._parse_boolean,
+                _token.TokenType.LPAREN: cls._parse_group_expression,
+                _token.TokenType.IF: cls._parse_if_expression,
+                _token.TokenType.FUNCTION: cls._parse_function_literal,
+                _token.TokenType.STRING: cls._parse_string_literal,
+                _token.TokenType.LBRACKET: cls._parse_array_literal,
+                _token.TokenType.LBRACE: cls._parse_hash_literal,
             }
         )
+        cls._prefix_table = dispatch_table(cls.prefix_parse_functions)
 
-    def _register_infix_parse_functions(self):
-        self.infix_parse_functions = types.MappingProxyType(
+    @classmethod
+    def _register_infix_parse_functions(cls):
+        cls.infix_parse_functions = types.MappingProxyType(
             {
-                _token.TokenType.PLUS: self._parse_infix_expression,
-                _token.TokenType.MINUS: self._parse_infix_expression,
-                _token.TokenType.SLASH: self._parse_infix_expression,
-                _token.TokenType.ASTERISK: self._parse_infix_expression,
-                _token.TokenType.EQ: self._parse_infix_expression,
-                _token.TokenType.NOT_EQ: self._parse_infix_expression,
-                _token.TokenType.LT: self._parse_infix_expression,
-                _token.TokenType.GT: self._parse_infix_expression,
-                _token.TokenType.LPAREN: self._parse_call_expression,
-                _token.TokenType.LBRACKET: self._parse_index_expression,
+                _token.TokenType.PLUS: cls._parse_infix_expression,
+                _token.TokenType.MINUS: cls._parse_infix_expression,
+                _token.TokenType.SLASH: cls._parse_infix_expression,
+                _token.TokenType.ASTERISK: cls._parse_infix_expression,
+                _token.TokenType.EQ: cls._parse_infix_expression,
+                _token.TokenType.NOT_EQ: cls._parse_infix_expression,
+                _token.TokenType.LT: cls._parse_infix_expression,
+                _token.TokenType.GT: cls._parse_infix_expression,
+                _token.TokenType.LPAREN: cls._parse_call_expression,
+                _token.TokenType.LBRACKET: cls._parse_index_expression,
             }
         )
+        cls._infix_table = dispatch_table(cls.infix_parse_functions)
 
-    @tracer.trace
+    @grammar_rule
     def _parse_if_expression(self) -> _ast.IfExpression:
         current_token = self._current_token
         if not self._expect_peek(_token.TokenType.LPAREN):
@@ -132,22 +405,96 @@ class Parser:
             if not self._expect_peek(_token.TokenType.LBRACE):
                 return
             alternative = self._parse_block_statement()
-        return _ast.IfExpression(token=current_token, condition=condition, consequence=consequence, alternative=alternative)
+        return self._nodes.IfExpression(
+            token=current_token, condition=condition, consequence=consequence, alternative=alternative
+        )
 
-    @tracer.trace
+    @grammar_rule
     def _parse_block_statement(self) -> _ast.BlockStatement:
         current_token = self._current_token
         statements = []
         self.next_token()
 
-        while not self._current_token.token_type == _token.TokenType.RBRACE and not self._current_token.token_type == _token.TokenType.EOF:
-            statement = self._parse_statement()
-            if statement:
+        while (
+            not self._current_token.token_type == _token.TokenType.RBRACE
+            and not self._current_token.token_type == _token.TokenType.EOF
+        ):
+            try:
+                statement = self._parse_statement()
+            except SyntaxError as error:
+                if not self.recover:
+                    raise
+                self._synchronize(error, in_block=True)
+                statement = None
+            if statement is not None:
                 statements.append(statement)
             self.next_token()
-        return _ast.BlockStatement(token=current_token, statements=statements)
+        return self._nodes.BlockStatement(token=current_token, statements=statements)
+
+    def _skip_block_statement(self) -> LazyBlockStatement:
+        # moves to the matching `}` like _parse_block_statement does and records the tokens from `{` on for later.
+        # nothing in between is looked at but braces, syntax errors in the block show up once it is parsed
+        token = self._current_token
+        offset = self._offset
+        recording = self._recording
+        if recording is None:
+            recording = self._recording = LazyTokens(self.lexer, self._lazy_options, self.errors)
+        tokens, closing = recording.tokens, recording.closing
+        if self._replaying:
+            # a block nested in the body that is parsed, it was recorded with that body. jumps to its `}`
+            start = self.lexer.index - 1
+            end = closing[start]
+            self.lexer.seek(end + 1)
+            self._current_token = tokens[end]
+            self._peek_token = self.lexer.next_token()
+            self._offset += end - start
+            return LazyBlockStatement(token, recording, start, offset)
+
+        start = len(tokens)
+        tokens.append(token)
+        opened = [start]
+        next_token = self.next_token
+        LBRACE, RBRACE, EOF = _token.TokenType.LBRACE, _token.TokenType.RBRACE, _token.TokenType.EOF
+        while opened:
+            next_token()
+            current_token = self._current_token
+            index = len(tokens)
+            tokens.append(current_token)
+            token_type = current_token.token_type
+            if token_type is LBRACE:
+                opened.append(index)
+            elif token_type is RBRACE:
+                closing[opened.pop()] = index
+            elif token_type is EOF or token_type is _token.TokenType.ILLEGAL:
+                for open_index in opened:
+                    closing[open_index] = index
+                break
+        return LazyBlockStatement(token, recording, start, offset)
+
+    @grammar_rule
+    def _parse_function_literal(self) -> _ast.FunctionLiteral:
+        current_token = self._current_token
+        if not self._expect_peek(_token.TokenType.LPAREN):
+            return
+        parameters = self._parse_function_parameters()
+        if not self._expect_peek(_token.TokenType.LBRACE):
+            return
+        body = self._parse_block_statement()
+        return self._nodes.FunctionLiteral(token=current_token, parameters=parameters, body=body)
 
-    def _parse_function_literal(self): ...
+    def _parse_function_parameters(self) -> list[_ast.Identifier]:
+        parameters = []
+        if self._peek_token.token_type == _token.TokenType.RPAREN:
+            self.next_token()
+            return parameters
+        self._expect_peek(_token.TokenType.IDENT)
+        parameters.append(self._nodes.Identifier(token=self._current_token, value=self._current_token.literal))
+        while self._peek_token.token_type == _token.TokenType.COMMA:
+            self.next_token()
+            self._expect_peek(_token.TokenType.IDENT)
+            parameters.append(self._nodes.Identifier(token=self._current_token, value=self._current_token.literal))
+        self._expect_peek(_token.TokenType.RPAREN)
+        return parameters
 
     def _parse_string_literal(self): ...
 
@@ -155,37 +502,58 @@ class Parser:
 
     def _parse_hash_literal(self): ...
 
-    def _parse_call_expression(sefl): ...
+    @grammar_rule
+    def _parse_call_expression(self, function: _ast.Expression) -> _ast.CallExpression:
+        current_token = self._current_token
+        return self._nodes.CallExpression(token=current_token, function=function, arguments=self._parse_call_arguments())
+
+    def _parse_call_arguments(self) -> list[_ast.Expression]:
+        arguments = []
+        if self._peek_token.token_type == _token.TokenType.RPAREN:
+            self.next_token()
+            return arguments
+        self.next_token()
+        arguments.append(self._parse_expression(Precedence.LOWEST))
+        while self._peek_token.token_type == _token.TokenType.COMMA:
+            self.next_token()
+            self.next_token()
+            arguments.append(self._parse_expression(Precedence.LOWEST))
+        self._expect_peek(_token.TokenType.RPAREN)
+        return arguments
 
     def _parse_index_expression(self): ...
 
-    @tracer.trace
+    @grammar_rule
     def _parse_group_expression(self) -> _ast.Expression | None:
         self.next_token()
         exp = self._parse_expression(Precedence.LOWEST)
-        if not self._peek_token.token_type == _token.TokenType.RPAREN:
+        if not self._expect_peek(_token.TokenType.RPAREN):
             return None
         return exp
 
-    @tracer.trace
+    @grammar_rule
     def _parse_boolean(self) -> _ast.Boolean:
-        return _ast.Boolean(token=self._current_token, value=self._current_token.token_type == _token.TokenType.TRUE)
+        return self._nodes.Boolean(
+            token=self._current_token, value=self._current_token.token_type == _token.TokenType.TRUE
+        )
 
-    @tracer.trace
+    @grammar_rule
     def _parse_integer_literal(self) -> _ast.IntegerLiteral:
-        return _ast.IntegerLiteral(token=self._current_token, value=int(self._current_token.literal))
+        return self._nodes.IntegerLiteral(token=self._current_token, value=int(self._current_token.literal))
 
-    @tracer.trace
+    @grammar_rule
     def _parse_prefix_expression(self) -> _ast.PrefixExpression:
         current_token = self._current_token
-        return _ast.PrefixExpression(current_token, operator=current_token.literal, right=self.next_token()._parse_expression(Precedence.PREFIX))
+        return self._nodes.PrefixExpression(
+            current_token, operator=current_token.literal, right=self.next_token()._parse_expression(Precedence.PREFIX)
+        )
 
-    @tracer.trace
+    @grammar_rule
     def _parse_infix_expression(self, left: _ast.Expression):
         current_token = self._current_token
-        precedence = precendence_map.get(self._current_token.token_type) or Precedence.LOWEST
+        precedence = precedences[current_token.token_type.code]
 
-        return _ast.InfixExpression(
+        return self._nodes.InfixExpression(
             token=current_token,
             operator=current_token.literal,
             left=left,
@@ -195,87 +563,389 @@ class Parser:
     def next_token(self) -> typing_extensions.Self:
         self._current_token = self._peek_token
         self._peek_token = self.lexer.next_token()
+        self._offset += 1
         return self
 
     def parse_program(self) -> typing.Optional[_ast.Program]:
-        log.debug(f'source code - {self.lexer.source_code}')
-        trace_log.debug(f'source code - {self.lexer.source_code}')
-        program = _ast.Program([])
+        # a StreamLexer never holds the whole source
+        source_code = getattr(self.lexer, 'source_code', '<stream>')
+        log.debug('source code - %s', source_code)
+        trace_log.debug('source code - %s', source_code)
+        return self._nodes.Program(list(self._iter_statements()))
+
+    def iter_statements(self) -> typing.Iterator[_ast.Statement]:
+        # yields every top level statement once it is complete, before the rest of the source is lexed. the parser
+        # only keeps the current and the peek token, with a StreamLexer neither the source nor the program have to
+        # fit in memory. with recover the errors are in errors as soon as the broken statement is skipped
+        if self._use_arena:
+            raise ValueError('arena parsing builds the whole program, it cannot yield statements')
+        return self._iter_statements()
+
+    def _iter_statements(self) -> typing.Iterator[_ast.Statement]:
         while self._current_token.token_type not in (_token.TokenType.EOF, _token.TokenType.ILLEGAL):
-            statement = self._parse_statement()
-            if statement:
-                program.statements.append(statement)
+            try:
+                statement = self._parse_statement()
+            except SyntaxError as error:
+                if not self.recover:
+                    raise
+                self._synchronize(error, in_block=False)
+                statement = None
+            # yielded before moving on, a statement only waits for the one token behind it that the parser peeks at
+            if statement is not None:
+                yield statement
             self.next_token()
-        return program
 
-    @tracer.trace
+    def _synchronize(self, error: SyntaxError, in_block: bool):
+        # records the error at the unexpected peek token and skips the rest of the broken statement, up to the next
+        # `;` outside of nested braces or up to the `}` of the enclosing block. the caller's next_token moves past
+        # the `;` or onto the `}`, the broken statement is left out of the program
+        self.errors.append(
+            ParseError(error.msg, self._peek_token.token_type, self._offset + 1, error.lineno or 0, error.offset or 0)
+        )
+        depth = 0
+        while (token_type := self._peek_token.token_type) not in (_token.TokenType.EOF, _token.TokenType.ILLEGAL):
+            if token_type is _token.TokenType.LBRACE:
+                depth += 1
+            elif token_type is _token.TokenType.RBRACE:
+                if depth:
+                    depth -= 1
+                elif in_block:
+                    return
+            elif token_type is _token.TokenType.SEMICOLON and not depth:
+                self.next_token()
+                return
+            self.next_token()
+
+    @grammar_rule
     def _parse_statement(self) -> typing.Optional[_ast.Statement]:
-        log.debug(f'(parse statement) - {self._current_token=}')
-        match self._current_token.token_type:
-            case _token.TokenType.LET:
-                return self._parse_let_statement()
-            case _token.TokenType.RETURN:
-                return self._parse_return_statement()
-            case _:
-                return self._parse_expression_statement()
-
-    @tracer.trace
+        token_type = self._current_token.token_type
+        if self._sink:
+            self._sink(ParseEvent('_parse_statement', token_type, self._offset))
+        if token_type is _token.TokenType.LET:
+            return self._parse_let_statement()
+        elif token_type is _token.TokenType.RETURN:
+            return self._parse_return_statement()
+        return self._parse_expression_statement()
+
+    @grammar_rule
     def _parse_expression(self, precendence: Precedence) -> _ast.Expression:
-        prefix = self.prefix_parse_functions.get(self._current_token.token_type)
-        log.debug(f'(parse expression) - {self._current_token=}')
+        token_type = self._current_token.token_type
+        prefix = self._prefix_table[token_type.code]
+        if self._sink:
+            self._sink(ParseEvent('_parse_expression', token_type, self._offset))
         if not prefix:
+            self._no_prefix_parse_function()
             return None
-        left_exp = prefix()
+        left_exp = prefix(self)
 
-        while self._peek_token.token_type != _token.TokenType.SEMICOLON and precendence < precendence_map.get(self._peek_token.token_type, Precedence.LOWEST):
-            infix = self.infix_parse_functions.get(self._peek_token.token_type)
-            log.debug(f'(parse expression) - {self._peek_token=}')
+        infix_table, semicolon = self._infix_table, _token.TokenType.SEMICOLON
+        while (peek_type := self._peek_token.token_type) is not semicolon and precendence < precedences[peek_type.code]:
+            infix = infix_table[peek_type.code]
+            if self._sink:
+                self._sink(ParseEvent('_parse_expression', peek_type, self._offset + 1))
             if not infix:
                 return left_exp
             self.next_token()
-            left_exp = infix(left_exp)
+            left_exp = infix(self, left_exp)
         return left_exp
 
-    @tracer.trace
+    @grammar_rule
     def _parse_identifier(self) -> _ast.Expression:
-        return _ast.Identifier(self._current_token, value=self._current_token.literal)
+        return self._nodes.Identifier(self._current_token, value=self._current_token.literal)
 
-    @tracer.trace
+    @grammar_rule
     def _parse_expression_statement(self) -> _ast.Expression:
-        log.debug(f'(parse expression statement) - {self._current_token=}')
-        statement = _ast.ExpressionStatement(token=self._current_token, expression=self._parse_expression(Precedence.LOWEST))
+        if self._sink:
+            self._sink(ParseEvent('_parse_expression_statement', self._current_token.token_type, self._offset))
+        statement = self._nodes.ExpressionStatement(
+            token=self._current_token, expression=self._parse_expression(Precedence.LOWEST)
+        )
         if self._peek_token.token_type == _token.TokenType.SEMICOLON:
             self.next_token()
         return statement
 
-    @tracer.trace
+    @grammar_rule
     def _parse_return_statement(self) -> _ast.ReturnStatement:
         token = self._current_token
 
-        return_value = self.next_token()._parse_expression_statement()
+        return_value = self.next_token()._parse_expression(Precedence.LOWEST)
 
         if self._peek_token.token_type == _token.TokenType.SEMICOLON:
             self.next_token()
-        return _ast.ReturnStatement(token, return_value)
+        return self._nodes.ReturnStatement(token, return_value)
+
+    def _parse_statement_iteratively(self) -> typing.Optional[_ast.Statement]:
+        return self._parse_iteratively(Frame.STATEMENT)
+
+    def _parse_block_statement_iteratively(self) -> _ast.BlockStatement:
+        return self._parse_iteratively(Frame.BLOCK)
+
+    def _parse_expression_iteratively(self, precendence: Precedence) -> _ast.Expression:
+        return self._parse_iteratively(Frame.EXPRESSION, precendence)
+
+    def _parse_iteratively(self, action: Frame, precedence: Precedence = Precedence.LOWEST):
+        stack: list[tuple] = [(Frame.DONE,)]
+        value = None
+        while True:
+            try:
+                return self._run_frames(stack, action, precedence, value)
+            except SyntaxError as error:
+                # drops the frames of the broken statement and goes on with the block it is in, like the block rule
+                # does in the recursive mode. outside of blocks parse_program synchronizes
+                if not self.recover:
+                    raise
+                while stack[-1][0] is not Frame.BLOCK and stack[-1][0] is not Frame.DONE:
+                    stack.pop()
+                if stack[-1][0] is Frame.DONE:
+                    raise
+                self._synchronize(error, in_block=True)
+                action, value = None, None
+
+    def _run_frames(self, stack: list[tuple], action: Frame | None, precedence: Precedence, value):
+        # the recursive rules as one loop. a rule that needs a nested statement, block or expression pushes a frame
+        # with what it has so far and starts the nested rule, whose value is handed to the frame on top of the stack
+        # once it is complete. frames of operands keep the precedence of the expression they are part of, which goes
+        # on with its infix loop (LOOP) behind them. nodes are built and tokens consumed in the same order as by the
+        # recursive rules. the dispatch tables are used as they are, only the nesting rules of Parser are inlined
+        cls = type(self)
+        parse_prefix_expression, parse_group_expression = cls._parse_prefix_expression, cls._parse_group_expression
+        parse_if_expression, parse_function_literal = cls._parse_if_expression, cls._parse_function_literal
+        parse_infix_expression, parse_call_expression = cls._parse_infix_expression, cls._parse_call_expression
+        STATEMENT, BLOCK, EXPRESSION, LOOP = Frame.STATEMENT, Frame.BLOCK, Frame.EXPRESSION, Frame.LOOP
+        INFIX, PREFIX, GROUP, ARGUMENT = Frame.INFIX, Frame.PREFIX, Frame.GROUP, Frame.ARGUMENT
+        IF_CONDITION, IF_CONSEQUENCE, IF_ALTERNATIVE = Frame.IF_CONDITION, Frame.IF_CONSEQUENCE, Frame.IF_ALTERNATIVE
+        FUNCTION, LET, RETURN, EXPRESSION_STATEMENT = Frame.FUNCTION, Frame.LET, Frame.RETURN, Frame.EXPRESSION_STATEMENT
+        LOWEST = Precedence.LOWEST
+        TokenType = _token.TokenType
+        SEMICOLON, LPAREN, RPAREN = TokenType.SEMICOLON, TokenType.LPAREN, TokenType.RPAREN
+        nodes = self._nodes
+        sink = self._sink
+        lazy = self._lazy
+        next_token = self.next_token
+        prefix_table = self._prefix_table
+        infix_table = self._infix_table
+        while True:
+            if action is LOOP:
+                # value is the left operand of the expression at precedence
+                peek_type = self._peek_token.token_type
+                peek_code = peek_type.code
+                peek_precedence = precedences[peek_code]
+                if peek_type is not SEMICOLON and precedence < peek_precedence:
+                    infix = infix_table[peek_code]
+                    if sink:
+                        sink(ParseEvent('_parse_expression', peek_type, self._offset + 1))
+                    if infix is not None:
+                        next_token()
+                        token = self._current_token
+                        if infix is parse_infix_expression:
+                            stack.append((INFIX, token, precedence, value))
+                            next_token()
+                            action, precedence = EXPRESSION, peek_precedence
+                        elif infix is parse_call_expression:
+                            if self._peek_token.token_type is RPAREN:
+                                next_token()
+                                value = nodes.CallExpression(token=token, function=value, arguments=[])
+                            else:
+                                stack.append((ARGUMENT, token, precedence, value, []))
+                                next_token()
+                                action, precedence = EXPRESSION, LOWEST
+                        else:
+                            value = infix(self, value)
+                        continue
+
+            elif action is EXPRESSION:
+                token = self._current_token
+                token_type = token.token_type
+                prefix = prefix_table[token_type.code]
+                if sink:
+                    sink(ParseEvent('_parse_expression', token_type, self._offset))
+                if prefix is None:
+                    # an expression without prefix rule ends right away, without infix loop
+                    self._no_prefix_parse_function()
+                    value = None
+                elif prefix is parse_prefix_expression:
+                    stack.append((PREFIX, token, precedence))
+                    next_token()
+                    precedence = Precedence.PREFIX
+                    continue
+                elif prefix is parse_group_expression:
+                    stack.append((GROUP, precedence))
+                    next_token()
+                    precedence = LOWEST
+                    continue
+                elif prefix is parse_if_expression:
+                    stack.append((IF_CONDITION, token, precedence))
+                    self._expect_peek(LPAREN)
+                    next_token()
+                    precedence = LOWEST
+                    continue
+                elif prefix is parse_function_literal:
+                    self._expect_peek(LPAREN)
+                    stack.append((FUNCTION, token, precedence, self._parse_function_parameters()))
+                    self._expect_peek(TokenType.LBRACE)
+                    action = BLOCK
+                    continue
+                else:
+                    # literals, identifiers and rules of subclasses are called
+                    value = prefix(self)
+                    action = LOOP
+                    continue
+
+            elif action is STATEMENT:
+                token = self._current_token
+                token_type = token.token_type
+                if sink:
+                    sink(ParseEvent('_parse_statement', token_type, self._offset))
+                if token_type is TokenType.LET:
+                    self._expect_peek(TokenType.IDENT)
+                    name = nodes.Identifier(token=self._current_token, value=self._current_token.literal)
+                    self._expect_peek(TokenType.ASSIGN)
+                    next_token()
+                    stack.append((LET, token, name))
+                elif token_type is TokenType.RETURN:
+                    next_token()
+                    stack.append((RETURN, token))
+                else:
+                    if sink:
+                        sink(ParseEvent('_parse_expression_statement', token_type, self._offset))
+                    stack.append((EXPRESSION_STATEMENT, token))
+                action, precedence = EXPRESSION, LOWEST
+                continue
+
+            elif action is BLOCK:
+                token = self._current_token
+                if lazy and len(stack) > 1:
+                    # a nested block, the block the loop started with is the body of a lazy block
+                    value = self._skip_block_statement()
+                else:
+                    next_token()
+                    token_type = self._current_token.token_type
+                    if token_type is TokenType.RBRACE or token_type is TokenType.EOF:
+                        value = nodes.BlockStatement(token=token, statements=[])
+                    else:
+                        stack.append((BLOCK, token, []))
+                        action = STATEMENT
+                        continue
+
+            # value is complete
+            frame = stack.pop()
+            kind = frame[0]
+            action = LOOP
+            if kind is INFIX:
+                token = frame[1]
+                precedence = frame[2]
+                value = nodes.InfixExpression(token=token, operator=token.literal, left=frame[3], right=value)
+            elif kind is EXPRESSION_STATEMENT:
+                action = None
+                value = nodes.ExpressionStatement(token=frame[1], expression=value)
+                if self._peek_token.token_type is SEMICOLON:
+                    next_token()
+            elif kind is BLOCK:
+                if value is not None:
+                    frame[2].append(value)
+                next_token()
+                token_type = self._current_token.token_type
+                if token_type is TokenType.RBRACE or token_type is TokenType.EOF:
+                    action = None
+                    value = nodes.BlockStatement(token=frame[1], statements=frame[2])
+                else:
+                    stack.append(frame)
+                    action = STATEMENT
+            elif kind is LET:
+                action = None
+                if self._peek_token.token_type is SEMICOLON:
+                    next_token()
+                value = nodes.LetStatement(token=frame[1], name=frame[2], value=value)
+            elif kind is RETURN:
+                action = None
+                if self._peek_token.token_type is SEMICOLON:
+                    next_token()
+                value = nodes.ReturnStatement(frame[1], value)
+            elif kind is PREFIX:
+                token = frame[1]
+                precedence = frame[2]
+                value = nodes.PrefixExpression(token, operator=token.literal, right=value)
+            elif kind is GROUP:
+                precedence = frame[1]
+                self._expect_peek(RPAREN)
+            elif kind is ARGUMENT:
+                frame[4].append(value)
+                if self._peek_token.token_type is TokenType.COMMA:
+                    next_token()
+                    next_token()
+                    stack.append(frame)
+                    action, precedence = EXPRESSION, LOWEST
+                else:
+                    self._expect_peek(RPAREN)
+                    precedence = frame[2]
+                    value = nodes.CallExpression(token=frame[1], function=frame[3], arguments=frame[4])
+            elif kind is IF_CONDITION:
+                self._expect_peek(RPAREN)
+                self._expect_peek(TokenType.LBRACE)
+                stack.append((IF_CONSEQUENCE, frame[1], frame[2], value))
+                action = BLOCK
+            elif kind is IF_CONSEQUENCE:
+                if self._peek_token.token_type is TokenType.ELSE:
+                    next_token()
+                    self._expect_peek(TokenType.LBRACE)
+                    stack.append((IF_ALTERNATIVE, *frame[1:], value))
+                    action = BLOCK
+                else:
+                    precedence = frame[2]
+                    value = nodes.IfExpression(token=frame[1], condition=frame[3], consequence=value, alternative=None)
+            elif kind is IF_ALTERNATIVE:
+                precedence = frame[2]
+                value = nodes.IfExpression(token=frame[1], condition=frame[3], consequence=frame[4], alternative=value)
+            elif kind is FUNCTION:
+                precedence = frame[2]
+                value = nodes.FunctionLiteral(token=frame[1], parameters=frame[3], body=value)
+            else:
+                return value
 
     def _expect_peek(self, token_type: _token.TokenType) -> bool | None:
         if self._peek_token.token_type == token_type:
             self.next_token()
             return True
         else:
-            raise SyntaxError(f'Unexpected {token_type}')
-
-    @tracer.trace
+            line, column = self.position(self._peek_token)
+            raise SyntaxError(f'Unexpected {token_type}', (None, line, column, None))
+
+    def _no_prefix_parse_function(self):
+        # the current token can not start an expression, the expression is left out of the tree. with recover this
+        # is an error at the token, like the noPrefixParseFnError of the book, otherwise the partial tree is kept
+        if self.recover:
+            token = self._current_token
+            line, column = self.position(token)
+            message = f'No prefix parse function for {token.token_type}'
+            self.errors.append(ParseError(message, token.token_type, self._offset, line, column))
+
+    def position(self, token: _token.Token | _lexer.BufferedToken) -> tuple[int, int]:
+        # line and column of a token read by this parser, the line index of the source is built the first time. 0, 0
+        # for tokens without start and lexers without source positions
+        line_index = getattr(self.lexer, 'line_index', None)
+        if line_index is None or token.start < 0:
+            return 0, 0
+        return line_index.position(token.start)
+
+    @grammar_rule
     def _parse_let_statement(self) -> typing.Optional[_ast.LetStatement]:
         token = self._current_token
 
         if not self._expect_peek(_token.TokenType.IDENT):
             return None
 
-        identifier = _ast.Identifier(token=self._current_token, value=self._current_token.literal)
+        identifier = self._nodes.Identifier(token=self._current_token, value=self._current_token.literal)
 
-        # skip the expression for now
-        while self._current_token.token_type != _token.TokenType.SEMICOLON:
+        if not self._expect_peek(_token.TokenType.ASSIGN):
+            return None
+        value = self.next_token()._parse_expression(Precedence.LOWEST)
+
+        if self._peek_token.token_type == _token.TokenType.SEMICOLON:
             self.next_token()
-        statement = _ast.LetStatement(token=token, name=identifier, value=None)
-        return statement
+        return self._nodes.LetStatement(token=token, name=identifier, value=value)
+
+
+grammar_rules = tuple(name for name, attribute in vars(Parser).items() if getattr(attribute, 'grammar_rule', False))
+
+Parser._register_prefix_parse_functions()
+Parser._register_infix_parse_functions()
@@ -1,5 +1,6 @@
 import dataclasses
 import enum
+import threading
 import types
 
 
@@ -48,6 +49,18 @@ class TokenType(enum.Enum):
     ELSE = 'ELSE'
     RETURN = 'RETURN'
 
+    # set below
+    code: int
+
+
+# dense codes used by the array backed token buffer and the dispatch tables of the parser. a member is hashed in
+# python code, token_type.code gets the code without a dict lookup
+token_types: tuple[TokenType, ...] = tuple(TokenType)
+token_type_codes: dict[TokenType, int] = types.MappingProxyType(
+    {token_type: code for code, token_type in enumerate(token_types)}
+)
+for _code, _token_type in enumerate(token_types):
+    _token_type.code = _code
 
 keyword_map: dict[str, TokenType] = types.MappingProxyType(
     {
@@ -62,7 +75,57 @@ keyword_map: dict[str, TokenType] = types.MappingProxyType(
 )
 
 
-@dataclasses.dataclass(frozen=True)
+# the symbol of tokens that are not identifiers
+NO_SYMBOL = -1
+# the start of tokens that were not lexed from a source
+NO_POSITION = -1
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
 class Token:
     literal: str
     token_type: TokenType
+    # the id of an identifier in the SymbolTable of its lexer, two tokens are equal whatever their symbols
+    symbol: int = dataclasses.field(default=NO_SYMBOL, compare=False)
+    # offset of the first character in the source, line and column are looked up when needed, see _lexer.LineIndex
+    start: int = dataclasses.field(default=NO_POSITION, compare=False)
+
+
+class SymbolTable:
+    # interns words, every spelling is stored once and gets a dense id in the order it is first seen. the keywords
+    # are added up front, so one lookup gives both the token type of a word and the id of an identifier. lexers in
+    # several threads can share a table, new words are added under a lock and known words are looked up without it
+    def __init__(self):
+        self.names: list[str] = []
+        self.token_types: list[TokenType] = []
+        self.ids: dict[str, int] = {}
+        self._lock = threading.Lock()
+        for keyword, token_type in keyword_map.items():
+            self._add(keyword, token_type)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def intern(self, name: str) -> int:
+        symbol = self.ids.get(name)
+        if symbol is None:
+            with self._lock:
+                # another thread may have added it meanwhile
+                symbol = self.ids.get(name)
+                if symbol is None:
+                    symbol = self._add(name, TokenType.IDENT)
+        return symbol
+
+    def _add(self, name: str, token_type: TokenType) -> int:
+        # ids is written last, a word found there has its name and token type in place
+        symbol = len(self.names)
+        self.names.append(name)
+        self.token_types.append(token_type)
+        self.ids[name] = symbol
+        return symbol
+
+    def name(self, symbol: int) -> str:
+        return self.names[symbol]
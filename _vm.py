@@ -0,0 +1,226 @@
+# Stack based virtual machine for the bytecode of _compiler. Values are the same plain python values the closure
+# evaluator uses, run() keeps the hot state in locals and dispatches on the opcode bytes with one if/elif chain.
+
+import _code
+import _compiler
+import _evaluator
+from _evaluator import EvaluationError
+from _evaluator import type_name
+
+GLOBALS_SIZE = 1 << 16
+MAX_FRAMES = 1 << 16
+
+CONSTANT = _code.Opcode.CONSTANT.value
+POP = _code.Opcode.POP.value
+ADD = _code.Opcode.ADD.value
+SUB = _code.Opcode.SUB.value
+MUL = _code.Opcode.MUL.value
+DIV = _code.Opcode.DIV.value
+TRUE = _code.Opcode.TRUE.value
+FALSE = _code.Opcode.FALSE.value
+EQUAL = _code.Opcode.EQUAL.value
+NOT_EQUAL = _code.Opcode.NOT_EQUAL.value
+GREATER_THAN = _code.Opcode.GREATER_THAN.value
+MINUS = _code.Opcode.MINUS.value
+BANG = _code.Opcode.BANG.value
+JUMP_NOT_TRUTHY = _code.Opcode.JUMP_NOT_TRUTHY.value
+JUMP = _code.Opcode.JUMP.value
+NULL = _code.Opcode.NULL.value
+GET_GLOBAL = _code.Opcode.GET_GLOBAL.value
+SET_GLOBAL = _code.Opcode.SET_GLOBAL.value
+CALL = _code.Opcode.CALL.value
+RETURN_VALUE = _code.Opcode.RETURN_VALUE.value
+RETURN = _code.Opcode.RETURN.value
+GET_LOCAL = _code.Opcode.GET_LOCAL.value
+SET_LOCAL = _code.Opcode.SET_LOCAL.value
+CLOSURE = _code.Opcode.CLOSURE.value
+GET_FREE = _code.Opcode.GET_FREE.value
+CURRENT_CLOSURE = _code.Opcode.CURRENT_CLOSURE.value
+
+
+class Closure:
+    __slots__ = ('function', 'free')
+
+    def __init__(self, function: _compiler.CompiledFunction, free: list):
+        self.function = function
+        self.free = free
+
+    def __str__(self) -> str:
+        return f'Closure[{self.function}]'
+
+
+class Frame:
+    __slots__ = ('closure', 'ip', 'bp')
+
+    def __init__(self, closure: Closure, bp: int):
+        self.closure = closure
+        self.ip = 0
+        self.bp = bp
+
+
+def binary_error(operator: str, left, right) -> EvaluationError:
+    if type_name(left) != type_name(right):
+        return EvaluationError(f'type mismatch: {type_name(left)} {operator} {type_name(right)}')
+    return EvaluationError(f'unknown operator: {type_name(left)} {operator} {type_name(right)}')
+
+
+class VM:
+    def __init__(self, bytecode: _compiler.Bytecode, globals: list | None = None):
+        self.constants = bytecode.constants
+        self.globals = [None] * GLOBALS_SIZE if globals is None else globals
+        self.stack = []
+        main = Closure(_compiler.CompiledFunction(bytecode.instructions, name='main'), [])
+        self.frames = [Frame(main, 0)]
+        self.last_popped = None
+        self.instructions_executed = 0
+
+    def run(self):
+        constants = self.constants
+        globals = self.globals
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        frames = self.frames
+        frame = frames[-1]
+        closure = frame.closure
+        instructions = closure.function.instructions
+        ip = frame.ip
+        bp = frame.bp
+        last_popped = self.last_popped
+        count = 0
+        try:
+            while ip < len(instructions):
+                op = instructions[ip]
+                count += 1
+                if op == GET_LOCAL:
+                    push(stack[bp + instructions[ip + 1]])
+                    ip += 2
+                elif op == CONSTANT:
+                    push(constants[(instructions[ip + 1] << 8) | instructions[ip + 2]])
+                    ip += 3
+                elif op == GET_GLOBAL:
+                    push(globals[(instructions[ip + 1] << 8) | instructions[ip + 2]])
+                    ip += 3
+                elif op == ADD or op == SUB:
+                    right = pop()
+                    left = pop()
+                    if type(left) is not int or type(right) is not int:
+                        raise binary_error('+' if op == ADD else '-', left, right)
+                    push(left + right if op == ADD else left - right)
+                    ip += 1
+                elif op == JUMP_NOT_TRUTHY:
+                    condition = pop()
+                    if condition is None or condition is False:
+                        ip = (instructions[ip + 1] << 8) | instructions[ip + 2]
+                    else:
+                        ip += 3
+                elif op == GREATER_THAN:
+                    right = pop()
+                    left = pop()
+                    if type(left) is not int or type(right) is not int:
+                        raise binary_error('>', left, right)
+                    push(left > right)
+                    ip += 1
+                elif op == EQUAL or op == NOT_EQUAL:
+                    right = pop()
+                    left = pop()
+                    if type(left) is int and type(right) is int:
+                        equal = left == right
+                    else:
+                        equal = left is right
+                    push(equal if op == EQUAL else not equal)
+                    ip += 1
+                elif op == CALL:
+                    num_arguments = instructions[ip + 1]
+                    callee = stack[-1 - num_arguments]
+                    if type(callee) is not Closure:
+                        raise EvaluationError(f'not a function: {type_name(callee)}')
+                    function = callee.function
+                    if num_arguments != function.num_parameters:
+                        raise EvaluationError(
+                            f'wrong number of arguments: want={function.num_parameters}, got={num_arguments}'
+                        )
+                    if len(frames) >= MAX_FRAMES:
+                        raise EvaluationError('stack overflow')
+                    frame.ip = ip + 2
+                    bp = len(stack) - num_arguments
+                    stack.extend([None] * (function.num_locals - num_arguments))
+                    frame = Frame(callee, bp)
+                    frames.append(frame)
+                    closure = callee
+                    instructions = function.instructions
+                    ip = 0
+                elif op == RETURN_VALUE or op == RETURN:
+                    value = pop() if op == RETURN_VALUE else None
+                    if len(frames) == 1:
+                        # a return statement at the top level ends the program
+                        last_popped = value
+                        break
+                    frames.pop()
+                    del stack[bp - 1 :]
+                    push(value)
+                    frame = frames[-1]
+                    closure = frame.closure
+                    instructions = closure.function.instructions
+                    ip = frame.ip
+                    bp = frame.bp
+                elif op == POP:
+                    last_popped = pop()
+                    ip += 1
+                elif op == SET_LOCAL:
+                    stack[bp + instructions[ip + 1]] = pop()
+                    ip += 2
+                elif op == SET_GLOBAL:
+                    globals[(instructions[ip + 1] << 8) | instructions[ip + 2]] = pop()
+                    ip += 3
+                elif op == GET_FREE:
+                    push(closure.free[instructions[ip + 1]])
+                    ip += 2
+                elif op == MUL or op == DIV:
+                    right = pop()
+                    left = pop()
+                    if type(left) is not int or type(right) is not int:
+                        raise binary_error('*' if op == MUL else '/', left, right)
+                    push(left * right if op == MUL else _evaluator.divide(left, right))
+                    ip += 1
+                elif op == JUMP:
+                    ip = (instructions[ip + 1] << 8) | instructions[ip + 2]
+                elif op == TRUE:
+                    push(True)
+                    ip += 1
+                elif op == FALSE:
+                    push(False)
+                    ip += 1
+                elif op == NULL:
+                    push(None)
+                    ip += 1
+                elif op == BANG:
+                    value = pop()
+                    push(value is False or value is None)
+                    ip += 1
+                elif op == MINUS:
+                    value = pop()
+                    if type(value) is not int:
+                        raise EvaluationError(f'unknown operator: -{type_name(value)}')
+                    push(-value)
+                    ip += 1
+                elif op == CLOSURE:
+                    num_free = instructions[ip + 3]
+                    free = stack[len(stack) - num_free :]
+                    del stack[len(stack) - num_free :]
+                    push(Closure(constants[(instructions[ip + 1] << 8) | instructions[ip + 2]], free))
+                    ip += 4
+                elif op == CURRENT_CLOSURE:
+                    push(closure)
+                    ip += 1
+                else:
+                    raise EvaluationError(f'unknown opcode {op}')
+        finally:
+            frame.ip = ip
+            self.last_popped = last_popped
+            self.instructions_executed += count
+        return last_popped
+
+
+def run(bytecode: _compiler.Bytecode):
+    return VM(bytecode).run()
@@ -0,0 +1,754 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import typing
+
+import _abstract_syntax_tree as _ast
+import _ast_binary
+import _batch
+import _compiler
+import _evaluator
+import _generator
+import _incremental
+import _lexer
+import _optimizer
+import _parser
+import _token
+import _vm
+import server
+
+sample_source = """
+let five = 5;
+let ten = 10;
+
+let add = fn(x, y) {
+    x + y;
+};
+
+let result = add(five, ten);
+!-/*5;
+5 < 10 > 5;
+
+if (5 < 10) {
+    return true;
+} else {
+    return false;
+}
+
+10 == 10;
+10 != 9;
+"""
+
+# restricted to the constructs the parser handles today
+parser_sample_source = """
+let five = 5;
+let ten = 10;
+5 < 10 > 5;
+-a * b + c / (d - e) == !f;
+if (x < y) { x + y * 2; } else { x - y; }
+return a + b * c;
+10 == 10;
+10 != 9;
+"""
+
+
+def count_tokens(lexer: _lexer.Lexer) -> int:
+    count = 0
+    while lexer.next_token().token_type not in (_token.TokenType.EOF, _token.TokenType.ILLEGAL):
+        count += 1
+    return count
+
+
+def bench_lexer(source_code: str, engine: str, rounds: int = 5) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        tokens = count_tokens(_lexer.Lexer(source_code, engine=engine))
+        best = min(best, time.perf_counter() - start)
+    return tokens / best
+
+
+def run_lexer(args: argparse.Namespace):
+    source_code = sample_source * args.repeat
+    print(f'source size: {len(source_code)} chars')
+    for engine in _lexer.engines:
+        print(f'{engine:>8}: {bench_lexer(source_code, engine, args.rounds):>14,.0f} tokens/sec')
+
+
+def measure(func: typing.Callable) -> tuple[float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak
+
+
+def token_list(source_code: str) -> list[_token.Token]:
+    lexer = _lexer.Lexer(source_code, engine='regex')
+    tokens = [lexer.next_token()]
+    while tokens[-1].token_type not in (_token.TokenType.EOF, _token.TokenType.ILLEGAL):
+        tokens.append(lexer.next_token())
+    return tokens
+
+
+def run_tokens(args: argparse.Namespace):
+    source_code = sample_source * args.repeat
+    print(f'source size: {len(source_code)} chars')
+    for name, func in (
+        ('token list', lambda: token_list(source_code)),
+        ('tokenize', lambda: _lexer.Lexer(source_code).tokenize()),
+    ):
+        elapsed, peak = measure(func)
+        print(f'{name:>12}: {elapsed:>8.3f}s {peak / 2**20:>10.2f} MiB peak')
+
+
+def bench_parser(source_code: str, rounds: int = 5, **parser_options) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        _parser.Parser(_lexer.Lexer(source_code, engine='regex'), **parser_options).parse_program()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_parser(args: argparse.Namespace):
+    source_code = parser_sample_source * args.repeat
+    print(f'source size: {len(source_code)} chars')
+    for name, options in (('plain', {}), ('trace', {'trace': True}), ('profile', {'profile': True})):
+        print(f'{name:>8}: {bench_parser(source_code, args.rounds, **options):>8.3f}s')
+
+    parser = _parser.Parser(_lexer.Lexer(source_code, engine='regex'), profile=True)
+    parser.parse_program()
+    print(f'\n{"rule":<30}{"calls":>10}{"cumulative":>12}')
+    for stats in parser.tracer.report():
+        print(f'{stats.rule:<30}{stats.calls:>10}{stats.cumulative:>11.3f}s')
+
+
+def run_logging(args: argparse.Namespace):
+    source_code = parser_sample_source * args.repeat
+    print(f'source size: {len(source_code)} chars')
+    parser_log = logging.getLogger('_parser')
+    with open(os.devnull, 'w') as devnull:
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        parser_log.addHandler(handler)
+        level = parser_log.level
+        try:
+            for name, log_level, options in (
+                ('disabled', logging.INFO, {}),
+                ('sink', logging.INFO, {'sink': lambda event: None}),
+                ('enabled', logging.DEBUG, {}),
+            ):
+                parser_log.setLevel(log_level)
+                elapsed = bench_parser(source_code, args.rounds, **options)
+                print(f'{name:>10}: {elapsed:>8.3f}s {len(source_code) / elapsed:>14,.0f} chars/sec')
+        finally:
+            parser_log.setLevel(level)
+            parser_log.removeHandler(handler)
+
+
+small_programs = ('1 + 2 * 3;', '-a == !b;', 'let x = 5;', 'if (a < b) { a } else { b }', 'return x;', 'a * (b + c);')
+
+
+def run_small(args: argparse.Namespace):
+    sources = list(small_programs) * args.repeat
+    print(f'{len(sources)} programs')
+    for name, func in (
+        ('new parser', lambda: [_parser.Parser(source).parse_program() for source in sources]),
+        ('parse_many', lambda: _parser.Parser('').parse_many(sources)),
+    ):
+        best = float('inf')
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        print(f'{name:>12}: {best:>8.3f}s {len(sources) / best:>12,.0f} programs/sec')
+
+
+def measure_retained(func: typing.Callable) -> tuple[float, int, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, retained, peak
+
+
+def run_arena(args: argparse.Namespace):
+    source_code = parser_sample_source * args.repeat
+    print(f'source size: {len(source_code)} chars')
+    for name, func in (
+        ('objects', lambda: _parser.Parser(_lexer.Lexer(source_code, engine='regex')).parse_program()),
+        ('arena', lambda: _parser.Parser(_lexer.Lexer(source_code), arena=True).parse_program()),
+    ):
+        elapsed, retained, peak = measure_retained(func)
+        print(f'{name:>8}: {elapsed:>8.3f}s {retained / 2**20:>10.2f} MiB retained {peak / 2**20:>10.2f} MiB peak')
+
+
+def run_serialize(args: argparse.Namespace):
+    # long left leaning chains are the worst case for nested string concatenation
+    source_code = (' + '.join(['a * b'] * args.width) + ';\n') * args.repeat
+    program = _parser.Parser(source_code).parse_program()
+    with open(os.devnull, 'w') as devnull:
+        for name, func in (('to_string', program.to_string), ('write', lambda: _ast.write(program, devnull))):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            print(f'{name:>10}: {elapsed:>8.3f}s {len(source_code) / elapsed:>14,.0f} source chars/sec')
+
+
+def run_binary(args: argparse.Namespace):
+    source_code = parser_sample_source * args.repeat
+    data = _ast_binary.dumps(_parser.Parser(source_code).parse_program())
+    print(f'source size: {len(source_code)} chars, binary AST: {len(data)} bytes')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sample.monkey')
+        with open(path, 'w') as file:
+            file.write(source_code)
+        _ast_binary.load_file(path)
+        for name, func in (
+            ('parse', lambda: _parser.Parser(source_code).parse_program()),
+            ('loads', lambda: _ast_binary.loads(data)),
+            ('load_file', lambda: _ast_binary.load_file(path)),
+            ('hash check', lambda: _ast_binary.load_file(path, check='hash')),
+        ):
+            best = float('inf')
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                func()
+                best = min(best, time.perf_counter() - start)
+            print(f'{name:>10}: {best:>8.3f}s')
+
+
+def run_incremental(args: argparse.Namespace):
+    source_code = parser_sample_source * args.repeat
+    document = _incremental.Document(source_code)
+    print(f'source size: {len(source_code)} chars')
+    start = time.perf_counter()
+    _parser.Parser(source_code).parse_program()
+    print(f'{"full parse":>12}: {time.perf_counter() - start:>8.4f}s')
+    # type a statement into the middle of the source one character at a time
+    offset = source_code.index(';', len(source_code) // 2) + 1
+    typed = ' let typed = 10 * 20;'
+    invalid = 0
+    start = time.perf_counter()
+    for index, char in enumerate(typed):
+        try:
+            document.edit(offset + index, 0, char)
+        except SyntaxError:
+            invalid += 1
+    elapsed = time.perf_counter() - start
+    print(f'{"keystroke":>12}: {elapsed / len(typed):>8.4f}s mean over {len(typed)} edits ({invalid} invalid states)')
+
+
+def run_batch(args: argparse.Namespace):
+    source_code = parser_sample_source * args.repeat
+    print(f'{args.files} files and one large file of {len(source_code)} chars, {os.cpu_count()} cpus')
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index in range(args.files):
+            paths.append(os.path.join(directory, f'{index}.monkey'))
+            with open(paths[-1], 'w') as file:
+                file.write(source_code)
+
+        start = time.perf_counter()
+        for path in paths:
+            with open(path) as file:
+                _parser.Parser(file.read()).parse_program()
+        serial_files = time.perf_counter() - start
+        start = time.perf_counter()
+        _parser.Parser(source_code).parse_program()
+        serial_large = time.perf_counter() - start
+        print(f'{"workers":>8}{"files":>10}{"speedup":>9}{"large":>10}{"speedup":>9}')
+        print(f'{"serial":>8}{serial_files:>9.3f}s{1:>8.2f}x{serial_large:>9.3f}s{1:>8.2f}x')
+        for workers in args.workers:
+            start = time.perf_counter()
+            _batch.parse_files(paths, workers)
+            files = time.perf_counter() - start
+            start = time.perf_counter()
+            _batch.parse_large(source_code, workers=workers)
+            large = time.perf_counter() - start
+            print(f'{workers:>8}{files:>9.3f}s{serial_files / files:>8.2f}x{large:>9.3f}s{serial_large / large:>8.2f}x')
+
+
+# python recursion backs the closure evaluator, recursion depth stays well below the interpreter limit
+engine_programs = {
+    'fibonacci': 'let fib = fn(n) { if (n < 2) { return n; } fib(n - 1) + fib(n - 2) }; fib(20)',
+    'loop': """
+        let loop = fn(n, acc) { if (n == 0) { acc } else { loop(n - 1, acc + n * 2 - 1) } };
+        let repeat = fn(k, acc) { if (k == 0) { acc } else { repeat(k - 1, acc + loop(60, 0)) } };
+        let outer = fn(k, acc) { if (k == 0) { acc } else { outer(k - 1, acc + repeat(40, 0)) } };
+        outer(20, 0)
+    """,
+    'arithmetic': """
+        let poly = fn(x) { (x * x * x - 2 * x * x + 3 * x - 4) / (x + 1) + -x * (x - 7) };
+        let sum = fn(n, acc) { if (n == 0) { acc } else { sum(n - 1, acc + poly(n) - poly(n + 1)) } };
+        let repeat = fn(k, acc) { if (k == 0) { acc } else { repeat(k - 1, acc + sum(50, 0)) } };
+        repeat(50, 0)
+    """,
+}
+
+
+def run_engines(args: argparse.Namespace):
+    print(f'{"program":<12}{"closure":>10}{"vm":>10}{"vm instructions/sec":>22}')
+    for name, source_code in engine_programs.items():
+        program = _parser.Parser(source_code).parse_program()
+        closure_best = vm_best = float('inf')
+        for _ in range(args.rounds):
+            code = _evaluator.compile_program(program)
+            start = time.perf_counter()
+            closure_result = code(_evaluator.Environment())
+            closure_best = min(closure_best, time.perf_counter() - start)
+
+            vm = _vm.VM(_compiler.compile_program(program))
+            start = time.perf_counter()
+            vm_result = vm.run()
+            vm_best = min(vm_best, time.perf_counter() - start)
+            assert closure_result == vm_result
+        print(f'{name:<12}{closure_best:>9.3f}s{vm_best:>9.3f}s{vm.instructions_executed / vm_best:>22,.0f}')
+
+
+# generator options per shape, nesting is kept below the recursion limit of the parser
+suite_shapes = {
+    'mixed': {'depth': 4},
+    'nesting': {'depth': 60},
+    'let_chain': {},
+    'wide': {'width': 200},
+    'blocks': {'width': 100},
+}
+# higher is better for rates, lower is better for everything else
+suite_metrics = {
+    'lexer_tokens_per_sec': True,
+    'parser_nodes_per_sec': True,
+    'parser_peak_bytes': False,
+    'to_string_chars_per_sec': True,
+}
+
+
+def best_time(func: typing.Callable, rounds: int) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def suite_case(shape: str, size: int, seed: int, rounds: int) -> dict:
+    source_code = _generator.generate(size, shape, seed, **suite_shapes[shape])
+    # the regex engine, which is the one the parser uses for source strings
+    tokens = count_tokens(_lexer.Lexer(source_code, engine='regex'))
+    program = _parser.Parser(source_code).parse_program()
+    nodes = _optimizer.count_nodes(program)
+    _, peak = measure(lambda: _parser.Parser(source_code).parse_program())
+    return {
+        'shape': shape,
+        'size': size,
+        'chars': len(source_code),
+        'tokens': tokens,
+        'nodes': nodes,
+        'lexer_tokens_per_sec': tokens
+        / best_time(lambda: count_tokens(_lexer.Lexer(source_code, engine='regex')), rounds),
+        'parser_nodes_per_sec': nodes / best_time(lambda: _parser.Parser(source_code).parse_program(), rounds),
+        'parser_peak_bytes': peak,
+        'to_string_chars_per_sec': len(source_code) / best_time(program.to_string, rounds),
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    # metrics that got worse than the baseline by more than threshold, cases missing from the baseline are skipped
+    old = {(case['shape'], case['size']): case for case in baseline}
+    regressions = []
+    for case in results:
+        previous = old.get((case['shape'], case['size']))
+        if previous is None or previous['chars'] != case['chars']:
+            continue
+        for metric, higher_is_better in suite_metrics.items():
+            ratio = case[metric] / previous[metric]
+            if (ratio < 1 - threshold) if higher_is_better else (ratio > 1 + threshold):
+                regressions.append(
+                    f'{case["shape"]}/{case["size"]} {metric}: {previous[metric]:,.0f} -> {case[metric]:,.0f}'
+                )
+    return regressions
+
+
+def run_errors(args: argparse.Namespace):
+    # a linter without recovery parses again after every fix, each parse stops at the next error
+    statements = _generator.generate(args.size, 'mixed').splitlines()
+    for errors in args.errors:
+        broken = set(random.Random(errors).sample(range(len(statements)), errors))
+        sources = [
+            '\n'.join(
+                'let = 1;' if index in broken and index >= fixed else line for index, line in enumerate(statements)
+            )
+            for fixed in sorted(broken)
+        ]
+        start = time.perf_counter()
+        for source_code in sources:
+            try:
+                _parser.Parser(source_code).parse_program()
+            except SyntaxError:
+                pass
+        repeated = time.perf_counter() - start
+
+        parser = _parser.Parser(sources[0], recover=True)
+        start = time.perf_counter()
+        parser.parse_program()
+        recovering = time.perf_counter() - start
+        assert len(parser.errors) == errors
+        print(f'{errors:>5} errors: {repeated:>8.3f}s parse per error {recovering:>8.3f}s one recovering parse')
+
+
+def run_server(args: argparse.Namespace):
+    sources = [_generator.generate(args.size, 'mixed', seed) for seed in range(args.requests)]
+
+    async def client(address: tuple) -> None:
+        reader, writer = await asyncio.open_connection(*address)
+        for index, source_code in enumerate(sources):
+            response = await server.call(reader, writer, {'id': index, 'method': 'parse', 'source': source_code})
+            assert 'result' in response, response
+        writer.close()
+        await writer.wait_closed()
+
+    async def bench(executor: concurrent.futures.Executor | None) -> server.ServerStats:
+        instance = server.Server(executor, inline_size=0 if executor else len(sources[0]) + 1)
+        listener = await instance.start()
+        async with listener:
+            await asyncio.gather(*(client(listener.sockets[0].getsockname()[:2]) for _ in range(args.clients)))
+        return instance.stats()
+
+    print(f'{args.clients} clients x {args.requests} requests of {args.size} chars, {os.cpu_count()} cpus')
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+        for name, pool in (('inline', None), (f'{args.workers} workers', executor)):
+            stats = asyncio.run(bench(pool))
+            print(
+                f'{name:>10}: {stats.requests_per_sec:>8.1f} requests/sec, latency p50 {stats.latency_p50 * 1000:.1f}ms '
+                f'p99 {stats.latency_p99 * 1000:.1f}ms'
+            )
+
+
+def sliced_token_list(source_code: str) -> list[_token.Token]:
+    # tokens as they were before interning, every identifier literal is a slice of its own
+    tokens, position = [], 0
+    while True:
+        token_type, start, end = _lexer.scan(source_code, position)
+        tokens.append(_token.Token(source_code[start:end], token_type, start=start))
+        if token_type is _token.TokenType.EOF or token_type is _token.TokenType.ILLEGAL:
+            return tokens
+        position = end
+
+
+def interned_token_list(source_code: str) -> list[_token.Token]:
+    # the loop of sliced_token_list, identifiers share the spelling of the symbol table and carry its id
+    symbols = _token.SymbolTable()
+    tokens, position = [], 0
+    while True:
+        token_type, start, end = _lexer.scan(source_code, position)
+        if token_type is _token.TokenType.IDENT:
+            symbol = symbols.intern(source_code[start:end])
+            tokens.append(_token.Token(symbols.names[symbol], token_type, symbol, start))
+        else:
+            tokens.append(_token.Token(source_code[start:end], token_type, start=start))
+        if token_type is _token.TokenType.EOF or token_type is _token.TokenType.ILLEGAL:
+            return tokens
+        position = end
+
+
+def run_symbols(args: argparse.Namespace):
+    # both lists are built by the same scan loop with token starts, they only differ in the identifier literals.
+    # times are taken without tracemalloc, which slows down allocations a lot
+    source_code = _generator.generate(args.size, 'mixed')
+    symbols = _token.SymbolTable()
+    tokens = list(_lexer.Lexer(source_code, engine='regex', symbols=symbols))
+    identifiers = sum(token.token_type is _token.TokenType.IDENT for token in tokens)
+    print(f'source size: {len(source_code)} chars, {identifiers} identifiers, {len(symbols)} symbols')
+    cases = (('sliced', lambda: sliced_token_list(source_code)), ('interned', lambda: interned_token_list(source_code)))
+    for name, func in cases:
+        _, retained, _ = measure_retained(func)
+        print(f'{name:>10}: {best_time(func, args.rounds):>8.3f}s {retained / 2**20:>10.2f} MiB retained')
+
+
+def run_lazy(args: argparse.Namespace):
+    # a lazy parse only matches braces in blocks, what is left of the eager parse is paid once the blocks are read
+    source_code = _generator.generate(args.size, args.shape)
+    print(f'source size: {len(source_code)} chars')
+    cases = (
+        ('lexer', lambda: token_list(source_code)),
+        ('eager', lambda: _parser.Parser(source_code).parse_program()),
+        ('lazy', lambda: _parser.Parser(source_code, lazy=True).parse_program()),
+        ('lazy read', lambda: _parser.Parser(source_code, lazy=True).parse_program().to_string()),
+    )
+    for name, func in cases:
+        print(f'{name:>10}: {best_time(func, args.rounds):>8.3f}s')
+
+
+class MappingDispatchParser(_parser.Parser):
+    # _parse_expression with dict lookups keyed by token type, the way it was before the tables indexed by code
+    def _parse_expression(self, precendence: _parser.Precedence) -> _ast.Expression:
+        prefix = self.prefix_parse_functions.get(self._current_token.token_type)
+        if not prefix:
+            return None
+        left_exp = prefix(self)
+        while self._peek_token.token_type != _token.TokenType.SEMICOLON and precendence < _parser.precendence_map.get(
+            self._peek_token.token_type, _parser.Precedence.LOWEST
+        ):
+            infix = self.infix_parse_functions.get(self._peek_token.token_type)
+            if not infix:
+                return left_exp
+            self.next_token()
+            left_exp = infix(self, left_exp)
+        return left_exp
+
+
+def run_dispatch(args: argparse.Namespace):
+    # tokens are lexed up front, the parsers only differ in how _parse_expression finds rules and precedences
+    print(f'{"shape":<10}{"tokens":>10}{"mapping":>11}{"tables":>11}')
+    for shape in args.shapes:
+        tokens = token_list(_generator.generate(args.size, shape))
+        times = [
+            best_time(lambda: parser_type(_lexer.ReplayLexer(tokens)).parse_program(), args.rounds)
+            for parser_type in (MappingDispatchParser, _parser.Parser)
+        ]
+        print(f'{shape:<10}{len(tokens):>10}{times[0]:>10.3f}s{times[1]:>10.3f}s {times[0] / times[1]:>6.2f}x')
+
+
+def run_threads(args: argparse.Namespace):
+    # a parser per thread and one shared symbol table. with the GIL the threads take turns, free-threaded builds
+    # can run them side by side
+    sources = [_generator.generate(args.size, 'mixed', seed) for seed in range(args.sources)]
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f'{len(sources)} sources of {args.size} chars, {os.cpu_count()} cpus, gil {"enabled" if gil else "disabled"}')
+    symbols = _token.SymbolTable()
+    local = threading.local()
+
+    def parse(source_code: str) -> int:
+        parser = getattr(local, 'parser', None)
+        if parser is None:
+            parser = local.parser = _parser.Parser('', symbols=symbols)
+        return len(parser.reset(source_code).parse_program().statements)
+
+    single = None
+    for threads in args.threads:
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            elapsed = best_time(lambda: list(executor.map(parse, sources)), args.rounds)
+        single = single or elapsed
+        print(
+            f'{threads:>3} threads: {elapsed:>8.3f}s {len(sources) / elapsed:>8.1f} sources/sec {single / elapsed:>6.2f}x'
+        )
+
+
+def run_stream(args: argparse.Namespace):
+    # statements are dropped as they come, parse_program holds the whole program before the first one is seen
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'source.monkey')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(_generator.generate(args.size, 'mixed'))
+        print(f'source size: {os.path.getsize(path)} bytes')
+
+        def program() -> float:
+            # the first statement comes with all the others
+            with open(path, encoding='utf-8') as file:
+                start = time.perf_counter()
+                _parser.Parser(_lexer.StreamLexer(file)).parse_program()
+                return time.perf_counter() - start
+
+        def iterated() -> float:
+            with open(path, encoding='utf-8') as file:
+                start = time.perf_counter()
+                first = None
+                for _ in _parser.Parser(_lexer.StreamLexer(file)).iter_statements():
+                    first = first or time.perf_counter() - start
+                return first
+
+        for name, func in (('parse_program', program), ('iter_statements', iterated)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            first = func()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f'{name:>16}: {elapsed:>8.3f}s total {first * 1000:>9.3f}ms to the first statement '
+                f'{peak / 2**20:>8.2f} MiB peak'
+            )
+
+
+def run_suite(args: argparse.Namespace):
+    results = []
+    print(f'{"shape":<10}{"chars":>9}{"tokens/sec":>14}{"nodes/sec":>12}{"peak MiB":>10}{"to_string chars/sec":>21}')
+    for shape in args.shapes:
+        for size in args.sizes:
+            case = suite_case(shape, size, args.seed, args.rounds)
+            results.append(case)
+            print(
+                f'{shape:<10}{case["chars"]:>9}{case["lexer_tokens_per_sec"]:>14,.0f}{case["parser_nodes_per_sec"]:>12,.0f}'
+                f'{case["parser_peak_bytes"] / 2**20:>10.2f}{case["to_string_chars_per_sec"]:>21,.0f}'
+            )
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'rounds': args.rounds,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file)['results'], args.threshold)
+        for regression in regressions:
+            print(f'regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+def deep_sources(depth: int) -> dict[str, str]:
+    return {
+        'parens': '(' * depth + '1' + ')' * depth,
+        'prefix': '-!' * depth + 'x',
+        'right': '1 + (' * depth + '1' + ')' * depth,
+        'if': 'if (x) { ' * depth + '1' + ' }' * depth,
+        'fn': 'fn(x) { ' * depth + 'x' + ' }' * depth,
+        'chain': ' + '.join(['1'] * depth * 50),
+        'generated': _generator.generate(depth * 500, 'nesting', depth=min(depth, 60)),
+    }
+
+
+def run_deep(args: argparse.Namespace):
+    # the recursive parser gets a recursion limit that fits the input, the iterative one does not need it
+    limit = sys.getrecursionlimit()
+    print(f'{"input":<10}{"chars":>10}{"recursive":>11}{"iterative":>11}')
+    for name, source_code in deep_sources(args.depth).items():
+        source_code = (source_code + ';\n') * max(1, args.repeat * 1000 // len(source_code))
+        sys.setrecursionlimit(max(limit, args.depth * 10))
+        try:
+            recursive = bench_parser(source_code, args.rounds)
+        finally:
+            sys.setrecursionlimit(limit)
+        iterative = bench_parser(source_code, args.rounds, iterative=True)
+        print(f'{name:<10}{len(source_code):>10}{recursive:>10.3f}s{iterative:>10.3f}s {recursive / iterative:>6.2f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='monkey-py benchmarks')
+    parser.add_argument('--rounds', type=int, default=5)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    lexer_parser = subparsers.add_parser('lexer', help='tokens/sec per lexer engine')
+    lexer_parser.add_argument('--repeat', type=int, default=2000)
+    lexer_parser.set_defaults(run=run_lexer)
+
+    tokens_parser = subparsers.add_parser('tokens', help='Token objects vs the array backed TokenBuffer')
+    tokens_parser.add_argument('--repeat', type=int, default=2000)
+    tokens_parser.set_defaults(run=run_tokens)
+
+    parser_parser = subparsers.add_parser('parser', help='parse time with tracing off/on and a per rule profile')
+    parser_parser.add_argument('--repeat', type=int, default=1000)
+    parser_parser.set_defaults(run=run_parser)
+
+    logging_parser = subparsers.add_parser('logging', help='parse throughput with parse event logging disabled/enabled')
+    logging_parser.add_argument('--repeat', type=int, default=1000)
+    logging_parser.set_defaults(run=run_logging)
+
+    small_parser = subparsers.add_parser('small', help='many small programs, one parser each vs a reused parser')
+    small_parser.add_argument('--repeat', type=int, default=5000)
+    small_parser.set_defaults(run=run_small)
+
+    arena_parser = subparsers.add_parser('arena', help='memory of the object tree vs the arena backed AST')
+    arena_parser.add_argument('--repeat', type=int, default=1000)
+    arena_parser.set_defaults(run=run_arena)
+
+    serialize_parser = subparsers.add_parser('serialize', help='to_string and streaming write throughput')
+    serialize_parser.add_argument('--width', type=int, default=20000)
+    serialize_parser.add_argument('--repeat', type=int, default=5)
+    serialize_parser.set_defaults(run=run_serialize)
+
+    binary_parser = subparsers.add_parser('binary', help='cold parse vs loading the binary AST and its file cache')
+    binary_parser.add_argument('--repeat', type=int, default=1000)
+    binary_parser.set_defaults(run=run_binary)
+
+    incremental_parser = subparsers.add_parser('incremental', help='full parse vs incremental reparse per keystroke')
+    incremental_parser.add_argument('--repeat', type=int, default=1000)
+    incremental_parser.set_defaults(run=run_incremental)
+
+    batch_parser = subparsers.add_parser('batch', help='process pool parsing of many files and of one split file')
+    batch_parser.add_argument('--repeat', type=int, default=1000)
+    batch_parser.add_argument('--files', type=int, default=8)
+    batch_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    batch_parser.set_defaults(run=run_batch)
+
+    engines_parser = subparsers.add_parser('engines', help='closure evaluator vs bytecode vm on recursive programs')
+    engines_parser.set_defaults(run=run_engines)
+
+    deep_parser = subparsers.add_parser('deep', help='recursive vs iterative parsing of deeply nested expressions')
+    deep_parser.add_argument('--depth', type=int, default=200)
+    deep_parser.add_argument('--repeat', type=int, default=200)
+    deep_parser.set_defaults(run=run_deep)
+
+    errors_parser = subparsers.add_parser('errors', help='one recovering parse vs one parse per syntax error')
+    errors_parser.add_argument('--size', type=int, default=200_000)
+    errors_parser.add_argument('--errors', type=int, nargs='+', default=[1, 10, 100])
+    errors_parser.set_defaults(run=run_errors)
+
+    server_parser = subparsers.add_parser('server', help='parse requests from concurrent clients, inline vs on workers')
+    server_parser.add_argument('--clients', type=int, default=8)
+    server_parser.add_argument('--requests', type=int, default=20)
+    server_parser.add_argument('--size', type=int, default=20_000)
+    server_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    server_parser.set_defaults(run=run_server)
+
+    symbols_parser = subparsers.add_parser('symbols', help='memory of token lists with sliced vs interned identifiers')
+    symbols_parser.add_argument('--size', type=int, default=1_000_000)
+    symbols_parser.set_defaults(run=run_symbols)
+
+    lazy_parser = subparsers.add_parser('lazy', help='eager parse vs lazy blocks, before and after reading them')
+    lazy_parser.add_argument('--size', type=int, default=1_000_000)
+    lazy_parser.add_argument('--shape', choices=_generator.shapes, default='blocks')
+    lazy_parser.set_defaults(run=run_lazy)
+
+    dispatch_parser = subparsers.add_parser('dispatch', help='expression dispatch by mapping vs by token type code')
+    dispatch_parser.add_argument('--size', type=int, default=300_000)
+    dispatch_parser.add_argument('--shapes', nargs='+', choices=_generator.shapes, default=['wide', 'mixed'])
+    dispatch_parser.set_defaults(run=run_dispatch)
+
+    threads_parser = subparsers.add_parser('threads', help='parse throughput by number of threads')
+    threads_parser.add_argument('--size', type=int, default=20_000)
+    threads_parser.add_argument('--sources', type=int, default=64)
+    threads_parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    threads_parser.set_defaults(run=run_threads)
+
+    stream_parser = subparsers.add_parser('stream', help='parse_program vs iter_statements over a file')
+    stream_parser.add_argument('--size', type=int, default=2_000_000)
+    stream_parser.set_defaults(run=run_stream)
+
+    suite_parser = subparsers.add_parser('suite', help='generated programs of several shapes and sizes, as json')
+    suite_parser.add_argument('--shapes', nargs='+', choices=_generator.shapes, default=list(_generator.shapes))
+    suite_parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    suite_parser.add_argument('--seed', type=int, default=0)
+    suite_parser.add_argument('--output', help='write the results to this json file')
+    suite_parser.add_argument('--baseline', help='json file of an earlier run, exits with 1 on regressions')
+    suite_parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative change per metric')
+    suite_parser.set_defaults(run=run_suite)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
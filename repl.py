@@ -1,15 +1,64 @@
+import argparse
+import typing
+
+import _cache
+import _compiler
+import _evaluator
 import _lexer
+import _optimizer
 import _parser
+import _vm
+
+engines = ('closure', 'vm')
+
+
+def closure_engine() -> typing.Callable:
+    env = _evaluator.Environment()
+
+    def execute(program):
+        return _evaluator.compile_program(program)(env)
+
+    return execute
+
+
+def vm_engine() -> typing.Callable:
+    # symbols, constants and globals carry over from one line to the next
+    symbol_table = _compiler.SymbolTable()
+    constants = []
+    globals = [None] * _vm.GLOBALS_SIZE
+
+    def execute(program):
+        bytecode = _compiler.compile_program(program, _compiler.Compiler(symbol_table, constants))
+        return _vm.VM(bytecode, globals).run()
+
+    return execute
 
 
-def run():
+def run(engine: str = 'closure', optimize: bool = False, cache: _cache.ParseCache | None = None):
+    if engine not in engines:
+        raise ValueError(f'Unknown engine {engine!r}, expected one of {engines}')
+    execute = vm_engine() if engine == 'vm' else closure_engine()
     while True:
-        source = input('\n> ')
+        try:
+            source = input('\n> ')
+        except EOFError:
+            return
         # source = "==="
-        lexer = _lexer.Lexer(source)
-        parser = _parser.Parser(lexer)
-        program = parser.parse_program()
-        print(program.to_string())
+        try:
+            # repeated inputs come out of the cache when there is one
+            program = _parser.Parser(_lexer.Lexer(source)).parse_program() if cache is None else cache.parse(source)
+            if optimize:
+                program, _ = _optimizer.optimize(program)
+            result = execute(program)
+        except (SyntaxError, _compiler.CompilationError, _evaluator.EvaluationError) as error:
+            print(f'{type(error).__name__}: {error}')
+            continue
+        except RecursionError:
+            # nesting the parser can not follow, the engines report theirs as errors of the program
+            print('RecursionError: program nested too deeply')
+            continue
+        if result is not None:
+            print(_evaluator.inspect(result))
 
         # while True:
         #     token = lexer.next_token()
@@ -20,4 +69,9 @@ def run():
 
 
 if __name__ == '__main__':
-    run()
+    arguments = argparse.ArgumentParser(description='monkey repl')
+    arguments.add_argument('--engine', choices=engines, default='closure')
+    arguments.add_argument('--optimize', action='store_true', help='fold constant expressions before running')
+    arguments.add_argument('--cache-size', type=int, default=256, help='parsed inputs to keep, 0 disables the cache')
+    options = arguments.parse_args()
+    run(options.engine, options.optimize, _cache.ParseCache(options.cache_size) if options.cache_size else None)
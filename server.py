@@ -0,0 +1,209 @@
+# Parse server for local clients over TCP on localhost or a unix socket. The protocol is one json object per line in
+# both directions, a request {"id": 1, "method": "parse", "source": "let x = 1;"} is answered with
+# {"id": 1, "result": {...}} or {"id": 1, "error": {"type": "...", "message": "..."}}.
+#
+# Requests of one connection are answered in order and the next line is only read once the answer is written, so
+# a slow server pushes back on its clients through the socket buffers. Sources above inline_size are parsed on the
+# executor (a process pool from the command line), at most max_pending of them at a time. A request that takes
+# longer than timeout is answered with a TimeoutError, a parse already running in a worker is not interrupted and
+# keeps its slot until it is done.
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import dataclasses
+import json
+import os
+import time
+
+import _lexer
+import _parser
+
+methods = ('parse', 'stats')
+
+
+@dataclasses.dataclass(frozen=True)
+class ServerStats:
+    requests: int
+    errors: int
+    timeouts: int
+    pending: int
+    requests_per_sec: float
+    # seconds, over the most recent requests
+    latency_p50: float
+    latency_p99: float
+    latency_max: float
+
+
+def parse(source: str) -> dict:
+    # runs in the workers, syntax errors are part of the result. the program of a broken source is the partial tree
+    # the parser recovered, expressions that were cut short are written without their missing operands
+    parser = _parser.Parser(_lexer.Lexer(source, engine='regex'), recover=True)
+    program = parser.parse_program()
+    return {
+        'statements': len(program.statements),
+        'program': program.to_string(),
+        'errors': [
+            {
+                'message': error.message,
+                'token_type': error.token_type.name,
+                'offset': error.offset,
+                'line': error.line,
+                'column': error.column,
+            }
+            for error in parser.errors
+        ],
+    }
+
+
+class Server:
+    def __init__(
+        self,
+        executor: concurrent.futures.Executor | None = None,
+        max_pending: int = 64,
+        timeout: float = 10.0,
+        inline_size: int = 1 << 12,
+        max_line: int = 1 << 24,
+    ):
+        # without executor the default executor of the event loop (threads) is used
+        self.executor = executor
+        self.timeout = timeout
+        self.inline_size = inline_size
+        self.max_line = max_line
+        self._slots = asyncio.Semaphore(max_pending)
+        self._latencies: collections.deque[float] = collections.deque(maxlen=10000)
+        self._started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.pending = 0
+
+    def stats(self) -> ServerStats:
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction: float) -> float:
+            return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] if latencies else 0.0
+
+        return ServerStats(
+            requests=self.requests,
+            errors=self.errors,
+            timeouts=self.timeouts,
+            pending=self.pending,
+            requests_per_sec=self.requests / (time.perf_counter() - self._started),
+            latency_p50=percentile(0.5),
+            latency_p99=percentile(0.99),
+            latency_max=latencies[-1] if latencies else 0.0,
+        )
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0, path: str | None = None) -> asyncio.Server:
+        # a unix socket at path, otherwise TCP. port 0 picks a free port, see server.sockets
+        if path is not None:
+            return await asyncio.start_unix_server(self.serve_connection, path, limit=self.max_line)
+        return await asyncio.start_server(self.serve_connection, host, port, limit=self.max_line)
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # longer than max_line, the rest of the stream can not be framed any more
+                    error = ValueError(f'request longer than {self.max_line} bytes')
+                    await self._write(writer, error_response(None, error))
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    await self._write(writer, await self.handle(line))
+        except (ConnectionError, asyncio.CancelledError):
+            # a dropped client or a loop that shuts down, either way the connection is over
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, line: bytes) -> dict:
+        start = time.perf_counter()
+        self.requests += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request has to be a json object')
+            request_id = request.get('id')
+            response = {'id': request_id, 'result': await asyncio.wait_for(self._dispatch(request), self.timeout)}
+        except TimeoutError:
+            self.timeouts += 1
+            response = error_response(request_id, TimeoutError(f'request took longer than {self.timeout}s'))
+        except Exception as error:
+            self.errors += 1
+            response = error_response(request_id, error)
+        self._latencies.append(time.perf_counter() - start)
+        return response
+
+    async def _dispatch(self, request: dict):
+        method = request.get('method')
+        if method == 'stats':
+            return dataclasses.asdict(self.stats())
+        elif method == 'parse':
+            source = request.get('source')
+            if not isinstance(source, str):
+                raise ValueError('parse needs a source string')
+            if len(source) <= self.inline_size:
+                return parse(source)
+            self.pending += 1
+            try:
+                await self._slots.acquire()
+            except BaseException:
+                self.pending -= 1
+                raise
+            # a timeout cancels this request but not the parse, the slot is given back once the worker is done
+            future = asyncio.get_running_loop().run_in_executor(self.executor, parse, source)
+            future.add_done_callback(self._parse_done)
+            return await asyncio.shield(future)
+        raise ValueError(f'Unknown method {method!r}, expected one of {methods}')
+
+    def _parse_done(self, future: asyncio.Future):
+        self._slots.release()
+        self.pending -= 1
+        if not future.cancelled():
+            # retrieved here, the request that waited for it may have timed out
+            future.exception()
+
+    async def _write(self, writer: asyncio.StreamWriter, response: dict):
+        writer.write(json.dumps(response).encode('utf-8') + b'\n')
+        await writer.drain()
+
+
+def error_response(request_id, error: Exception) -> dict:
+    return {'id': request_id, 'error': {'type': type(error).__name__, 'message': str(error)}}
+
+
+async def call(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: dict) -> dict:
+    # client side of one request
+    writer.write(json.dumps(request).encode('utf-8') + b'\n')
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def serve(options: argparse.Namespace):
+    with concurrent.futures.ProcessPoolExecutor(options.workers) as executor:
+        server = Server(executor, options.max_pending, options.timeout)
+        listener = await server.start(options.host, options.port, options.unix)
+        print('serving on', ', '.join(str(socket.getsockname()) for socket in listener.sockets))
+        async with listener:
+            await listener.serve_forever()
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='monkey parse server')
+    arguments.add_argument('--host', default='127.0.0.1')
+    arguments.add_argument('--port', type=int, default=8765)
+    arguments.add_argument('--unix', help='listen on this unix socket path instead of TCP')
+    arguments.add_argument('--workers', type=int, default=os.cpu_count())
+    arguments.add_argument('--max-pending', type=int, default=64, help='parses running on the workers at a time')
+    arguments.add_argument('--timeout', type=float, default=10.0, help='seconds per request')
+    try:
+        asyncio.run(serve(arguments.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+import _abstract_syntax_tree as _ast
+import _ast_binary
+import _evaluator
+import _optimizer
+import _parser
+import _token
+
+source = """
+let add = fn(a, b) { a + b * -2 };
+let check = fn(x) { if (x > 1000) { return true; } else { !false } };
+add(1, add(2, 3)) == 42;
+check(add(400, 700));
+fn() {};
+return;
+"""
+
+
+def test_round_trip():
+    program = _parser.Parser(source).parse_program()
+    data = _ast_binary.dumps(program)
+    loaded = _ast_binary.loads(data)
+    assert loaded.to_string() == program.to_string()
+    assert _ast_binary.dumps(loaded) == data
+    assert _ast_binary.dumps(_parser.Parser(source, arena=True).parse_program()) == data
+    program = _parser.Parser('let add = fn(a, b) { a + b }; add(3, 4)').parse_program()
+    assert _evaluator.evaluate(_ast_binary.loads(_ast_binary.dumps(program))) == 7
+
+
+def test_loaded_nodes():
+    loaded = _ast_binary.loads(_ast_binary.dumps(_parser.Parser('let x = -5 * y; f(x, true)').parse_program()))
+    let, call = loaded.statements
+    assert isinstance(let.value, _ast.InfixExpression) and let.value.operator == '*'
+    assert let.value.left.right.value == 5 and let.value.right.value == 'y'
+    assert call.expression.arguments[1].value is True
+    # tokens are shared through the token table
+    assert call.expression.arguments[0].token is let.name.token
+
+    symbols = _token.SymbolTable()
+    loaded = _ast_binary.loads(_ast_binary.dumps(_parser.Parser('f(y)').parse_program()), symbols)
+    call = loaded.statements[0].expression
+    assert (call.function.symbol, call.arguments[0].symbol) == (symbols.ids['f'], symbols.ids['y'])
+
+
+def test_deep_nesting_and_folded_literals():
+    expression = _ast.IntegerLiteral(_token.Token('1', _token.TokenType.INT), 1)
+    for _ in range(5000):
+        expression = _ast.PrefixExpression(_token.Token('-', _token.TokenType.MINUS), '-', expression)
+    program = _ast.Program([_ast.ExpressionStatement(expression.token, expression)])
+    assert _ast_binary.loads(_ast_binary.dumps(program)).to_string() == program.to_string()
+
+    folded, _ = _optimizer.optimize(_parser.Parser('let z = 3 - 10 * 2;').parse_program())
+    assert _ast_binary.loads(_ast_binary.dumps(folded)).statements[0].value.value == -17
+
+
+def test_rejects_other_data():
+    data = _ast_binary.dumps(_parser.Parser('1 + 2').parse_program())
+    for bad in (b'', b'MKYA', b'XXXX' + data[4:], data[:4] + bytes([_ast_binary.VERSION + 1]) + data[5:], data[:-2]):
+        with pytest.raises(_ast_binary.FormatError):
+            _ast_binary.loads(bad)
+
+
+@pytest.mark.parametrize('check', _ast_binary.checks)
+@pytest.mark.parametrize('use_mmap', [True, False])
+def test_load_file_cache(tmp_path, check, use_mmap):
+    path = tmp_path / 'script.monkey'
+    path.write_text(source)
+    cache_path = _ast_binary.cache_path(path)
+    assert _ast_binary.load_file(path, check=check, use_mmap=use_mmap).to_string() == source_program().to_string()
+    with open(cache_path, 'rb') as file:
+        header = file.read(_ast_binary.cache_header.size)
+
+    # a valid cache is loaded instead of parsing the source
+    with open(cache_path, 'wb') as file:
+        file.write(header + _ast_binary.dumps(_parser.Parser('cached').parse_program()))
+    assert _ast_binary.load_file(path, check=check, use_mmap=use_mmap).to_string() == 'cached'
+
+    # a corrupt cache falls back to parsing and is rewritten
+    with open(cache_path, 'wb') as file:
+        file.write(header + b'MKYA')
+    assert _ast_binary.load_file(path, check=check, use_mmap=use_mmap).to_string() == source_program().to_string()
+    assert _ast_binary.load_file(path, check=check, use_mmap=use_mmap).to_string() == source_program().to_string()
+
+    # editing the source invalidates it
+    path.write_text('let y = 1;')
+    os.utime(path, ns=(1, 1))
+    assert _ast_binary.load_file(path, check=check, use_mmap=use_mmap, write=False).to_string() == 'let y = 1;'
+    with open(cache_path, 'rb') as file:
+        assert file.read(_ast_binary.cache_header.size) == header
+
+
+def source_program() -> _ast.Program:
+    return _parser.Parser(source).parse_program()
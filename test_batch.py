@@ -0,0 +1,69 @@
+import concurrent.futures
+
+import pytest
+
+import _ast_binary
+import _batch
+import _parser
+
+source = """let add = fn(a, b) { a + b; };
+let five = 5;
+if (five > 2) { add(five, 1); } else { 0 };
+return;;
+add(1, 2) * -3;
+"""
+
+
+def parse(source: str) -> bytes:
+    return _ast_binary.dumps(_parser.Parser(source).parse_program())
+
+
+def test_split_points():
+    assert _batch.split_points(source, 100) == [
+        source.index(';\nlet five') + 1,
+        source.index(';\nif') + 1,
+        source.index(';\nreturn') + 1,
+        # neither `;` of `return;;` ends a statement on its own
+        source.index('-3;') + 3,
+    ]
+    assert _batch.split_points(source, 2) == [source.index(';\nreturn') + 1]
+    assert _batch.split_points(source, 1) == []
+    # the lexer stops at ILLEGAL tokens, those sources are kept whole
+    assert _batch.split_points('a; b; c_d; e;', 4) == []
+    assert _batch.split_points('a; b; c; } d; e;', 10) == [2, 5, 8]
+
+
+@pytest.mark.parametrize('chunks', [2, 3, 5, 100])
+def test_split_parse_matches_whole_parse(chunks):
+    pieces = _batch.split_source(source, chunks)
+    assert ''.join(pieces) == source
+    merged = _batch.merge(_parser.Parser(piece).parse_program() for piece in pieces)
+    assert _ast_binary.dumps(merged) == parse(source)
+
+
+def test_parse_large():
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        program = _batch.parse_large(source * 20, executor, chunks=7)
+    assert _ast_binary.dumps(program) == parse(source * 20)
+
+
+def test_parse_files(tmp_path):
+    paths = []
+    for index, text in enumerate((source, 'let x = 1;', source * 30)):
+        paths.append(tmp_path / f'{index}.monkey')
+        paths[-1].write_text(text)
+    programs = _batch.parse_files(paths, workers=2, split_size=1000)
+    assert list(programs) == [str(path) for path in paths]
+    for path in paths:
+        assert _ast_binary.dumps(programs[str(path)]) == parse(path.read_text())
+
+    (tmp_path / 'bad.monkey').write_text('let = 1;')
+    with pytest.raises(SyntaxError) as error:
+        _batch.parse_files([tmp_path / 'bad.monkey'], workers=1)
+    assert error.value.__notes__ == [f'while parsing {tmp_path / "bad.monkey"}']
+
+    # errors in later pieces of a split file are reported at their place in the file
+    (tmp_path / 'bad.monkey').write_text(source * 30 + 'let x = 1; let = 2;\n')
+    with pytest.raises(SyntaxError) as error:
+        _batch.parse_files([tmp_path / 'bad.monkey'], workers=1, split_size=1000)
+    assert (error.value.lineno, error.value.offset) == (source.count('\n') * 30 + 1, 16)
@@ -0,0 +1,81 @@
+import concurrent.futures
+
+import pytest
+
+import _ast_arena
+import _cache
+import _parser
+
+
+def test_hits_return_the_same_program():
+    cache = _cache.ParseCache()
+    program = cache.parse('let x = 1 + 2;')
+    assert cache.parse('let x = 1 + 2;') is program
+    assert cache.parse('let x = 1 + 3;') is not program
+    assert program.to_string() == 'let x = (1 + 2);'
+    assert cache.stats() == _cache.CacheStats(hits=1, misses=2, evictions=0, entries=2, size_bytes=28)
+
+
+def test_least_recently_used_is_evicted():
+    cache = _cache.ParseCache(max_entries=2)
+    cache.parse('a')
+    cache.parse('b')
+    cache.parse('a')
+    cache.parse('c')
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.evictions == 1
+
+
+def test_byte_limit():
+    cache = _cache.ParseCache(max_bytes=10)
+    cache.parse('1 + 2')
+    cache.parse('3 + 4')
+    assert len(cache) == 2
+    cache.parse('5')
+    assert len(cache) == 2 and '1 + 2' not in cache
+    cache.parse('let big = 12345;')
+    assert 'let big = 12345;' not in cache
+    assert cache.stats().size_bytes == 6
+    with pytest.raises(ValueError):
+        _cache.ParseCache(max_entries=0)
+
+
+def test_syntax_errors_are_not_cached():
+    cache = _cache.ParseCache()
+    for _ in range(2):
+        with pytest.raises(SyntaxError):
+            cache.parse('let = 5;')
+    assert cache.misses == 2 and len(cache) == 0
+    assert cache.parse('5').to_string() == '5'
+
+
+def test_parse_many_with_cache():
+    cache = _cache.ParseCache()
+    parser = _parser.Parser('', arena=True)
+    programs = parser.parse_many(['x * y', 'fn(a) { a }', 'x * y'], cache=cache)
+    assert programs[0] is programs[2]
+    assert isinstance(programs[1], _ast_arena.ProgramView)
+    assert [program.to_string() for program in programs] == ['(x * y)', 'fn(a) a', '(x * y)']
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # programs of other parser configurations are not shared
+    plain = _parser.Parser('').parse_many(['x * y'], cache=cache)[0]
+    assert not isinstance(plain, _ast_arena.ProgramView) and plain.to_string() == '(x * y)'
+    assert parser.parse_many(['x * y'], cache=cache)[0] is programs[0]
+    assert _parser.Parser('', iterative=True).parse_many(['x * y'], cache=cache)[0] is plain
+    assert (cache.hits, cache.misses) == (3, 3)
+
+
+def test_cache_shared_by_threads():
+    cache = _cache.ParseCache(max_entries=8, parser=_parser.Parser('', iterative=True))
+    sources = [f'let x = {index} * y;' for index in range(16)]
+
+    def parse(index: int) -> str:
+        return cache.parse(sources[index % len(sources)]).to_string()
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(parse, range(400)))
+    assert results == [f'let x = ({index % 16} * y);' for index in range(400)]
+    stats = cache.stats()
+    assert stats.hits + stats.misses == 400 and stats.entries == len(cache) <= 8
+    assert cache.parser.options['iterative']
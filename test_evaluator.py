@@ -0,0 +1,108 @@
+import re
+
+import pytest
+
+import _evaluator
+import _lexer
+import _parser
+
+
+def evaluate(source: str, arena: bool = False):
+    program = _parser.Parser(_lexer.Lexer(source), arena=arena).parse_program()
+    return _evaluator.evaluate(program)
+
+
+def test_integer_expressions():
+    test_cases = [
+        ('5', 5),
+        ('-10', -10),
+        ('5 + 5 + 5 + 5 - 10', 10),
+        ('2 * (5 + 10)', 30),
+        ('-50 + 100 + -50', 0),
+        ('(5 + 10 * 2 + 15 / 3) * 2 + -10', 50),
+        ('-7 / 2', -3),
+    ]
+    for source, expected in test_cases:
+        assert evaluate(source) == expected
+
+
+def test_boolean_expressions():
+    test_cases = [
+        ('true', True),
+        ('1 < 2', True),
+        ('1 == 1', True),
+        ('1 != 1', False),
+        ('true == true', True),
+        ('true != false', True),
+        ('(1 < 2) == true', True),
+        ('1 == true', False),
+        ('!true', False),
+        ('!!5', True),
+    ]
+    for source, expected in test_cases:
+        assert evaluate(source) is expected
+
+
+def test_if_else_expressions():
+    test_cases = [
+        ('if (true) { 10 }', 10),
+        ('if (false) { 10 }', None),
+        ('if (1) { 10 }', 10),
+        ('if (1 > 2) { 10 } else { 20 }', 20),
+    ]
+    for source, expected in test_cases:
+        assert evaluate(source) == expected
+
+
+def test_return_statements():
+    test_cases = [
+        ('return 10; 9;', 10),
+        ('9; return 2 * 5; 9;', 10),
+        ('if (10 > 1) { if (10 > 1) { return 10; } return 1; }', 10),
+    ]
+    for source, expected in test_cases:
+        assert evaluate(source) == expected
+
+
+def test_deep_recursion_is_a_stack_overflow():
+    env = _evaluator.Environment()
+    _evaluator.evaluate(_parser.Parser('let f = fn(n) { if (n == 0) { 0 } else { f(n - 1) } };').parse_program(), env)
+    assert _evaluator.evaluate(_parser.Parser('f(10)').parse_program(), env) == 0
+    with pytest.raises(_evaluator.EvaluationError, match='stack overflow'):
+        _evaluator.evaluate(_parser.Parser('f(5000)').parse_program(), env)
+
+
+def test_functions_and_closures():
+    test_cases = [
+        ('let identity = fn(x) { x; }; identity(5);', 5),
+        ('let double = fn(x) { x * 2; }; double(5);', 10),
+        ('let add = fn(x, y) { x + y; }; add(5 + 5, add(5, 5));', 20),
+        ('fn(x) { x; }(5)', 5),
+        ('let adder = fn(x) { fn(y) { x + y } }; let addTwo = adder(2); addTwo(3);', 5),
+        ('let fib = fn(n) { if (n < 2) { return n; } fib(n - 1) + fib(n - 2) }; fib(15)', 610),
+    ]
+    for source, expected in test_cases:
+        assert evaluate(source) == expected
+        assert evaluate(source, arena=True) == expected
+
+
+def test_errors():
+    test_cases = [
+        ('5 + true;', 'type mismatch: INTEGER + BOOLEAN'),
+        ('-true', 'unknown operator: -BOOLEAN'),
+        ('if (10 > 1) { true + false; }', 'unknown operator: BOOLEAN + BOOLEAN'),
+        ('foobar', 'identifier not found: foobar'),
+        ('1 / 0', 'division by zero'),
+        ('let f = fn(x) { x }; f(1, 2)', 'wrong number of arguments: want=1, got=2'),
+        ('5(1)', 'not a function: INTEGER'),
+    ]
+    for source, message in test_cases:
+        with pytest.raises(_evaluator.EvaluationError, match=re.escape(message)):
+            evaluate(source)
+
+
+def test_compiled_program_is_reusable():
+    program = _parser.Parser('let x = x + 1; x').parse_program()
+    run = _evaluator.compile_program(program)
+    env = _evaluator.Environment({'x': 0})
+    assert [run(env) for _ in range(3)] == [1, 2, 3]
@@ -0,0 +1,23 @@
+import pytest
+
+import _generator
+import _parser
+
+
+@pytest.mark.parametrize('shape', _generator.shapes)
+def test_generated_programs_parse(shape):
+    source = _generator.generate(3000, shape, seed=7)
+    assert len(source) >= 3000
+    assert source == _generator.generate(3000, shape, seed=7)
+    assert source != _generator.generate(3000, shape, seed=8)
+    assert _parser.Parser(source).parse_program().statements
+
+
+def test_shapes():
+    assert _generator.generate(200, 'let_chain').startswith('let vb = 0 + ')
+    nested = _parser.Parser(_generator.generate(1, 'nesting', depth=30)).parse_program()
+    assert len(nested.statements) == 1
+    wide = _parser.Parser(_generator.generate(1, 'wide', width=40)).parse_program()
+    assert wide.statements[0].to_string().count('+') == 39
+    with pytest.raises(ValueError):
+        _generator.generate(100, 'flat')
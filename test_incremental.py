@@ -0,0 +1,97 @@
+import pytest
+
+import _incremental
+import _parser
+
+source = """let add = fn(a, b) { a + b };
+let max = fn(a, b) { if (a > b) { a } else { b } };
+add(1, 2);
+max(3, 4)
+"""
+
+
+def assert_matches_full_parse(document: _incremental.Document):
+    assert document.program.to_string() == _parser.Parser(document.source).parse_program().to_string()
+
+
+def test_edit_inside_a_statement():
+    document = _incremental.Document(source)
+    old = document.program.statements
+    document.edit(source.index('1, 2'), 1, '10')
+    assert_matches_full_parse(document)
+    statements = document.program.statements
+    assert statements[0] is old[0] and statements[1] is old[1] and statements[3] is old[3]
+    assert statements[2] is not old[2]
+    assert document.stats == _incremental.ReparseStats(
+        reused_statements=3, parsed_statements=1, reused_blocks=0, tokens_lexed=9
+    )
+
+
+def test_unchanged_blocks_are_reused():
+    document = _incremental.Document(source)
+    old_if = document.program.statements[1].value.body.statements[0].expression
+    # renaming the function parameters reparses the statement but keeps its body
+    document.edit(source.index('fn(a, b) { if'), len('fn(a, b)'), 'fn(a, b, c)')
+    assert_matches_full_parse(document)
+    new_max = document.program.statements[1].value
+    assert [parameter.value for parameter in new_max.parameters] == ['a', 'b', 'c']
+    assert new_max.body.statements[0].expression is old_if
+    assert document.stats.reused_blocks == 1
+    # reused and reparsed identifiers are interned in the same table
+    parameter, reused = new_max.parameters[0], old_if.condition.left
+    assert parameter.symbol == reused.symbol == document.symbols.ids['a']
+
+    # the nested blocks of a reused block can be reused by later edits
+    document.edit(document.source.index('if (a > b)') + 4, 1, 'c')
+    assert_matches_full_parse(document)
+    assert document.stats.reused_blocks == 2
+
+
+def test_edits_that_join_or_split_statements():
+    document = _incremental.Document(source)
+    # without the semicolon the next line continues the expression
+    document.edit(source.index('add(1, 2);') + len('add(1, 2)'), 1, ' +')
+    assert_matches_full_parse(document)
+    assert len(document.program.statements) == 3
+    document.edit(document.source.index(' +\nmax'), 2, ';')
+    assert_matches_full_parse(document)
+    assert len(document.program.statements) == 4
+    # appending to the last statement
+    document.edit(len(document.source) - 1, 0, ' * 2')
+    assert_matches_full_parse(document)
+    assert document.program.statements[-1].to_string() == '(max(3, 4) * 2)'
+
+
+def test_syntax_errors():
+    document = _incremental.Document(source)
+    with pytest.raises(SyntaxError):
+        document.edit(source.index('add ='), 3, '')
+    assert document.program is None
+    with pytest.raises(SyntaxError):
+        document.edit(document.source.index('add(1, 2)'), 0, 'let ')
+    with pytest.raises(SyntaxError):
+        document.edit(source.index('add ='), 0, 'sum')
+    assert document.program is None
+    # the statements around the broken ranges are kept for the edit that fixes them
+    document.edit(document.source.index('let add(1, 2)'), 4, '')
+    assert_matches_full_parse(document)
+    assert document.stats.reused_statements == 1 and not document.stats.full
+
+    with pytest.raises(ValueError):
+        document.edit(len(document.source), 1, '')
+
+
+def test_open_a_broken_buffer():
+    document = _incremental.Document('let = 1; add(1, 2)')
+    assert document.program is None and document.dirty == (0, len(document.source))
+    document.edit(len('let '), 0, 'x ')
+    assert_matches_full_parse(document)
+    assert document.dirty is None and document.program.to_string() == 'let x = 1;add(1, 2)'
+
+
+def test_reparse_work_follows_the_edit():
+    document = _incremental.Document(source * 500)
+    document.edit(len(document.source) // 2, 0, ' ')
+    assert_matches_full_parse(document)
+    assert document.stats.parsed_statements <= 2
+    assert document.stats.tokens_lexed < 50
@@ -1,3 +1,10 @@
+import concurrent.futures
+import io
+import mmap
+import sys
+
+import pytest
+
 import _lexer
 import _token
 
@@ -65,3 +72,162 @@ def test_function_calling():
 #             break
 #         # if token.token_type == TokenType.ILLEGAL:
 #         #     break
+
+
+def _token_stream(lexer: _lexer.Lexer) -> list[_token.Token]:
+    tokens = [lexer.next_token()]
+    while tokens[-1].token_type not in (_token.TokenType.EOF, _token.TokenType.ILLEGAL):
+        tokens.append(lexer.next_token())
+    return tokens
+
+
+def test_regex_engine_matches_char_engine():
+    source_codes = [
+        '',
+        '   \n\t',
+        '=+()},;',
+        '== != = ! !!= ===',
+        'let five = 5;\nlet add = fn(x, y) { x + y; };\nif (5 < 10) { return true; } else { return false; }',
+        'foo1bar 12abc',
+        'café ² 中文 x',
+        'a \x0c b',
+        'let x = 5 @ 3',
+    ]
+    for source_code in source_codes:
+        expected = _token_stream(_lexer.Lexer(source_code))
+        assert _token_stream(_lexer.Lexer(source_code, engine='regex')) == expected
+
+
+def test_regex_engine_illegal_does_not_advance():
+    lexer = _lexer.Lexer('@', engine='regex')
+    assert lexer.next_token() == _token.Token(literal='@', token_type=_token.TokenType.ILLEGAL)
+    assert lexer.next_token() == _token.Token(literal='@', token_type=_token.TokenType.ILLEGAL)
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        _lexer.Lexer('', engine='fast')
+
+
+def test_tokenize_matches_token_stream():
+    source_code = 'let add = fn(x, y) { x + y; }; add(1, 22) != !true @ 5'
+    buffer = _lexer.Lexer(source_code).tokenize()
+    assert list(buffer) == _token_stream(_lexer.Lexer(source_code))
+    assert buffer.token_type(1) == _token.TokenType.IDENT
+    assert buffer.literal(1) == 'add'
+    assert (buffer.starts[1], buffer.ends[1]) == (4, 7)
+
+
+def test_token_reader_repeats_last_token():
+    reader = _lexer.Lexer('x').tokenize().reader()
+    assert reader.next_token().literal == 'x'
+    assert reader.next_token().token_type == _token.TokenType.EOF
+    assert reader.next_token().token_type == _token.TokenType.EOF
+
+
+def test_lexer_iter():
+    assert [token.literal for token in _lexer.Lexer('let x = 5;')] == ['let', 'x', '=', '5', ';']
+    assert [token.token_type for token in _lexer.Lexer('x @ y', engine='regex')] == [
+        _token.TokenType.IDENT,
+        _token.TokenType.ILLEGAL,
+    ]
+
+
+def test_stream_tokens_across_chunk_boundaries():
+    source_code = 'let foobar = 12345;\n  if (a != b) { return a == b; }  !x => café ² 中文'
+    expected = list(_lexer.Lexer(source_code))
+    for chunk_size in range(1, 9):
+        assert list(_lexer.stream_tokens(io.StringIO(source_code), chunk_size)) == expected
+        assert list(_lexer.stream_tokens(io.BytesIO(source_code.encode()), chunk_size)) == expected
+
+
+def test_stream_lexer_from_mmap(tmp_path):
+    source_code = 'let add = fn(x, y) { x + y; };\n' * 100
+    path = tmp_path / 'source.monkey'
+    path.write_text(source_code)
+    with open(path, 'rb') as _file, mmap.mmap(_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        lexer = _lexer.StreamLexer(mapped, chunk_size=64)
+        assert list(lexer) == list(_lexer.Lexer(source_code))
+        assert lexer.next_token().token_type == _token.TokenType.EOF
+
+
+@pytest.mark.parametrize('engine', _lexer.engines)
+def test_identifiers_are_interned(engine):
+    source_code = 'let foo = fn(bar) { foo(bar) + bar }; baz'
+    lexer = _lexer.Lexer(source_code, engine=engine)
+    tokens = [token for token in lexer if token.token_type is _token.TokenType.IDENT]
+    assert [token.literal for token in tokens] == ['foo', 'bar', 'foo', 'bar', 'bar', 'baz']
+    assert tokens[0].literal is tokens[2].literal and tokens[1].literal is tokens[3].literal
+    foo, bar, baz = (lexer.symbols.ids[name] for name in ('foo', 'bar', 'baz'))
+    assert [token.symbol for token in tokens] == [foo, bar, foo, bar, bar, baz]
+    assert len(_token.keyword_map) <= foo < bar < baz == len(lexer.symbols) - 1
+    assert lexer.symbols.name(baz) == 'baz'
+    # keywords come out of the same table but carry no symbol, symbols do not take part in equality
+    assert _lexer.Lexer('fn', engine=engine).next_token() == _token.Token('fn', _token.TokenType.FUNCTION)
+    assert _lexer.Lexer('fn', engine=engine).next_token().symbol == _token.NO_SYMBOL
+    assert tokens[0] == _token.Token('foo', _token.TokenType.IDENT)
+
+
+def test_symbol_tables_can_be_shared():
+    symbols = _token.SymbolTable()
+    first = list(_lexer.Lexer('a + b', symbols=symbols))
+    second = list(_lexer.Lexer('b * c', engine='regex', symbols=symbols))
+    assert first[2].symbol == second[0].symbol
+    assert 'c' in symbols and 'd' not in symbols
+
+    buffer = _lexer.Lexer('x + y + x', symbols=symbols).tokenize()
+    assert [buffer.symbol(index) for index in range(len(buffer))] == [
+        symbols.ids['x'],
+        _token.NO_SYMBOL,
+        symbols.ids['y'],
+        _token.NO_SYMBOL,
+        symbols.ids['x'],
+        _token.NO_SYMBOL,
+    ]
+    assert list(_lexer.StreamLexer(io.StringIO('c'), symbols=symbols))[0].symbol == second[2].symbol
+
+
+def test_token_positions():
+    source_code = 'let foobar = 12;\n  if (a != b) {\n\n  return a == b; }  !x @'
+    expected = [token.start for token in _lexer.Lexer(source_code)]
+    assert expected[:6] == [0, 4, 11, 13, 15, 19]
+    assert [token.start for token in _lexer.Lexer(source_code, engine='regex')] == expected
+    assert [token.start for token in _lexer.Lexer(source_code).tokenize()] == expected
+    for chunk_size in (1, 3, 64):
+        lexer = _lexer.StreamLexer(io.StringIO(source_code), chunk_size)
+        assert [token.start for token in lexer] == expected
+        assert lexer.line_index.starts == _lexer.Lexer(source_code).line_index.starts
+
+    line_index = _lexer.Lexer(source_code).line_index
+    assert list(line_index.starts) == [0, 17, 33, 34]
+    assert [line_index.position(offset) for offset in (0, 16, 17, 19, 33, 36)] == [
+        (1, 1),
+        (1, 17),
+        (2, 1),
+        (2, 3),
+        (3, 1),
+        (4, 3),
+    ]
+
+
+def test_token_type_codes():
+    assert [token_type.code for token_type in _token.TokenType] == list(range(len(_token.TokenType)))
+    assert all(_token.token_type_codes[token_type] == token_type.code for token_type in _token.TokenType)
+    assert _token.TokenType('==') is _token.TokenType.EQ and _token.TokenType.EQ.name == 'EQ'
+    for code, token_type in enumerate(_lexer.ascii_operator_types):
+        assert token_type is _lexer.operator_map.get(chr(code))
+
+
+def test_symbol_table_shared_by_threads():
+    symbols = _token.SymbolTable()
+    names = [f'name{index}' for index in range(2000)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            ids = list(executor.map(lambda _: [symbols.intern(name) for name in names], range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+    assert len(symbols) == len(_token.keyword_map) + len(names)
+    assert all(result == ids[0] for result in ids)
+    assert [symbols.ids[name] for name in symbols.names] == list(range(len(symbols)))
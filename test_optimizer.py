@@ -0,0 +1,87 @@
+import pytest
+
+import _compiler
+import _evaluator
+import _optimizer
+import _parser
+import _vm
+
+
+def optimize(source: str, arena: bool = False):
+    return _optimizer.optimize(_parser.Parser(source, arena=arena).parse_program())
+
+
+def test_fold_constants():
+    test_cases = [
+        ('-5 * (2 + 3)', '-25', 5),
+        ('!!true', 'true', 2),
+        ('1 + 2 * 3 < 4', 'false', 6),
+        ('7 / -2', '-3', 3),
+        ('true == !false', 'true', 3),
+        ('1 == true', 'false', 2),
+        ('x + 2 * 3', '(x + 6)', 2),
+        ('let y = 10 - 4 * 2;', 'let y = 2;', 4),
+    ]
+    for source, expected, removed in test_cases:
+        program, count = optimize(source)
+        assert program.to_string() == expected
+        assert count == removed
+
+
+def test_fold_long_chains():
+    # the chains nest as deep as they are long, folding does not recurse
+    program, _ = optimize(' + '.join(['1'] * 5000))
+    assert program.to_string() == '5000'
+    program, _ = optimize('x' + ' - 1' * 5000 + ';')
+    assert program.to_string().count('(') == 5000
+
+
+def test_runtime_errors_are_not_folded():
+    for source in ('1 / 0', '-true', 'true + false', '5 * true'):
+        program, count = optimize(source)
+        assert count == 0
+        with pytest.raises(_evaluator.EvaluationError):
+            _evaluator.evaluate(program)
+
+
+def test_double_negation_of_booleans():
+    assert optimize('!!(x < y)')[0].to_string() == '(x < y)'
+    assert optimize('!!x')[0].to_string() == '(!(!x))'
+
+
+def test_known_if_conditions():
+    test_cases = [
+        ('if (1 < 2) { 10 } else { 20 }', '10'),
+        ('if (1 > 2) { 10 } else { x + 0 }', '(x + 0)'),
+        ('if (false) { 10 }', 'iffalse 10'),
+        ('if (x) { 1 + 1 }', 'ifx 2'),
+    ]
+    for source, expected in test_cases:
+        assert optimize(source)[0].to_string() == expected
+
+
+def test_optimized_programs_evaluate_the_same():
+    sources = [
+        'let f = fn(x) { if (2 > 1) { return x * (3 - 1); } 0 }; f(21)',
+        'if (true) { let a = 2 * 3; a + 1 }',
+        'let g = fn() { if (!false) { let b = 4; b * b } }; g() + 1',
+        'if (1 == 2) { 1 }',
+        'let h = fn(n) { if (true) { return -n; } }; h(-(8 / 2))',
+        '1; if (true) { }',
+        '2; if (1 < 2) { } else { 3 }',
+        'let k = fn() { 1; if (true) { } }; k()',
+        'let m = fn() { return 1; if (true) { } }; m()',
+    ]
+    for source in sources:
+        program = _parser.Parser(source).parse_program()
+        optimized, _ = _optimizer.optimize(program)
+        expected = _evaluator.evaluate(program)
+        assert _evaluator.evaluate(optimized) == expected
+        assert _vm.run(_compiler.compile_program(optimized)) == expected
+
+
+def test_optimize_arena_program():
+    program, count = optimize('let z = fn(a) { a * (2 + 2) }; z(1 - 2)', arena=True)
+    assert program.to_string() == 'let z = fn(a) (a * 4);z(-1)'
+    assert count == 4
+    assert _evaluator.evaluate(program) == -4
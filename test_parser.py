@@ -1,8 +1,16 @@
+import concurrent.futures
+import io
+import logging
+import sys
+
 import pytest
 
 import _abstract_syntax_tree as _ast
+import _ast_arena
+import _generator
 import _lexer
 import _parser
+import _token
 
 
 def test_let_statements():
@@ -31,6 +39,19 @@ def test_let_statement_errors():
             _ = parser.parse_program()
 
 
+def test_syntax_error_positions():
+    source = 'let x = 1;\nlet f = fn(a) {\n  a + 1;\n  let = 2 }'
+    lexers = [_lexer.Lexer(source), _lexer.Lexer(source).tokenize(), _lexer.StreamLexer(io.StringIO(source), 4)]
+    for lexer in lexers:
+        with pytest.raises(SyntaxError) as error:
+            _parser.Parser(lexer).parse_program()
+        assert (error.value.msg, error.value.lineno, error.value.offset) == ('Unexpected TokenType.IDENT', 4, 7)
+    program = _parser.Parser(source, lazy=True).parse_program()
+    with pytest.raises(SyntaxError) as error:
+        program.statements[1].value.body.statements
+    assert (error.value.lineno, error.value.offset) == (4, 7)
+
+
 def test_int_parsing():
     lexer = _lexer.Lexer('5;')
     parser = _parser.Parser(lexer)
@@ -131,6 +152,7 @@ def test_group_expression():
         assert program.statements
         assert program.to_string() == test_case[1]
 
+
 def test_if_else_expression():
     source = """
     let m = 0;
@@ -149,3 +171,333 @@ def test_if_else_expression():
     assert isinstance(statement.expression, _ast.IfExpression)
     assert statement.expression.condition.to_string() == '(x < y)'
 
+
+def test_parse_token_buffer():
+    source = 'let x = 5; 3 + 4 * 5 == 3 * 1 + 4 * 5; -a * !b'
+    expected = _parser.Parser(_lexer.Lexer(source)).parse_program()
+    program = _parser.Parser(_lexer.Lexer(source).tokenize()).parse_program()
+    assert program.to_string() == expected.to_string()
+    assert program.statements[0].name.value == 'x'
+
+
+def test_parse_stream_lexer():
+    source = 'let x = 5; 3 + 4 * 5 == 3 * 1 + 4 * 5; -a * !b'
+    expected = _parser.Parser(_lexer.Lexer(source)).parse_program()
+    program = _parser.Parser(_lexer.StreamLexer(io.StringIO(source), chunk_size=3)).parse_program()
+    assert program.to_string() == expected.to_string()
+
+
+def test_tracing_is_decided_per_parser():
+    source = 'let x = 5; -a * (b + c); if (x < y) { x } else { y }'
+    plain = _parser.Parser(_lexer.Lexer(source))
+    assert plain.tracer is None
+    assert '_parse_expression' not in vars(plain)
+
+    traced = _parser.Parser(_lexer.Lexer(source), trace=True)
+    assert traced.parse_program().to_string() == plain.parse_program().to_string()
+    assert traced.tracer.indent_level == 0
+    assert traced.tracer.report() == []
+
+
+def test_profile_report():
+    parser = _parser.Parser(_lexer.Lexer('1 + 2 * 3; -4;'), profile=True)
+    parser.parse_program()
+    stats = {stats.rule: stats for stats in parser.tracer.report()}
+    assert stats['_parse_statement'].calls == 2
+    assert stats['_parse_integer_literal'].calls == 4
+    assert stats['_parse_infix_expression'].calls == 2
+    assert stats['_parse_expression'].cumulative >= stats['_parse_infix_expression'].cumulative > 0
+
+
+def test_parse_event_sink():
+    events = []
+    _parser.Parser(_lexer.Lexer('a + 1;'), sink=events.append).parse_program()
+    assert events == [
+        _parser.ParseEvent('_parse_statement', _token.TokenType.IDENT, 0),
+        _parser.ParseEvent('_parse_expression_statement', _token.TokenType.IDENT, 0),
+        _parser.ParseEvent('_parse_expression', _token.TokenType.IDENT, 0),
+        _parser.ParseEvent('_parse_expression', _token.TokenType.PLUS, 1),
+        _parser.ParseEvent('_parse_expression', _token.TokenType.INT, 2),
+    ]
+
+
+def test_parse_events_logged_at_debug(caplog):
+    with caplog.at_level(logging.INFO, logger='_parser'):
+        parser = _parser.Parser(_lexer.Lexer('a;'))
+        parser.parse_program()
+    assert parser._sink is None
+    assert not caplog.records
+
+    with caplog.at_level(logging.DEBUG, logger='_parser'):
+        _parser.Parser(_lexer.Lexer('a;')).parse_program()
+    assert '(_parse_statement) - TokenType.IDENT at token 0' in caplog.messages
+
+
+def test_dispatch_tables_are_built_once():
+    first, second = _parser.Parser('a'), _parser.Parser('b')
+    assert first.prefix_parse_functions is second.prefix_parse_functions is _parser.Parser.prefix_parse_functions
+    assert first.infix_parse_functions is _parser.Parser.infix_parse_functions
+
+    # the tables indexed by token type code follow the mappings, for traced parsers as well
+    traced = _parser.Parser('c', trace=True)
+    for parser in (first, traced):
+        for token_type in _token.TokenType:
+            assert parser._prefix_table[token_type.code] is parser.prefix_parse_functions.get(token_type)
+            assert parser._infix_table[token_type.code] is parser.infix_parse_functions.get(token_type)
+    for token_type in _token.TokenType:
+        precedence = _parser.precendence_map.get(token_type, _parser.Precedence.LOWEST)
+        assert _parser.precedences[token_type.code] == precedence
+    assert traced._prefix_table is not first._prefix_table
+
+
+def test_subclass_rules_are_dispatched_to():
+    class DoublingParser(_parser.Parser):
+        def _parse_integer_literal(self) -> _ast.IntegerLiteral:
+            literal = super()._parse_integer_literal()
+            literal.value *= 2
+            return literal
+
+    assert DoublingParser.prefix_parse_functions is not _parser.Parser.prefix_parse_functions
+    for options in ({}, {'iterative': True}, {'trace': True}):
+        program = DoublingParser('5 + 1', **options).parse_program()
+        expression = program.statements[0].expression
+        assert (expression.left.value, expression.right.value) == (10, 2)
+
+
+def test_parser_reset_and_parse_many():
+    sources = ['1 + 2 * 3', '-a == !b', 'let x = 5;', 'if (a < b) { a } else { b }']
+    expected = [_parser.Parser(_lexer.Lexer(source)).parse_program().to_string() for source in sources]
+    parser = _parser.Parser('')
+    assert [program.to_string() for program in parser.parse_many(sources)] == expected
+    assert parser.reset(_lexer.Lexer('x * y')).parse_program().to_string() == '(x * y)'
+
+    traced = _parser.Parser('', profile=True)
+    assert [program.to_string() for program in traced.parse_many(sources)] == expected
+    assert {stats.rule: stats for stats in traced.tracer.report()}['_parse_statement'].calls == 6
+
+
+def test_arena_parsing_matches_object_tree():
+    source = """
+    let x = 5;
+    -a * b == !true;
+    if (x < y) { x + 1; return x; } else { y }
+    return 3 + 4 * 5;
+    """
+    expected = _parser.Parser(_lexer.Lexer(source)).parse_program()
+    parser = _parser.Parser(_lexer.Lexer(source), arena=True)
+    program = parser.parse_program()
+    assert isinstance(program, _ast.Program)
+    assert program.to_string() == expected.to_string()
+    assert len(program.statements) == len(expected.statements)
+    assert program.statements[0].name.value == 'x'
+    infix = program.statements[1].expression
+    assert isinstance(infix, _ast.InfixExpression)
+    assert (infix.operator, infix.right.operator, infix.right.right.value) == ('==', '!', True)
+    if_expression = program.statements[2].expression
+    assert [statement.token_literal() for statement in if_expression.consquence.statements] == ['x', 'return']
+    assert isinstance(if_expression.alternative, _ast.BlockStatement)
+    assert parser.arena.kinds[program.index] == _ast_arena.NodeKind.PROGRAM
+
+
+def test_arena_parsing_rejects_stream_lexer():
+    with pytest.raises(ValueError):
+        _parser.Parser(_lexer.StreamLexer(io.StringIO('a')), arena=True)
+
+
+def test_write_streams_program_text():
+    source = 'let x = 5; -a * b == !true; if (x < y) { x + 1 } else { y }'
+    program = _parser.Parser(_lexer.Lexer(source)).parse_program()
+    stream = io.StringIO()
+    _ast.write(program, stream, chunk_size=2)
+    assert stream.getvalue() == program.to_string() == 'let x = 5;(((-a) * b) == (!true))if(x < y) (x + 1)else y'
+
+
+def test_to_string_deep_nesting():
+    program = _parser.Parser(' + '.join(['1'] * 5000)).parse_program()
+    text = program.to_string()
+    assert text.startswith('(' * 4999 + '1 + 1)')
+    assert text.endswith(' + 1)')
+
+
+def test_function_literals_and_calls():
+    test_cases = [
+        ('fn(x, y) { x + y; }', 'fn(x, y) (x + y)'),
+        ('fn() { 1 }', 'fn() 1'),
+        ('add(1, 2 * 3, 4 + 5)', 'add(1, (2 * 3), (4 + 5))'),
+        ('a + add(b * c) + d', '((a + add((b * c))) + d)'),
+        ('let add = fn(x, y) { x + y }; add(1, 2);', 'let add = fn(x, y) (x + y);add(1, 2)'),
+        ('(a + b) * c', '((a + b) * c)'),
+    ]
+    for source, expected in test_cases:
+        assert _parser.Parser(_lexer.Lexer(source)).parse_program().to_string() == expected
+        assert _parser.Parser(_lexer.Lexer(source), arena=True).parse_program().to_string() == expected
+
+    function = _parser.Parser('fn(x, y) { x + y; }').parse_program().statements[0].expression
+    assert isinstance(function, _ast.FunctionLiteral)
+    assert [parameter.value for parameter in function.parameters] == ['x', 'y']
+
+
+def test_iterative_parsing_matches_recursive_parsing():
+    sources = [
+        'let x = 5; return -a * b == !true;',
+        'if (x < y) { x + 1; return x; } else { y }',
+        'let add = fn(x, y) { x + y }; add(1, add(2, 3) * 4)(5);',
+        'fn() {}; if (a) {}; a(b)(c) + (d)',
+    ]
+    for source in sources:
+        events, iterative_events = [], []
+        expected = _parser.Parser(source, sink=events.append).parse_program()
+        program = _parser.Parser(source, sink=iterative_events.append, iterative=True).parse_program()
+        assert program.to_string() == expected.to_string()
+        assert iterative_events == events
+        assert (
+            _parser.Parser(_lexer.Lexer(source), arena=True, iterative=True).parse_program().to_string()
+            == expected.to_string()
+        )
+
+    with pytest.raises(SyntaxError):
+        _parser.Parser('if (a { b }', iterative=True).parse_program()
+    with pytest.raises(ValueError):
+        _parser.Parser('a', trace=True, iterative=True)
+
+
+def test_iterative_parsing_deep_nesting():
+    depth = 5000
+    sources = ['(' * depth + '1' + ')' * depth, '-' * depth + '1', 'fn(x) { if (x) { ' * depth + 'x' + ' } }' * depth]
+    for source in sources:
+        with pytest.raises(RecursionError):
+            _parser.Parser(source).parse_program()
+        program = _parser.Parser(source, iterative=True).parse_program()
+        assert len(program.statements) == 1
+    assert program.to_string().startswith('fn(x) ifx fn(x) ifx ')
+
+
+@pytest.mark.parametrize('iterative', [False, True])
+def test_error_recovery(iterative):
+    source = """let x = 5;
+    let = 10;
+    let f = fn(a) { let = a; a + 1 };
+    if (x { 1 } else { 2 };
+    f(x);
+    }
+    """
+    with pytest.raises(SyntaxError):
+        _parser.Parser(source, iterative=iterative).parse_program()
+    parser = _parser.Parser(source, iterative=iterative, recover=True)
+    assert parser.parse_program().to_string() == 'let x = 5;let f = fn(a) (a + 1);f(x)'
+    assert parser.errors == [
+        _parser.ParseError('Unexpected TokenType.IDENT', _token.TokenType.ASSIGN, 6, 2, 9),
+        _parser.ParseError('Unexpected TokenType.IDENT', _token.TokenType.ASSIGN, 18, 3, 25),
+        _parser.ParseError('Unexpected TokenType.RPAREN', _token.TokenType.LBRACE, 29, 4, 11),
+        # the stray `}` can not start an expression
+        _parser.ParseError('No prefix parse function for TokenType.RBRACE', _token.TokenType.RBRACE, 42, 6, 5),
+    ]
+    # expressions that are cut short, the rest of the tree is kept
+    for source, token_type, column in [('let x = ;', 'SEMICOLON', 9), ('1 + ;', 'SEMICOLON', 5), ('-', 'EOF', 2)]:
+        parser.reset(source).parse_program()
+        errors = [(error.token_type.name, error.line, error.column) for error in parser.errors]
+        assert errors == [(token_type, 1, column)]
+    assert parser.reset('let y = 1;').parse_program().to_string() == 'let y = 1;'
+    assert parser.errors == []
+
+
+def test_identifier_symbols():
+    symbols = _token.SymbolTable()
+    parser = _parser.Parser('let x = y;', symbols=symbols)
+    statement = parser.parse_program().statements[0]
+    assert (statement.name.symbol, statement.value.symbol) == (symbols.ids['x'], symbols.ids['y'])
+    statement = parser.reset('y').parse_program().statements[0]
+    assert statement.expression.symbol == symbols.ids['y']
+
+    arena = _parser.Parser(_lexer.Lexer('fn(a) { a }', symbols=symbols), arena=True).parse_program()
+    function = arena.statements[0].expression
+    assert function.parameters[0].symbol == function.body.statements[0].expression.symbol == symbols.ids['a']
+
+
+@pytest.mark.parametrize('iterative', [False, True])
+def test_lazy_blocks(iterative):
+    source = 'let f = fn(a) { if (a) { a * 2 } else { let = 1; a } }; let g = f(1);'
+    parser = _parser.Parser(source, iterative=iterative, recover=True, lazy=True)
+    program = parser.parse_program()
+    assert [statement.name.value for statement in program.statements] == ['f', 'g']
+    body = program.statements[0].value.body
+    assert isinstance(body, _parser.LazyBlockStatement) and not body.parsed
+    assert parser.errors == []
+
+    # the body is parsed once, its nested blocks are lazy again
+    expression = body.statements[0].expression
+    assert body.parsed and body.statements[0].expression is expression
+    assert not expression.alternative.parsed
+    assert program.to_string() == 'let f = fn(a) ifa (a * 2)else a;let g = f(1);'
+    assert parser.errors == [_parser.ParseError('Unexpected TokenType.IDENT', _token.TokenType.ASSIGN, 20, 1, 45)]
+
+    program = _parser.Parser('fn() { let = 1 }', iterative=iterative, lazy=True).parse_program()
+    with pytest.raises(SyntaxError):
+        program.statements[0].expression.body.statements
+    with pytest.raises(ValueError):
+        _parser.Parser('a', arena=True, lazy=True)
+
+
+def test_deeply_nested_lazy_blocks():
+    # nested lazy blocks are ranges of the tokens recorded once, parsing all of them is linear in the depth
+    depth = 4000
+    source = 'if (x) {' * depth + 'let = 1' + '}' * depth + '; 2'
+    parser = _parser.Parser(source, iterative=True, recover=True, lazy=True)
+    assert parser.parse_program().to_string() == 'ifx ' * depth + '2'
+    assert parser.errors == [
+        _parser.ParseError('Unexpected TokenType.IDENT', _token.TokenType.ASSIGN, 5 * depth + 1, 1, 8 * depth + 5)
+    ]
+
+
+def test_parsing_from_many_threads():
+    # a parser per thread, shared are one symbol table and lazy programs whose blocks are read by all threads
+    sources = [_generator.generate(2000, shape, seed) for seed, shape in enumerate(_generator.shapes * 3)]
+    expected = [_parser.Parser(source).parse_program().to_string() for source in sources]
+    lazy_programs = [_parser.Parser(source, lazy=True).parse_program() for source in sources]
+    symbols = _token.SymbolTable()
+
+    options = [{}, {'trace': True}, {'profile': True}, {'iterative': True}]
+
+    def parse(index: int) -> tuple[str, str, int]:
+        source = sources[index % len(sources)]
+        parser = _parser.Parser(source, symbols=symbols, **options[index % len(options)])
+        program = parser.parse_program().to_string()
+        indent_level = parser.tracer.indent_level if parser.tracer else 0
+        return program, lazy_programs[index % len(sources)].to_string(), indent_level
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(parse, range(len(sources) * 4)))
+    finally:
+        sys.setswitchinterval(interval)
+    for index, result in enumerate(results):
+        assert result == (expected[index % len(sources)], expected[index % len(sources)], 0)
+    assert [symbols.ids[name] for name in symbols.names] == list(range(len(symbols)))
+
+
+def test_iter_statements():
+    class Pipe:
+        # hands out one line per read, like input that is still being written
+        def __init__(self, lines: list[str]):
+            self.lines = lines
+            self.reads = 0
+
+        def read(self, size: int) -> str:
+            self.reads += 1
+            return self.lines.pop(0) if self.lines else ''
+
+    pipe = Pipe(['let x = 1;\n', 'let y = x + 2;\n', 'fn(a) { a }(y)\n'])
+    statements = _parser.Parser(_lexer.StreamLexer(pipe)).iter_statements()
+    assert next(statements).to_string() == 'let x = 1;' and pipe.lines
+    assert [statement.to_string() for statement in statements] == ['let y = (x + 2);', 'fn(a) a(y)']
+
+    source = 'let = 1; a * b; if (a { b }; c'
+    parser = _parser.Parser(source, recover=True)
+    assert [statement.to_string() for statement in parser.iter_statements()] == ['(a * b)', 'c']
+    assert len(parser.errors) == 2
+    with pytest.raises(SyntaxError):
+        list(_parser.Parser(source).iter_statements())
+    with pytest.raises(ValueError):
+        _parser.Parser(source, arena=True).iter_statements()
@@ -0,0 +1,130 @@
+import asyncio
+import concurrent.futures
+import json
+import time
+
+import server
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+
+async def connect(instance: server.Server) -> tuple[asyncio.Server, asyncio.StreamReader, asyncio.StreamWriter]:
+    listener = await instance.start()
+    reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+    return listener, reader, writer
+
+
+def test_parse_requests():
+    async def scenario():
+        listener, reader, writer = await connect(server.Server(inline_size=10))
+        async with listener:
+            small = await server.call(reader, writer, {'id': 1, 'method': 'parse', 'source': 'let x = 1;'})
+            assert small == {'id': 1, 'result': {'statements': 1, 'program': 'let x = 1;', 'errors': []}}
+            # offloaded to the executor, syntax errors are part of the result
+            large = await server.call(reader, writer, {'id': 2, 'method': 'parse', 'source': 'let = 1; a + b * c;'})
+            assert large['result']['program'] == '(a + (b * c))'
+            assert large['result']['errors'] == [
+                {'message': 'Unexpected TokenType.IDENT', 'token_type': 'ASSIGN', 'offset': 1, 'line': 1, 'column': 5}
+            ]
+
+            unknown = await server.call(reader, writer, {'id': 3, 'method': 'evaluate'})
+            assert unknown['id'] == 3 and unknown['error']['type'] == 'ValueError'
+            writer.write(b'not json\n')
+            assert json.loads(await reader.readline())['error']['type'] == 'JSONDecodeError'
+
+            stats = (await server.call(reader, writer, {'id': 4, 'method': 'stats'}))['result']
+            assert (stats['requests'], stats['errors'], stats['timeouts'], stats['pending']) == (5, 2, 0, 0)
+            assert stats['latency_max'] >= stats['latency_p50'] > 0
+            writer.close()
+
+    run(scenario())
+
+
+def test_parse_malformed_sources():
+    async def scenario():
+        listener, reader, writer = await connect(server.Server())
+        async with listener:
+            test_cases = [
+                ('1 +', '(1 + )', ('EOF', 2, 1, 4)),
+                ('-', '(-)', ('EOF', 1, 1, 2)),
+                ('let x = 1 + ; let y = 2;', 'let x = (1 + );let y = 2;', ('SEMICOLON', 5, 1, 13)),
+            ]
+            keys = ('token_type', 'offset', 'line', 'column')
+            for request_id, (source, program, expected) in enumerate(test_cases):
+                request = {'id': request_id, 'method': 'parse', 'source': source}
+                result = (await server.call(reader, writer, request))['result']
+                assert result['program'] == program
+                assert [tuple(map(error.get, keys)) for error in result['errors']] == [expected]
+            writer.close()
+
+    run(scenario())
+
+
+def test_concurrent_clients():
+    async def scenario():
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            instance = server.Server(executor, max_pending=2, inline_size=0)
+            listener = await instance.start()
+            address = listener.sockets[0].getsockname()[:2]
+
+            async def client(index: int) -> list[str]:
+                reader, writer = await asyncio.open_connection(*address)
+                results = []
+                for request in range(5):
+                    source = f'{index} + {request}'
+                    response = await server.call(reader, writer, {'id': request, 'method': 'parse', 'source': source})
+                    results.append(response['result']['program'])
+                writer.close()
+                return results
+
+            async with listener:
+                results = await asyncio.gather(*(client(index) for index in range(8)))
+            assert results == [[f'({index} + {request})' for request in range(5)] for index in range(8)]
+            assert instance.stats().requests == 40
+
+    run(scenario())
+
+
+def test_timeouts(monkeypatch):
+    started = []
+
+    def slow_parse(source: str) -> dict:
+        started.append(source)
+        time.sleep(0.2)
+        return {}
+
+    monkeypatch.setattr(server, 'parse', slow_parse)
+
+    async def scenario():
+        instance = server.Server(max_pending=1, timeout=0.05, inline_size=0)
+        listener, reader, writer = await connect(instance)
+        async with listener:
+            response = await server.call(reader, writer, {'id': 1, 'method': 'parse', 'source': 'x'})
+            message = 'request took longer than 0.05s'
+            assert response == {'id': 1, 'error': {'type': 'TimeoutError', 'message': message}}
+            # the timed out parse keeps its slot, the next one waits for it and times out without being started
+            assert instance.pending == 1
+            response = await server.call(reader, writer, {'id': 2, 'method': 'parse', 'source': 'y'})
+            assert response['error']['type'] == 'TimeoutError' and started == ['x']
+            await asyncio.sleep(0.3)
+            assert instance.pending == 0
+            response = await server.call(reader, writer, {'id': 3, 'method': 'parse', 'source': 'z'})
+            assert response['error']['type'] == 'TimeoutError' and started == ['x', 'z']
+            writer.close()
+        await asyncio.sleep(0.3)
+
+    run(scenario())
+
+
+def test_unix_socket(tmp_path):
+    async def scenario():
+        listener = await server.Server().start(path=str(tmp_path / 'monkey.sock'))
+        async with listener:
+            reader, writer = await asyncio.open_unix_connection(str(tmp_path / 'monkey.sock'))
+            response = await server.call(reader, writer, {'id': 'a', 'method': 'parse', 'source': 'if (a) { b }'})
+            assert response['result']['program'] == 'ifa b'
+            writer.close()
+
+    run(scenario())
@@ -0,0 +1,121 @@
+import re
+
+import pytest
+
+import _code
+import _compiler
+import _evaluator
+import _parser
+import _vm
+
+
+def run(source: str):
+    return _vm.run(_compiler.compile_program(_parser.Parser(source).parse_program()))
+
+
+def test_make_and_disassemble():
+    instructions = _code.make(_code.Opcode.CONSTANT, 65534) + _code.make(_code.Opcode.CLOSURE, 1, 2)
+    assert instructions == bytes([_code.Opcode.CONSTANT, 255, 254, _code.Opcode.CLOSURE, 0, 1, 2])
+    assert _code.disassemble(instructions) == '0000 OpConstant 65534\n0003 OpClosure 1 2'
+
+
+def test_compile_conditionals():
+    bytecode = _compiler.compile_program(_parser.Parser('if (true) { 10 }; 3333;').parse_program())
+    expected = [
+        _code.make(_code.Opcode.TRUE),
+        _code.make(_code.Opcode.JUMP_NOT_TRUTHY, 10),
+        _code.make(_code.Opcode.CONSTANT, 0),
+        _code.make(_code.Opcode.JUMP, 11),
+        _code.make(_code.Opcode.NULL),
+        _code.make(_code.Opcode.POP),
+        _code.make(_code.Opcode.CONSTANT, 1),
+        _code.make(_code.Opcode.POP),
+    ]
+    assert bytecode.instructions == b''.join(expected)
+    assert bytecode.constants == [10, 3333]
+
+
+def test_compile_closures():
+    bytecode = _compiler.compile_program(_parser.Parser('fn(a) { fn(b) { a + b } }').parse_program())
+    inner, outer = bytecode.constants
+    assert _code.disassemble(inner.instructions) == '0000 OpGetFree 0\n0002 OpGetLocal 0\n0004 OpAdd\n0005 OpReturnValue'
+    assert _code.disassemble(outer.instructions) == '0000 OpGetLocal 0\n0002 OpClosure 0 1\n0006 OpReturnValue'
+
+
+def test_vm_matches_evaluator():
+    sources = [
+        '(5 + 10 * 2 + 15 / 3) * 2 + -10',
+        '-7 / 2',
+        '!!5',
+        '1 == true',
+        '(1 < 2) == true',
+        'if (1 > 2) { 10 } else { 20 }',
+        'if (false) { 10 }',
+        'if (true) {}',
+        'return 10; 9;',
+        'if (10 > 1) { if (10 > 1) { return 10; } return 1; }',
+        'let one = 1; let two = one + one; one + two',
+        'let a = 1; let a = a + 1; a',
+        'let f = fn(x) { let x = x + 1; x }; f(1)',
+        'fn() { let x = 1; }()',
+        'let add = fn(x, y) { x + y; }; add(5 + 5, add(5, 5));',
+        'let adder = fn(x) { fn(y) { x + y } }; let addTwo = adder(2); addTwo(3);',
+        'let a = fn(x) { fn(y) { fn(z) { x + y + z } } }; a(1)(2)(3)',
+        'let fib = fn(n) { if (n < 2) { return n; } fib(n - 1) + fib(n - 2) }; fib(15)',
+        'let wrapper = fn() { let countDown = fn(x) { if (x == 0) { 0 } else { countDown(x - 1) } }; countDown(5) }; wrapper()',
+    ]
+    for source in sources:
+        expected = _evaluator.evaluate(_parser.Parser(source).parse_program())
+        result = run(source)
+        assert (type(result), result) == (type(expected), expected), source
+
+
+def test_vm_errors():
+    test_cases = [
+        ('5 + true;', 'type mismatch: INTEGER + BOOLEAN'),
+        ('-true', 'unknown operator: -BOOLEAN'),
+        ('true * false', 'unknown operator: BOOLEAN * BOOLEAN'),
+        ('1 / 0', 'division by zero'),
+        ('let f = fn(x) { x }; f(1, 2)', 'wrong number of arguments: want=1, got=2'),
+        ('5(1)', 'not a function: INTEGER'),
+    ]
+    for source, message in test_cases:
+        with pytest.raises(_evaluator.EvaluationError, match=re.escape(message)):
+            run(source)
+    with pytest.raises(_compiler.CompilationError, match='undefined variable foobar'):
+        run('foobar')
+
+
+def test_constants_are_added_once():
+    bytecode = _compiler.compile_program(_parser.Parser('1 + 2; 2 * 1; fn() { 1 }; fn() { 1 }').parse_program())
+    assert bytecode.constants[:2] == [1, 2] and len(bytecode.constants) == 4
+
+
+def test_programs_too_large_for_the_operands():
+    with pytest.raises(ValueError, match='does not fit in 2 bytes'):
+        _code.make(_code.Opcode.CONSTANT, 1 << 16)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    names = [first + second + third for first in 'xyz' for second in letters for third in letters][:300]
+    test_cases = [
+        (';'.join(map(str, range(70000))), 'too many constants'),
+        ('if (true) {' + '1;' * 30000 + '}', 'OpJumpNotTruthy operand 120006'),
+        ('fn() {' + ''.join(f'let {name} = 1;' for name in names) + '}', 'OpSetLocal operand 256'),
+    ]
+    for source, message in test_cases:
+        with pytest.raises(_compiler.CompilationError, match=message):
+            run(source)
+
+
+def test_programs_nested_too_deeply():
+    # compiling recurses per level of the tree, a long chain is an error of the program for both engines
+    program = _parser.Parser(' + '.join(['1'] * 1000)).parse_program()
+    with pytest.raises(_compiler.CompilationError, match='nested too deeply'):
+        _compiler.compile_program(program)
+    with pytest.raises(_evaluator.EvaluationError, match='nested too deeply'):
+        _evaluator.evaluate(program)
+
+
+def test_vm_counts_instructions():
+    vm = _vm.VM(_compiler.compile_program(_parser.Parser('1 + 2').parse_program()))
+    assert vm.run() == 3
+    assert vm.instructions_executed == 4